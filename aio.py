@@ -0,0 +1,53 @@
+import asyncio
+
+from sqlalchemy.pool import NullPool
+
+# asyncio drivers for the databases the sync app supports.
+ASYNC_DRIVERS = {
+    'postgres': 'postgresql+asyncpg',
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def async_database_url(url):
+    '''Swap the driver of a DATABASE_URL for its asyncio equivalent.'''
+    scheme, separator, rest = url.partition('://')
+    dialect = scheme.split('+')[0]
+    if dialect not in ASYNC_DRIVERS:
+        raise ValueError('No asyncio driver known for %r' % scheme)
+    return ASYNC_DRIVERS[dialect] + separator + rest
+
+
+class AsyncDatabase(object):
+    '''Async engine for the async view variants.
+
+    Flask runs every async view in an event loop of its own and asyncpg
+    connections cannot move between loops, so connections are opened per
+    session rather than pooled.
+    '''
+
+    def __init__(self, url, **engine_options):
+        try:
+            from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+        except ImportError:
+            raise RuntimeError('ASYNC_VIEWS requires SQLAlchemy 1.4 or later')
+        self.engine = create_async_engine(url, poolclass=NullPool, **engine_options)
+        self._session_class = AsyncSession
+        # The engine's first connection sets up the dialect under an asyncio
+        # lock, which belongs to the loop it was first used in; views
+        # racing for it from their own loops fail. Connect once up front.
+        asyncio.run(self._connect())
+
+    async def _connect(self):
+        async with self.engine.connect():
+            pass
+
+    def session(self):
+        return self._session_class(self.engine, expire_on_commit=False)
+
+    async def run(self, fn, *args, **kwargs):
+        '''Run fn(session, *args, **kwargs), written against the sync ORM
+        session, on an async connection and return its result.'''
+        async with self.session() as session:
+            return await session.run_sync(fn, *args, **kwargs)
@@ -0,0 +1,163 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import hashlib
+from datetime import datetime
+from flask import Blueprint, request, Response, jsonify, abort
+from app import db, Venue, Artist, Show, venue_detail, artist_detail, show_data, show_page
+from app import search_by_name, typeahead, TYPEAHEAD_LIMIT, venues_near, NEAR_RADIUS_KM, NEAR_MAX_RADIUS_KM
+
+#----------------------------------------------------------------------------#
+# Controllers.
+#----------------------------------------------------------------------------#
+
+# JSON API; create_app() registers it.
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+#  API
+#  ----------------------------------------------------------------
+# JSON mirror of the venue, artist and show pages. Responses carry a
+# strong ETag computed from cheap, indexed version queries (row counts and
+# updated_at maxima) before any data is loaded, so a poll whose
+# If-None-Match still matches costs one small query and gets an empty 304.
+
+API_PAGE_SIZE = 100
+
+def table_version(*models):
+  # Changes on any insert, update or delete in the given tables.
+  columns = []
+  for model in models:
+    columns.append(db.session.query(db.func.count(model.id)).as_scalar())
+    columns.append(db.session.query(db.func.max(model.updated_at)).as_scalar())
+  return tuple(db.session.query(*columns).one())
+
+def detail_version(model, show_fk, related, related_fk, entity_id):
+  # The entity, its shows, the artists/venues they are with and which of
+  # the shows have started (the past/upcoming split moves with time).
+  shows = lambda column: db.session.query(column).select_from(Show).filter(show_fk == entity_id)
+  version = db.session.query(
+      model.updated_at,
+      shows(db.func.count(Show.id)).as_scalar(),
+      shows(db.func.max(Show.updated_at)).as_scalar(),
+      shows(db.func.count(Show.id)).filter(Show.start_time > datetime.now()).as_scalar(),
+      shows(db.func.max(related.updated_at)).join(related, related_fk == related.id).as_scalar(),
+    ).filter(model.id == entity_id).first()
+  if version is None:
+    abort(404)
+  return tuple(version)
+
+def conditional_json(version, build):
+  etag = hashlib.sha1(repr((version, request.full_path)).encode('utf-8')).hexdigest()
+  if request.if_none_match.contains(etag):
+    response = Response(status=304)
+  else:
+    response = jsonify(build())
+  response.set_etag(etag)
+  return response
+
+def api_limit():
+  return min(max(request.args.get('limit', API_PAGE_SIZE, type=int), 1), API_PAGE_SIZE)
+
+def api_value(value):
+  if isinstance(value, datetime):
+    return value.isoformat()
+  if isinstance(value, list):
+    return [api_value(item) for item in value]
+  if isinstance(value, dict):
+    return {key: api_value(item) for key, item in value.items()}
+  return value
+
+def api_item(item):
+  # ?fields=id,name limits the top-level fields returned.
+  fields = request.args.get('fields')
+  if fields:
+    fields = set(fields.split(','))
+    item = {key: value for key, value in item.items() if key in fields}
+  return api_value(item)
+
+def api_page(items, next_cursor):
+  return {"data": [api_item(item) for item in items], "next": next_cursor}
+
+def api_listing(model):
+  limit = api_limit()
+  rows = db.session.query(model.id, model.name, model.city, model.state, model.upcoming_shows_count) \
+    .filter(model.id > request.args.get('after', 0, type=int)) \
+    .order_by(model.id) \
+    .limit(limit + 1) \
+    .all()
+  next_cursor = str(rows[limit - 1].id) if len(rows) > limit else None
+  return api_page([{
+    "id": row.id,
+    "name": row.name,
+    "city": row.city,
+    "state": row.state,
+    "num_upcoming_shows": row.upcoming_shows_count,
+  } for row in rows[:limit]], next_cursor)
+
+def api_search(model):
+  results = search_by_name(model, request.args.get('search_term', ''),
+    limit=api_limit(), offset=max(request.args.get('offset', 0, type=int), 0))
+  return {"count": results["count"], "data": [api_item(item) for item in results["data"]]}
+
+def api_typeahead(model):
+  # ?q= is what has been typed so far; 10 matches unless ?limit= says otherwise.
+  limit = min(max(request.args.get('limit', TYPEAHEAD_LIMIT, type=int), 1), API_PAGE_SIZE)
+  return jsonify(data=[api_item(item) for item in typeahead(model, request.args.get('q', ''), limit)])
+
+@api_bp.route('/venues')
+def api_venues():
+  return conditional_json(table_version(Venue), lambda: api_listing(Venue))
+
+@api_bp.route('/venues/search')
+def api_search_venues():
+  return conditional_json(table_version(Venue), lambda: api_search(Venue))
+
+@api_bp.route('/venues/near')
+def api_venues_near():
+  # ?lat=&lng= with an optional radius in km, nearest first.
+  latitude = request.args.get('lat', type=float)
+  longitude = request.args.get('lng', type=float)
+  radius = request.args.get('radius', NEAR_RADIUS_KM, type=float)
+  if latitude is None or longitude is None or not -90 <= latitude <= 90 \
+      or not -180 <= longitude <= 180 or not 0 < radius <= NEAR_MAX_RADIUS_KM:
+    abort(400)
+  return conditional_json(table_version(Venue, Show, Artist),
+    lambda: {"data": [api_item(item) for item in venues_near(latitude, longitude, radius, api_limit())]})
+
+# Typeahead answers from memory on every keystroke, so it skips the ETag
+# version query.
+@api_bp.route('/venues/typeahead')
+def api_venue_typeahead():
+  return api_typeahead(Venue)
+
+@api_bp.route('/venues/<int:venue_id>')
+def api_venue(venue_id):
+  past_page = max(request.args.get('past_page', 1, type=int), 1)
+  return conditional_json(detail_version(Venue, Show.venue_id, Artist, Show.artist_id, venue_id),
+    lambda: api_item(venue_detail(venue_id, past_page)))
+
+@api_bp.route('/artists')
+def api_artists():
+  return conditional_json(table_version(Artist), lambda: api_listing(Artist))
+
+@api_bp.route('/artists/search')
+def api_search_artists():
+  return conditional_json(table_version(Artist), lambda: api_search(Artist))
+
+@api_bp.route('/artists/typeahead')
+def api_artist_typeahead():
+  return api_typeahead(Artist)
+
+@api_bp.route('/artists/<int:artist_id>')
+def api_artist(artist_id):
+  past_page = max(request.args.get('past_page', 1, type=int), 1)
+  return conditional_json(detail_version(Artist, Show.artist_id, Venue, Show.venue_id, artist_id),
+    lambda: api_item(artist_detail(artist_id, past_page)))
+
+@api_bp.route('/shows')
+def api_shows():
+  def build():
+    rows, next_cursor = show_page(request.args.get('after'), api_limit())
+    return api_page([show_data(row) for row in rows], next_cursor)
+  return conditional_json(table_version(Show, Venue, Artist), build)
@@ -2,33 +2,90 @@
 # Imports
 #----------------------------------------------------------------------------#
 
-import json
-import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
-from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
+import os
+import sys
+import functools
+import inspect
+import itertools
+import time
+import random
+import threading
+from datetime import datetime, timedelta
+from flask import Flask, Blueprint, render_template, request, Response, flash, url_for, abort, session, g, jsonify, has_request_context, has_app_context, current_app
+from flask import send_from_directory
+from flask import before_render_template, template_rendered
+from flask.cli import AppGroup
+from werkzeug.local import LocalProxy
+from werkzeug.security import safe_join
+from sqlalchemy import event, DDL
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import PrimaryKeyConstraint
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
 import logging
 from logging import Formatter, FileHandler
-from flask_wtf import Form
-from forms import *
+import config
+from search import NgramIndex, PrefixIndex
+from cache import make_cache, LRUCache, PageCache
+from sessions import make_session_interface
+from importer import batches
+from pool import TimedQueuePool, pool_stats
+from routing import RoutingSQLAlchemy, ReplicaRouter
+from metrics import RequestMetrics, RequestStats, gauge
+from fragments import FragmentCacheExtension
+from assets import BUNDLES, DIST, load_manifest
+from scheduling import find_conflicts, DEFAULT_SHOW_MINUTES
+from jobs import JobQueue, STATES as JOB_STATES
+import geo
+from jinja2 import FileSystemBytecodeCache
+# Imported where first used, to keep them out of a worker's start-up: forms
+# (WTForms and the choice lists), babel, pytz and dateutil (date
+# formatting), asyncio and aio (async views) and commands and bench.cli (see
+# LazyAppGroup), which bring seed and bench.
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db = SQLAlchemy(app)
+# Apps are built by create_app(), see "App factory". The objects below are
+# shared by every app built and find the current one through current_app.
 
-# TODO: connect to a local postgresql database
+db = RoutingSQLAlchemy()
+page_cache = LocalProxy(lambda: current_app.extensions['page_cache'])
+replica_router = LocalProxy(lambda: current_app.extensions['replica_router'])
+
+# Routes shared by every area; the areas' own are in venues, artists, shows
+# and api. create_app() registers them.
+main_bp = Blueprint('main', __name__)
 
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False, unique=True)
+
+# The primary keys lead with genre_id so "everything in genre X" is an index
+# range scan; the second index serves loading one venue's or artist's genres.
+venue_genres = db.Table('venue_genres',
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_venue_genres_venue_id', 'venue_id'),
+)
+
+artist_genres = db.Table('artist_genres',
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_artist_genres_artist_id', 'artist_id'),
+)
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_venue_state_city', 'state', 'city'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -38,472 +95,1603 @@ class Venue(db.Model):
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
+    website = db.Column(db.String(120))
+    seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
+    seeking_description = db.Column(db.String(500))
+    # Maintained by the Show events below, see "Show counters".
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+        default=datetime.utcnow, onupdate=datetime.utcnow, server_default=db.func.now())
+    # Looked up in Geocode when the venue moves, see "Geocoding". Nearby
+    # venues share geohash prefixes, so a radius search is a few range scans.
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12), index=True)
+
+    genres = db.relationship('Genre', secondary=venue_genres, order_by='Genre.name')
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_artist_state_city', 'state', 'city'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
+    website = db.Column(db.String(120))
+    seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
+    seeking_description = db.Column(db.String(500))
+    # Maintained by the Show events below, see "Show counters".
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+        default=datetime.utcnow, onupdate=datetime.utcnow, server_default=db.func.now())
+
+    genres = db.relationship('Genre', secondary=artist_genres, order_by='Genre.name')
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
-# TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
+def default_end_time(context):
+    return context.get_current_parameters()['start_time'] + timedelta(minutes=DEFAULT_SHOW_MINUTES)
+
+class Show(db.Model):
+    __tablename__ = 'Show'
+    __table_args__ = (
+        # Serve the per-venue / per-artist past and upcoming splits.
+        db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+        # Keyset pagination of the /shows listing.
+        db.Index('ix_show_start_time_id', 'start_time', 'id'),
+        db.CheckConstraint('end_time > start_time', name='ck_show_end_time'),
+        # On PostgreSQL the table is partitioned by month, see "Show archive".
+        {'postgresql_partition_by': 'RANGE (start_time)', 'info': {'partition_key': 'start_time'}},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    # Deleting a venue or artist deletes its shows, see "Deletion".
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    # Venue and artist are booked for [start_time, end_time).
+    end_time = db.Column(db.DateTime, nullable=False, default=default_end_time)
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+        default=datetime.utcnow, onupdate=datetime.utcnow, server_default=db.func.now())
+
+    venue = db.relationship('Venue', backref=db.backref('shows', lazy=True))
+    artist = db.relationship('Artist', backref=db.backref('shows', lazy=True))
+
+class ShowArchive(db.Model):
+    # Long past shows, moved out of Show by `flask shows archive`. Rows keep
+    # their Show ids; see "Show archive".
+    __tablename__ = 'ShowArchive'
+    __table_args__ = (
+        db.Index('ix_show_archive_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_show_archive_artist_id_start_time', 'artist_id', 'start_time'),
+        db.CheckConstraint('end_time > start_time', name='ck_show_end_time'),
+        {'postgresql_partition_by': 'RANGE (start_time)'},
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable=False)
+    start_time = db.Column(db.DateTime, primary_key=True)
+    end_time = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+    venue = db.relationship('Venue')
+    artist = db.relationship('Artist')
+
+class CounterRollover(db.Model):
+    # Single row recording when the show counters were last rolled over.
+    __tablename__ = 'CounterRollover'
+
+    id = db.Column(db.Integer, primary_key=True)
+    rolled_at = db.Column(db.DateTime, nullable=False)
+
+class Geocode(db.Model):
+    # Offline geocoding data loaded by `flask geocode load`: the coordinates
+    # of an address, or of the centre of a city when address is ''. Places
+    # are stored normalized, see normalize_place().
+    __tablename__ = 'Geocode'
+    __table_args__ = (
+        db.UniqueConstraint('state', 'city', 'address', name='uq_geocode_place'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    state = db.Column(db.String(120), nullable=False)
+    city = db.Column(db.String(120), nullable=False)
+    address = db.Column(db.String(120), nullable=False, default='')
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+
+class Job(db.Model):
+    # Background work queued by write requests and run by `flask worker`.
+    __tablename__ = 'Job'
+    __table_args__ = (
+        # Workers claim the oldest due job.
+        db.Index('ix_job_state_run_at', 'state', 'run_at'),
+        # At most one queued job per idempotency key.
+        db.Index('ux_job_queued_idempotency_key', 'idempotency_key', unique=True,
+            postgresql_where=db.text("state = 'queued'"), sqlite_where=db.text("state = 'queued'")),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    task = db.Column(db.String(120), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    idempotency_key = db.Column(db.String(200))
+    state = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+# Trigram indexes make ILIKE '%term%' name searches index scans on PostgreSQL.
+event.listen(db.metadata, 'before_create',
+  DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+for model in (Venue, Artist):
+  event.listen(model.__table__, 'after_create',
+    DDL('CREATE INDEX IF NOT EXISTS "ix_%(table)s_name_trgm" '
+        'ON "%(table)s" USING gin (name gin_trgm_ops)').execute_if(dialect='postgresql'))
+
+# On PostgreSQL the database itself refuses double bookings: a venue or an
+# artist cannot have two shows whose [start_time, end_time) ranges overlap.
+# Partitioned tables cannot have exclusion constraints, so each partition of
+# Show gets them (see show_exclusion_ddl()); shows in different months are
+# only checked by the app, see "Scheduling".
+event.listen(db.metadata, 'before_create',
+  DDL('CREATE EXTENSION IF NOT EXISTS btree_gist').execute_if(dialect='postgresql'))
+
+# A partitioned table's primary key must include its partition key.
+@compiles(PrimaryKeyConstraint, 'postgresql')
+def compile_partitioned_primary_key(constraint, compiler, **kw):
+  partition_key = constraint.table.info.get('partition_key')
+  if partition_key is None or partition_key in constraint.columns:
+    return compiler.visit_primary_key_constraint(constraint, **kw)
+  names = [column.name for column in constraint.columns] + [partition_key]
+  return 'PRIMARY KEY (%s)' % ', '.join(compiler.preparer.quote(name) for name in names)
+
+# SQLite only enforces foreign keys, and so cascades, when asked to.
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+  # Without sqlite3 imported (say on PostgreSQL) no connection can be one.
+  sqlite3 = sys.modules.get('sqlite3')
+  if sqlite3 is not None and isinstance(dbapi_connection, sqlite3.Connection):
+    dbapi_connection.execute('PRAGMA foreign_keys = ON')
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+# babel, pytz and dateutil are imported when the first date is formatted.
+
+@functools.lru_cache(maxsize=None)
+def babel_locale(identifier):
+  import babel
+  return babel.Locale.parse(identifier)
+
+@functools.lru_cache(maxsize=None)
+def babel_pattern(format):
+  import babel.dates
+  return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format))
+
+@functools.lru_cache(maxsize=None)
+def babel_timezone(name):
+  import pytz
+  return pytz.timezone(name)
+
+def timezone_names():
+  import pytz
+  return pytz.all_timezones_set
+
+@functools.lru_cache(maxsize=4096)
+def _format_datetime(value, format, locale, timezone):
+  if isinstance(value, str):
+    import dateutil.parser
+    value = dateutil.parser.parse(value)
+  if timezone is not None:
+    # Naive values are stored in UTC; show them in the reader's timezone.
+    if value.tzinfo is None:
+      value = babel_timezone('UTC').localize(value)
+    value = babel_timezone(timezone).normalize(value.astimezone(babel_timezone(timezone)))
+  return babel_pattern(format).apply(value, babel_locale(locale))
+
+def request_locale():
+  return g.get('locale') or current_app.config['BABEL_DEFAULT_LOCALE']
+
+def request_timezone():
+  return g.get('timezone') or current_app.config['BABEL_DEFAULT_TIMEZONE']
+
 def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
+  # Accepts datetimes as well as strings; patterns, locales and results
+  # are cached, so repeated show tiles cost a dictionary lookup.
+  return _format_datetime(value, format, request_locale(), request_timezone())
 
-app.jinja_env.filters['datetime'] = format_datetime
+def format_datetimes(values, format='medium'):
+  locale, timezone = request_locale(), request_timezone()
+  return [_format_datetime(value, format, locale, timezone) for value in values]
+
+def select_locale():
+  g.locale = request.accept_languages.best_match(current_app.config['LANGUAGES'])
+  timezone = request.cookies.get('timezone')
+  g.timezone = timezone if timezone and timezone in timezone_names() else None
+
+def init_filters(app):
+  app.jinja_env.filters['datetime'] = format_datetime
+  app.before_request(select_locale)
 
 #----------------------------------------------------------------------------#
-# Controllers.
+# Template caching.
 #----------------------------------------------------------------------------#
 
-@app.route('/')
-def index():
-  return render_template('pages/home.html')
+# Compiled templates are written to TEMPLATE_BYTECODE_CACHE_DIR so a new
+# worker loads bytecode instead of parsing the sources, and every template
+# is loaded at startup rather than on its first request.
+# Repeated tiles are wrapped in {% cache name, id, updated_at %} and
+# rendered once per version, locale and timezone.
 
+def precompile_templates(app):
+  for name in app.jinja_env.list_templates(extensions=['html']):
+    app.jinja_env.get_template(name)
 
-#  Venues
-#  ----------------------------------------------------------------
+def init_template_caching(app):
+  if app.config['TEMPLATE_BYTECODE_CACHE_DIR']:
+    os.makedirs(app.config['TEMPLATE_BYTECODE_CACHE_DIR'], exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['TEMPLATE_BYTECODE_CACHE_DIR'])
+
+  app.jinja_env.add_extension(FragmentCacheExtension)
+  if app.config['CACHE_TYPE'] != 'null':
+    app.jinja_env.fragment_cache = PageCache(LRUCache(
+      app.config['FRAGMENT_CACHE_THRESHOLD'], app.config['FRAGMENT_CACHE_TIMEOUT']))
+  app.jinja_env.fragment_cache_vary = lambda: (request_locale(), request_timezone())
+
+  if app.config['TEMPLATE_PRECOMPILE']:
+    precompile_templates(app)
+
+#----------------------------------------------------------------------------#
+# Static assets.
+#----------------------------------------------------------------------------#
+
+# `flask assets build` writes minified bundles and fingerprinted images to
+# static/dist along with a manifest. Templates link assets through
+# asset_urls()/asset_url(), which use the source files when there is no
+# build or ASSETS_USE_BUILD is off (as in development).
+
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+def asset_manifest():
+  # The build's manifest, or None when serving the sources.
+  return current_app.extensions['asset_manifest']
+
+def asset_urls(name):
+  # The bundle, or the files it is built from.
+  manifest = asset_manifest()
+  if manifest is not None:
+    return [url_for('main.dist_asset', filename=manifest[name])]
+  return [url_for('static', filename=source) for source in BUNDLES.get(name, [name])]
+
+def asset_url(name):
+  # None for variants that only exist in a build, such as WebP images.
+  manifest = asset_manifest()
+  if manifest is not None:
+    filename = manifest.get(name)
+    return url_for('main.dist_asset', filename=filename) if filename else None
+  if os.path.isfile(os.path.join(current_app.static_folder, name)):
+    return url_for('static', filename=name)
+  return None
+
+def init_assets(app):
+  manifest = load_manifest(app.static_folder) if app.config['ASSETS_USE_BUILD'] else None
+  if app.config['ASSETS_USE_BUILD'] and manifest is None:
+    app.logger.warning('No static asset build found, serving the sources; run `flask assets build`')
+  app.extensions['asset_manifest'] = manifest
+  app.jinja_env.globals.update(asset_url=asset_url, asset_urls=asset_urls)
 
-@app.route('/venues')
-def venues():
-  # TODO: replace with real venues data.
-  #       num_upcoming_shows should be aggregated based on number of upcoming shows per venue.
-  data=[{
-    "city": "San Francisco",
-    "state": "CA",
-    "venues": [{
-      "id": 1,
-      "name": "The Musical Hop",
-      "num_upcoming_shows": 0,
-    }, {
-      "id": 3,
-      "name": "Park Square Live Music & Coffee",
-      "num_upcoming_shows": 1,
-    }]
-  }, {
-    "city": "New York",
-    "state": "NY",
-    "venues": [{
-      "id": 2,
-      "name": "The Dueling Pianos Bar",
-      "num_upcoming_shows": 0,
-    }]
-  }]
-  return render_template('pages/venues.html', areas=data);
-
-@app.route('/venues/search', methods=['POST'])
-def search_venues():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-  # seach for Hop should return "The Musical Hop".
-  # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-  response={
-    "count": 1,
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+# Venue and Artist carry upcoming/past show counters so listings read them
+# instead of counting shows. A show counts as upcoming when it starts after
+# the last rollover; `flask counters rollover` (run periodically) moves the
+# shows that have started since into the past counts, and
+# `flask counters check --fix` rebuilds counters that have drifted.
+
+COUNTED_BY = ((Venue, 'venue_id'), (Artist, 'artist_id'))
+
+def counters_rolled_at(connection, lock=False):
+  query = db.select([CounterRollover.rolled_at]).where(CounterRollover.id == 1)
+  if lock:
+    query = query.with_for_update()
+  else:
+    # Wait for a running rollover so a new show is not counted against the
+    # checkpoint it is replacing.
+    query = query.with_for_update(read=True)
+  # No checkpoint only in databases created before start_counters().
+  return connection.execute(query).scalar() or datetime.min
+
+@event.listens_for(CounterRollover.__table__, 'after_create')
+def start_counters(target, connection, **kw):
+  # Shows that started before the database was created are past from the
+  # first insert on, without waiting for a rollover.
+  connection.execute(target.insert().values(id=1, rolled_at=datetime.now()))
+
+def apply_counter_deltas(connection, model, deltas):
+  # deltas: {(entity_id, column): change}, applied with one executemany.
+  if not deltas:
+    return
+  table = model.__table__
+  for column in ('upcoming_shows_count', 'past_shows_count'):
+    changes = [{"entity_id": id, "change": change}
+      for (id, name), change in deltas.items() if name == column and change]
+    if changes:
+      connection.execute(
+        table.update()
+          .where(table.c.id == db.bindparam('entity_id'))
+          .values({column: table.c[column] + db.bindparam('change')}),
+        changes)
+
+def count_shows(connection, shows, sign=1):
+  # Update the counters for shows (dicts or Show objects) inserted (sign=1)
+  # or deleted (sign=-1) in the current transaction.
+  rolled_at = counters_rolled_at(connection)
+  for model, key in COUNTED_BY:
+    deltas = {}
+    for show in shows:
+      if not isinstance(show, dict):
+        show = {"start_time": show.start_time, key: getattr(show, key)}
+      column = 'upcoming_shows_count' if show["start_time"] > rolled_at else 'past_shows_count'
+      counter = (int(show[key]), column)
+      deltas[counter] = deltas.get(counter, 0) + sign
+    apply_counter_deltas(connection, model, deltas)
+
+event.listen(Show, 'after_insert', lambda mapper, connection, show: count_shows(connection, [show]))
+event.listen(Show, 'after_delete', lambda mapper, connection, show: count_shows(connection, [show], -1))
+
+def rollover_counters(now=None):
+  now = now or datetime.now()
+  connection = db.session.connection()
+  rolled_at = counters_rolled_at(connection, lock=True)
+  moved = 0
+  for model, key in COUNTED_BY:
+    fk = Show.__table__.c[key]
+    deltas = {}
+    for id, count in connection.execute(
+        db.select([fk, db.func.count()])
+          .where(db.and_(Show.start_time > rolled_at, Show.start_time <= now))
+          .group_by(fk)):
+      deltas[(id, 'upcoming_shows_count')] = -count
+      deltas[(id, 'past_shows_count')] = count
+      moved += count
+    apply_counter_deltas(connection, model, deltas)
+  checkpoint = CounterRollover.query.get(1) or CounterRollover(id=1)
+  checkpoint.rolled_at = now
+  db.session.add(checkpoint)
+  db.session.commit()
+  return moved // len(COUNTED_BY)
+
+def counter_expressions(model, key, rolled_at):
+  def count(table, *conditions):
+    return db.select([db.func.count()]) \
+      .where(db.and_(table.c[key] == model.id, *conditions)) \
+      .correlate(model.__table__) \
+      .as_scalar()
+  show = Show.__table__
+  return {
+    "upcoming_shows_count": count(show, show.c.start_time > rolled_at),
+    # Archived shows are all past, see archive_shows().
+    "past_shows_count": count(show, show.c.start_time <= rolled_at) + count(ShowArchive.__table__),
+  }
+
+def check_counters(fix=False):
+  # Returns the number of venues and artists whose counters were wrong.
+  connection = db.session.connection()
+  rolled_at = counters_rolled_at(connection, lock=fix)
+  wrong = 0
+  for model, key in COUNTED_BY:
+    expected = counter_expressions(model, key, rolled_at)
+    drifted = db.or_(*[getattr(model, column) != expression for column, expression in expected.items()])
+    if fix:
+      wrong += connection.execute(model.__table__.update().where(drifted).values(expected)).rowcount
+    else:
+      wrong += connection.execute(db.select([db.func.count()]).select_from(model.__table__).where(drifted)).scalar()
+  db.session.commit()
+  return wrong
+
+#----------------------------------------------------------------------------#
+# Show archive.
+#----------------------------------------------------------------------------#
+
+# `flask shows archive` moves shows that started over SHOW_ARCHIVE_DAYS ago
+# from Show to ShowArchive, so Show only holds recent and future shows and
+# the upcoming-show queries and the /shows listing never read the history.
+# Past-show pages, past counts and deletions read both tables.
+#
+# On PostgreSQL both tables are partitioned by month of start_time. Show has
+# a partition per month up to SHOW_PARTITION_MONTHS_AHEAD ahead, kept ahead
+# by `flask shows partition`, and a default partition for shows outside
+# them. Archiving detaches whole months from Show and attaches them to
+# ShowArchive, without copying rows. On SQLite, and for a Show table created
+# before partitioning, the rows are copied and deleted instead.
+
+SHOW_COLUMNS = ('id', 'venue_id', 'artist_id', 'start_time', 'end_time', 'updated_at')
+
+def month_start(value):
+  return datetime(value.year, value.month, 1)
+
+def next_month(month):
+  return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+def is_partitioned(connection, table):
+  if connection.dialect.name != 'postgresql':
+    return False
+  return connection.execute(db.text(
+    'SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)'),
+    {"table": '"%s"' % table}).scalar() is not None
+
+def monthly_partitions(connection, table):
+  # {first day of month: partition name}; the default partition is left out.
+  rows = connection.execute(db.text(
+    'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+    'WHERE i.inhparent = to_regclass(:table)'), {"table": '"%s"' % table})
+  partitions = {}
+  for name, in rows:
+    try:
+      partitions[datetime.strptime(name.rpartition('_p')[2], '%Y_%m')] = name
+    except ValueError:
+      pass
+  return partitions
+
+def partition_bounds(month):
+  return "FROM ('%s') TO ('%s')" % (month.strftime('%Y-%m-%d'), next_month(month).strftime('%Y-%m-%d'))
+
+def show_exclusion_ddl(partition):
+  return [db.text('ALTER TABLE "{0}" ADD CONSTRAINT "ex_{0}_{1}_overlap" EXCLUDE USING gist '
+    '({1} WITH =, tsrange(start_time, end_time) WITH &&)'.format(partition, column))
+    for column in ('venue_id', 'artist_id')]
+
+def create_show_partition(connection, month):
+  # Shows of that month already in the default partition move to the new one.
+  name = 'Show_p%s' % month.strftime('%Y_%m')
+  connection.execute(db.text('CREATE TABLE "%s" (LIKE "Show" INCLUDING CONSTRAINTS)' % name))
+  connection.execute(db.text(
+    'WITH moved AS (DELETE FROM "Show_default" WHERE start_time >= :start AND start_time < :end '
+    'RETURNING *) INSERT INTO "%s" SELECT * FROM moved' % name),
+    {"start": month, "end": next_month(month)})
+  connection.execute(db.text('ALTER TABLE "Show" ATTACH PARTITION "%s" FOR VALUES %s'
+    % (name, partition_bounds(month))))
+  for statement in show_exclusion_ddl(name):
+    connection.execute(statement)
+  return name
+
+def create_show_partitions(connection, months_ahead):
+  # Partitions for this month to months_ahead ahead; returns the new ones.
+  existing = monthly_partitions(connection, 'Show')
+  existing.update(monthly_partitions(connection, 'ShowArchive'))
+  month = month_start(datetime.now())
+  created = []
+  for i in range(months_ahead + 1):
+    if month not in existing:
+      created.append(create_show_partition(connection, month))
+    month = next_month(month)
+  return created
+
+@event.listens_for(Show.__table__, 'after_create')
+def partition_show_table(target, connection, **kw):
+  if connection.dialect.name != 'postgresql':
+    return
+  connection.execute(db.text('CREATE TABLE "Show_default" PARTITION OF "Show" DEFAULT'))
+  for statement in show_exclusion_ddl('Show_default'):
+    connection.execute(statement)
+  create_show_partitions(connection, current_app.config['SHOW_PARTITION_MONTHS_AHEAD'])
+
+event.listen(ShowArchive.__table__, 'after_create',
+  DDL('CREATE TABLE "ShowArchive_default" PARTITION OF "ShowArchive" DEFAULT').execute_if(dialect='postgresql'))
+
+def archive_shows(before):
+  # Moves the shows that started before `before` to ShowArchive and
+  # commits; returns the number of shows moved. Shows not yet rolled over
+  # to the past counts stay, so counters never need adjusting.
+  connection = db.session.connection()
+  before = min(before, counters_rolled_at(connection, lock=True))
+  moved = 0
+  if is_partitioned(connection, 'Show'):
+    # Detaching takes a short exclusive lock on Show.
+    before = month_start(before)
+    for month, name in sorted(monthly_partitions(connection, 'Show').items()):
+      if next_month(month) > before:
+        break
+      moved += connection.execute(db.text('SELECT count(*) FROM "%s"' % name)).scalar()
+      connection.execute(db.text('ALTER TABLE "Show" DETACH PARTITION "%s"' % name))
+      connection.execute(db.text('ALTER TABLE "ShowArchive" ATTACH PARTITION "%s" FOR VALUES %s'
+        % (name, partition_bounds(month))))
+  # Whatever is left: every old show on SQLite, the default partition's on
+  # PostgreSQL.
+  show = Show.__table__
+  old = show.c.start_time < before
+  connection.execute(ShowArchive.__table__.insert().from_select(SHOW_COLUMNS,
+    db.select([show.c[name] for name in SHOW_COLUMNS]).where(old)))
+  moved += connection.execute(show.delete().where(old)).rowcount
+  db.session.commit()
+  return moved
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+# Rebuild the in-process indexes periodically to pick up rows written by
+# other processes, such as other workers or `flask import`.
+SEARCH_INDEX_MAX_AGE = 300
+
+# Name indexes used when the database has no trigram index (e.g. SQLite),
+# and word prefix indexes for typeahead. They are built on first use and
+# kept current by the mapper events below.
+search_indexes = {Venue: NgramIndex(), Artist: NgramIndex()}
+typeahead_indexes = {Venue: PrefixIndex(), Artist: PrefixIndex()}
+TYPEAHEAD_LIMIT = 10
+
+def name_indexes(model):
+  return [indexes[model] for indexes in (search_indexes, typeahead_indexes)]
+
+def _index_name(mapper, connection, target):
+  for index in name_indexes(type(target)):
+    if index.built:
+      index.add(target.id, target.name)
+
+def _unindex_name(mapper, connection, target):
+  for index in name_indexes(type(target)):
+    if index.built:
+      index.remove(target.id)
+
+for model in search_indexes:
+  event.listen(model, 'after_insert', _index_name)
+  event.listen(model, 'after_update', _index_name)
+  event.listen(model, 'after_delete', _unindex_name)
+
+_trigram_support = {}
+
+def has_trigram_index():
+  engine = db.engine
+  if engine.url not in _trigram_support:
+    _trigram_support[engine.url] = engine.dialect.name == 'postgresql' and bool(
+      db.session.execute(db.text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).scalar())
+  return _trigram_support[engine.url]
+
+rebuilding_indexes = set()
+rebuilding_lock = threading.Lock()
+
+def build_index(index, model):
+  index.build(db.session.query(model.id, model.name).yield_per(10000))
+
+def rebuild_index(app, index, model):
+  try:
+    with app.app_context():
+      build_index(index, model)
+  finally:
+    with rebuilding_lock:
+      rebuilding_indexes.discard(index)
+
+def fresh_index(index, model):
+  # Built on first use; once stale it is rebuilt in a background thread
+  # while the old one answers.
+  if not index.built:
+    build_index(index, model)
+  elif time.monotonic() - index.built_at > SEARCH_INDEX_MAX_AGE:
+    with rebuilding_lock:
+      start = index not in rebuilding_indexes
+      rebuilding_indexes.add(index)
+    if start:
+      threading.Thread(target=rebuild_index, daemon=True,
+        args=(current_app._get_current_object(), index, model)).start()
+  return index
+
+def search_paging(values):
+  # (limit, offset) asked for in request values, clamped to a valid page.
+  limit = min(max(values.get('limit', SEARCH_PAGE_SIZE, type=int), 1), SEARCH_MAX_PAGE_SIZE)
+  return limit, max(values.get('offset', 0, type=int), 0)
+
+def search_by_name(model, term, limit=SEARCH_PAGE_SIZE, offset=0):
+  term = term.strip()
+  query = db.session.query(model.id, model.name, model.upcoming_shows_count)
+
+  if has_trigram_index():
+    pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    matching = model.name.ilike(pattern, escape='\\')
+    count = db.session.query(db.func.count(model.id)).filter(matching).scalar()
+    ranking = (db.func.similarity(model.name, term).desc(), model.name)
+    rows = query.filter(matching).order_by(*ranking).limit(limit).offset(offset).all()
+  else:
+    count, ids = fresh_index(search_indexes[model], model).search_page(term, limit, offset)
+    position = {id: i for i, id in enumerate(ids)}
+    rows = sorted(query.filter(model.id.in_(ids)).all() if ids else [],
+                  key=lambda row: position[row.id])
+
+  return {
+    "count": count,
     "data": [{
-      "id": 2,
-      "name": "The Dueling Pianos Bar",
-      "num_upcoming_shows": 0,
-    }]
+      "id": row.id,
+      "name": row.name,
+      "num_upcoming_shows": row.upcoming_shows_count,
+    } for row in rows]
+  }
+
+def typeahead(model, term, limit=TYPEAHEAD_LIMIT):
+  # Names matching as typed so far, from the in-process index; the rows are
+  # then read by primary key.
+  ids = fresh_index(typeahead_indexes[model], model).search(term, limit)
+  if not ids:
+    return []
+  position = {id: i for i, id in enumerate(ids)}
+  rows = db.session.query(model.id, model.name, model.city, model.state).filter(model.id.in_(ids))
+  return sorted(({
+    "id": row.id,
+    "name": row.name,
+    "city": row.city,
+    "state": row.state,
+  } for row in rows), key=lambda item: position[item["id"]])
+
+#----------------------------------------------------------------------------#
+# Deletion.
+#----------------------------------------------------------------------------#
+
+# Venues and artists are deleted with a DELETE per chunk of ids; their shows
+# and genre links go with them through ON DELETE CASCADE without being
+# loaded. The counters of the other side of those shows are adjusted
+# beforehand from one grouped query per chunk.
+DELETE_CHUNK = 450
+
+def delete_entities(model, ids):
+  # Deletes and commits; returns the number of rows deleted.
+  key, other, other_key = ('venue_id', Artist, 'artist_id') if model is Venue \
+    else ('artist_id', Venue, 'venue_id')
+  connection = db.session.connection()
+  rolled_at = counters_rolled_at(connection)
+  deleted, other_ids = [], set()
+  for chunk in batches(sorted(set(ids)), DELETE_CHUNK):
+    deltas = {}
+    for table in (Show.__table__, ShowArchive.__table__):
+      upcoming = db.case([(table.c.start_time > rolled_at, 1)], else_=0)
+      for other_id, upcoming_count, count in connection.execute(
+          db.select([table.c[other_key], db.func.sum(upcoming), db.func.count()])
+            .where(table.c[key].in_(chunk))
+            .group_by(table.c[other_key])):
+        for column, change in (('upcoming_shows_count', -upcoming_count),
+                               ('past_shows_count', upcoming_count - count)):
+          deltas[(other_id, column)] = deltas.get((other_id, column), 0) + change
+        other_ids.add(other_id)
+    apply_counter_deltas(connection, other, deltas)
+    deleted += [id for id, in connection.execute(
+      db.select([model.id]).where(model.id.in_(chunk)))]
+    connection.execute(model.__table__.delete().where(model.id.in_(chunk)))
+
+  name, other_name = model.__name__.lower(), other.__name__.lower()
+  after_commit('invalidate_pages', keys=['venues', 'artists', 'shows']
+    + ['%s:%d' % (name, id) for id in deleted]
+    + ['%s:%d' % (other_name, id) for id in sorted(other_ids)])
+  db.session.commit()
+  for index in name_indexes(model):
+    if index.built:
+      for id in deleted:
+        index.remove(id)
+  return len(deleted)
+
+#----------------------------------------------------------------------------#
+# Scheduling.
+#----------------------------------------------------------------------------#
+
+# New shows are checked against the bookings of their venue and artist
+# before they are inserted. The booked shows that could overlap a batch are
+# read in a few queries and the checks run in memory; on PostgreSQL the
+# exclusion constraints above also catch concurrent double bookings.
+
+BOOKED_QUERY_CHUNK = 450
+BOOKED_COLUMNS = ('id', 'venue_id', 'artist_id', 'start_time', 'end_time')
+
+def booked_shows(shows):
+  # Shows of the batch's venues and artists within the batch's time span,
+  # one query per BOOKED_QUERY_CHUNK venues and artists.
+  start = min(show['start_time'] for show in shows)
+  end = max(show['end_time'] for show in shows)
+  venue_ids = batches(sorted({show['venue_id'] for show in shows}), BOOKED_QUERY_CHUNK)
+  artist_ids = batches(sorted({show['artist_id'] for show in shows}), BOOKED_QUERY_CHUNK)
+  columns = [getattr(Show.__table__.c, name) for name in BOOKED_COLUMNS]
+  booked = {}
+  for venue_chunk, artist_chunk in itertools.zip_longest(venue_ids, artist_ids, fillvalue=[]):
+    rows = db.session.execute(db.select(columns).where(db.and_(
+      db.or_(Show.venue_id.in_(venue_chunk), Show.artist_id.in_(artist_chunk)),
+      Show.start_time < end,
+      Show.end_time > start,
+    )))
+    booked.update((row[0], dict(zip(BOOKED_COLUMNS, row))) for row in rows)
+  return booked.values()
+
+def schedule_conflicts(shows):
+  # {position in shows: [conflict message, ...]}
+  if not shows:
+    return {}
+  return {
+    position: ['%s %d is already booked from %s to %s' % (
+      kind.capitalize(), other[kind + '_id'],
+      format_datetime(other['start_time']), format_datetime(other['end_time']))
+      for kind, other in found]
+    for position, found in find_conflicts(shows, booked_shows(shows)).items()
   }
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
-
-@app.route('/venues/<int:venue_id>')
-def show_venue(venue_id):
-  # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  data1={
-    "id": 1,
-    "name": "The Musical Hop",
-    "genres": ["Jazz", "Reggae", "Swing", "Classical", "Folk"],
-    "address": "1015 Folsom Street",
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "123-123-1234",
-    "website": "https://www.themusicalhop.com",
-    "facebook_link": "https://www.facebook.com/TheMusicalHop",
-    "seeking_talent": True,
-    "seeking_description": "We are on the lookout for a local artist to play every two weeks. Please call us.",
-    "image_link": "https://images.unsplash.com/photo-1543900694-133f37abaaa5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=400&q=60",
-    "past_shows": [{
-      "artist_id": 4,
-      "artist_name": "Guns N Petals",
-      "artist_image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80",
-      "start_time": "2019-05-21T21:30:00.000Z"
-    }],
-    "upcoming_shows": [],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 0,
+
+#----------------------------------------------------------------------------#
+# Geocoding.
+#----------------------------------------------------------------------------#
+
+NEAR_RADIUS_KM = 10
+NEAR_MAX_RADIUS_KM = 500
+NEAR_UPCOMING_SHOWS = 5
+GEOCODE_QUERY_CHUNK = 300
+
+def normalize_place(value):
+  return ' '.join((value or '').lower().split())
+
+def geocode(connection, city, state, address):
+  # The address's own coordinates when known, else its city's centre.
+  rows = connection.execute(db.select([Geocode.address, Geocode.latitude, Geocode.longitude])
+    .where(Geocode.state == normalize_place(state))
+    .where(Geocode.city == normalize_place(city))
+    .where(Geocode.address.in_([normalize_place(address), '']))).fetchall()
+  if not rows:
+    return None, None
+  row = min(rows, key=lambda row: row.address == '')
+  return row.latitude, row.longitude
+
+def geocode_places(connection, places):
+  # geocode() for many (city, state, address) places, with one query per
+  # GEOCODE_QUERY_CHUNK of them; returns {place: (latitude, longitude)}.
+  normalized = {place: tuple(normalize_place(part) for part in place) for place in set(places)}
+  known = {}
+  for chunk in batches(sorted(set(normalized.values())), GEOCODE_QUERY_CHUNK):
+    for row in connection.execute(db.select([Geocode.city, Geocode.state, Geocode.address,
+          Geocode.latitude, Geocode.longitude])
+        .where(Geocode.state.in_({state for city, state, address in chunk}))
+        .where(Geocode.city.in_({city for city, state, address in chunk}))
+        .where(Geocode.address.in_({address for city, state, address in chunk} | {''}))):
+      known[(row.city, row.state, row.address)] = (row.latitude, row.longitude)
+  return {place: known.get((city, state, address)) or known.get((city, state, '')) or (None, None)
+    for place, (city, state, address) in normalized.items()}
+
+def locate_venue_rows(connection, rows):
+  # Fills in the coordinates and geohash of venue column dicts for a bulk
+  # insert, which the mapper events below do not see.
+  unlocated = [row for row in rows if row.get("latitude") is None or row.get("longitude") is None]
+  coordinates = geocode_places(connection, [(row["city"], row["state"], row.get("address")) for row in unlocated])
+  for row in unlocated:
+    row["latitude"], row["longitude"] = coordinates[(row["city"], row["state"], row.get("address"))]
+  for row in rows:
+    if row["latitude"] is None or row["longitude"] is None:
+      row["geohash"] = None
+    else:
+      row["geohash"] = geo.encode(row["latitude"], row["longitude"])
+
+def locate_venue(mapper, connection, venue):
+  # Venues whose place changed are geocoded again, unless the change also
+  # set their coordinates (as bulk loads do, see locate_venue_rows()).
+  attrs = db.inspect(venue).attrs
+  moved = any(attrs[name].history.has_changes() for name in ('city', 'state', 'address'))
+  located = attrs.latitude.history.has_changes() or attrs.longitude.history.has_changes()
+  if not located and (moved or venue.latitude is None):
+    venue.latitude, venue.longitude = geocode(connection, venue.city, venue.state, venue.address)
+  if venue.latitude is None or venue.longitude is None:
+    venue.geohash = None
+  else:
+    venue.geohash = geo.encode(venue.latitude, venue.longitude)
+
+event.listen(Venue, 'before_insert', locate_venue)
+event.listen(Venue, 'before_update', locate_venue)
+
+def venues_near(latitude, longitude, radius_km, limit):
+  # Candidates come from the geohash cells covering the circle (index range
+  # scans) and its bounding box; exact distances are computed here.
+  south, west, north, east = geo.bounding_box(latitude, longitude, radius_km)
+  cells = [Venue.geohash >= low if high is None else db.and_(Venue.geohash >= low, Venue.geohash < high)
+    for low, high in geo.covering_ranges(latitude, longitude, radius_km)]
+  query = db.session.query(Venue.id, Venue.name, Venue.city, Venue.state, Venue.address,
+      Venue.latitude, Venue.longitude, Venue.upcoming_shows_count) \
+    .filter(db.or_(*cells)) \
+    .filter(Venue.latitude.between(south, north))
+  if west >= -180 and east <= 180:
+    query = query.filter(Venue.longitude.between(west, east))
+  nearby = []
+  for row in query:
+    distance = geo.distance_km(latitude, longitude, row.latitude, row.longitude)
+    if distance <= radius_km:
+      nearby.append((distance, row.id, row))
+  nearby.sort()
+  nearby = nearby[:limit]
+
+  upcoming = upcoming_shows_by_venue([venue_id for distance, venue_id, row in nearby])
+  return [{
+    "id": row.id,
+    "name": row.name,
+    "address": row.address,
+    "city": row.city,
+    "state": row.state,
+    "latitude": row.latitude,
+    "longitude": row.longitude,
+    "distance_km": round(distance, 3),
+    "upcoming_shows_count": row.upcoming_shows_count,
+    "upcoming_shows": upcoming.get(row.id, []),
+  } for distance, venue_id, row in nearby]
+
+def upcoming_shows_by_venue(venue_ids, per_venue=NEAR_UPCOMING_SHOWS):
+  # The next per_venue shows of each venue, in one query.
+  if not venue_ids:
+    return {}
+  position = db.func.row_number().over(
+    partition_by=Show.venue_id, order_by=(Show.start_time, Show.id)).label('position')
+  shows = db.session.query(Show.id, Show.venue_id, Show.artist_id, Show.start_time,
+      Artist.name.label('artist_name'), Artist.image_link.label('artist_image_link'), position) \
+    .join(Artist, Show.artist_id == Artist.id) \
+    .filter(Show.venue_id.in_(venue_ids), Show.start_time > datetime.now()) \
+    .subquery()
+  rows = db.session.query(shows) \
+    .filter(shows.c.position <= per_venue) \
+    .order_by(shows.c.venue_id, shows.c.position)
+  upcoming = {}
+  for row in rows:
+    upcoming.setdefault(row.venue_id, []).append({
+      "id": row.id,
+      "artist_id": row.artist_id,
+      "artist_name": row.artist_name,
+      "artist_image_link": row.artist_image_link,
+      "start_time": row.start_time,
+    })
+  return upcoming
+
+#----------------------------------------------------------------------------#
+# Detail pages.
+#----------------------------------------------------------------------------#
+
+SHOWS_PAGE_SIZE = 20
+
+def genre_names(entity):
+  return [genre.name for genre in entity.genres]
+
+def load_entity(session, model, show_fk, entity_id, now):
+  # The entity with its genres and its upcoming and past show counts.
+  upcoming, past, archived = [
+    session.query(db.func.count())
+      .select_from(table)
+      .filter(getattr(table, show_fk.key) == model.id, *conditions)
+      .correlate(model)
+      .as_scalar()
+    for table, conditions in ((Show, [Show.start_time > now]), (Show, [Show.start_time <= now]),
+                              (ShowArchive, []))
+  ]
+  row = session.query(model, upcoming, past + archived) \
+    .options(db.joinedload(model.genres)) \
+    .filter(model.id == entity_id) \
+    .first()
+  if row is None:
+    abort(404)
+  return row
+
+def load_show_page(session, show_fk, related, entity_id, past_page, now):
+  # Every upcoming show plus one page of past shows, with the related
+  # artist/venue joined in, in one query. The page's ids come from Show and
+  # ShowArchive; each row is loaded from the table it came from, so archived
+  # shows are ShowArchive objects.
+  archived_fk = getattr(ShowArchive, show_fk.key)
+  upcoming = db.select([Show.id, Show.start_time, db.false().label('archived')]) \
+    .where(db.and_(show_fk == entity_id, Show.start_time > now))
+  past = db.union_all(
+      db.select([Show.id, Show.start_time, db.false().label('archived')])
+        .where(db.and_(show_fk == entity_id, Show.start_time <= now)),
+      db.select([ShowArchive.id, ShowArchive.start_time, db.true().label('archived')])
+        .where(archived_fk == entity_id),
+    ).order_by(db.desc('start_time')) \
+    .limit(SHOWS_PAGE_SIZE) \
+    .offset((past_page - 1) * SHOWS_PAGE_SIZE) \
+    .alias()
+  page = db.union_all(upcoming, db.select([past.c.id, past.c.start_time, past.c.archived])).alias()
+  rows = session.query(Show, ShowArchive) \
+    .select_from(page) \
+    .outerjoin(Show, db.and_(Show.id == page.c.id, db.not_(page.c.archived))) \
+    .outerjoin(ShowArchive, db.and_(ShowArchive.id == page.c.id,
+      ShowArchive.start_time == page.c.start_time, page.c.archived)) \
+    .options(db.joinedload(related), db.joinedload(getattr(ShowArchive, related.key))) \
+    .all()
+  return sorted((show or archived for show, archived in rows), key=lambda show: show.start_time)
+
+def split_shows(row, shows, past_page, now):
+  entity, upcoming_shows_count, past_shows_count = row
+  return {
+    "entity": entity,
+    "upcoming_shows": [show for show in shows if show.start_time > now],
+    "past_shows": [show for show in reversed(shows) if show.start_time <= now],
+    "upcoming_shows_count": upcoming_shows_count,
+    "past_shows_count": past_shows_count,
+    "past_page": past_page,
+    "has_older_past_shows": past_page * SHOWS_PAGE_SIZE < past_shows_count,
   }
-  data2={
-    "id": 2,
-    "name": "The Dueling Pianos Bar",
-    "genres": ["Classical", "R&B", "Hip-Hop"],
-    "address": "335 Delancey Street",
-    "city": "New York",
-    "state": "NY",
-    "phone": "914-003-1132",
-    "website": "https://www.theduelingpianos.com",
-    "facebook_link": "https://www.facebook.com/theduelingpianos",
-    "seeking_talent": False,
-    "image_link": "https://images.unsplash.com/photo-1497032205916-ac775f0649ae?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=750&q=80",
-    "past_shows": [],
-    "upcoming_shows": [],
-    "past_shows_count": 0,
-    "upcoming_shows_count": 0,
+
+def load_with_shows(model, show_fk, related, entity_id, past_page=1):
+  # Two queries whatever the number of shows.
+  now = datetime.now()
+  row = load_entity(db.session, model, show_fk, entity_id, now)
+  shows = load_show_page(db.session, show_fk, related, entity_id, past_page, now)
+  return split_shows(row, shows, past_page, now)
+
+def venue_detail(venue_id, past_page=1):
+  return venue_data(load_with_shows(Venue, Show.venue_id, Show.artist, venue_id, past_page))
+
+def venue_data(result):
+  venue = result["entity"]
+
+  def show_data(show):
+    return {
+      "id": show.id,
+      "updated_at": max(show.updated_at, show.artist.updated_at),
+      "artist_id": show.artist_id,
+      "artist_name": show.artist.name,
+      "artist_image_link": show.artist.image_link,
+      "start_time": show.start_time
+    }
+
+  return {
+    "id": venue.id,
+    "name": venue.name,
+    "genres": genre_names(venue),
+    "address": venue.address,
+    "city": venue.city,
+    "state": venue.state,
+    "phone": venue.phone,
+    "website": venue.website,
+    "facebook_link": venue.facebook_link,
+    "seeking_talent": venue.seeking_talent,
+    "seeking_description": venue.seeking_description,
+    "image_link": venue.image_link,
+    "past_shows": [show_data(show) for show in result["past_shows"]],
+    "upcoming_shows": [show_data(show) for show in result["upcoming_shows"]],
+    "past_shows_count": result["past_shows_count"],
+    "upcoming_shows_count": result["upcoming_shows_count"],
+    "past_page": result["past_page"],
+    "has_older_past_shows": result["has_older_past_shows"],
   }
-  data3={
-    "id": 3,
-    "name": "Park Square Live Music & Coffee",
-    "genres": ["Rock n Roll", "Jazz", "Classical", "Folk"],
-    "address": "34 Whiskey Moore Ave",
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "415-000-1234",
-    "website": "https://www.parksquarelivemusicandcoffee.com",
-    "facebook_link": "https://www.facebook.com/ParkSquareLiveMusicAndCoffee",
-    "seeking_talent": False,
-    "image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-    "past_shows": [{
-      "artist_id": 5,
-      "artist_name": "Matt Quevedo",
-      "artist_image_link": "https://images.unsplash.com/photo-1495223153807-b916f75de8c5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=334&q=80",
-      "start_time": "2019-06-15T23:00:00.000Z"
-    }],
-    "upcoming_shows": [{
-      "artist_id": 6,
-      "artist_name": "The Wild Sax Band",
-      "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-      "start_time": "2035-04-01T20:00:00.000Z"
-    }, {
-      "artist_id": 6,
-      "artist_name": "The Wild Sax Band",
-      "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-      "start_time": "2035-04-08T20:00:00.000Z"
-    }, {
-      "artist_id": 6,
-      "artist_name": "The Wild Sax Band",
-      "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-      "start_time": "2035-04-15T20:00:00.000Z"
-    }],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 1,
+
+def artist_detail(artist_id, past_page=1):
+  return artist_data(load_with_shows(Artist, Show.artist_id, Show.venue, artist_id, past_page))
+
+def artist_data(result):
+  artist = result["entity"]
+
+  def show_data(show):
+    return {
+      "id": show.id,
+      "updated_at": max(show.updated_at, show.venue.updated_at),
+      "venue_id": show.venue_id,
+      "venue_name": show.venue.name,
+      "venue_image_link": show.venue.image_link,
+      "start_time": show.start_time
+    }
+
+  return {
+    "id": artist.id,
+    "name": artist.name,
+    "genres": genre_names(artist),
+    "city": artist.city,
+    "state": artist.state,
+    "phone": artist.phone,
+    "website": artist.website,
+    "facebook_link": artist.facebook_link,
+    "seeking_venue": artist.seeking_venue,
+    "seeking_description": artist.seeking_description,
+    "image_link": artist.image_link,
+    "past_shows": [show_data(show) for show in result["past_shows"]],
+    "upcoming_shows": [show_data(show) for show in result["upcoming_shows"]],
+    "past_shows_count": result["past_shows_count"],
+    "upcoming_shows_count": result["upcoming_shows_count"],
+    "past_page": result["past_page"],
+    "has_older_past_shows": result["has_older_past_shows"],
   }
-  data = list(filter(lambda d: d['id'] == venue_id, [data1, data2, data3]))[0]
-  return render_template('pages/show_venue.html', venue=data)
 
-#  Create Venue
-#  ----------------------------------------------------------------
+#----------------------------------------------------------------------------#
+# Show listing.
+#----------------------------------------------------------------------------#
 
-@app.route('/venues/create', methods=['GET'])
-def create_venue_form():
-  form = VenueForm()
-  return render_template('forms/new_venue.html', form=form)
-
-@app.route('/venues/create', methods=['POST'])
-def create_venue_submission():
-  # TODO: insert form data as a new Venue record in the db, instead
-  # TODO: modify data to be the data object returned from db insertion
-
-  # on successful db insert, flash success
-  flash('Venue ' + request.form['name'] + ' was successfully listed!')
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Venue ' + data.name + ' could not be listed.')
-  # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
-  return render_template('pages/home.html')
+SHOW_LIST_PAGE_SIZE = 60
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
-def delete_venue(venue_id):
-  # TODO: Complete this endpoint for taking a venue_id, and using
-  # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
+def show_cursor(start_time, show_id):
+  return '%s_%d' % (start_time.isoformat(), show_id)
 
-  # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
-  # clicking that button delete it from the db then redirect the user to the homepage
-  return None
+def parse_show_cursor(cursor):
+  try:
+    start_time, _, show_id = cursor.rpartition('_')
+    return datetime.fromisoformat(start_time), int(show_id)
+  except ValueError:
+    abort(400)
 
-#  Artists
-#  ----------------------------------------------------------------
-@app.route('/artists')
-def artists():
-  # TODO: replace with real data returned from querying the database
-  data=[{
-    "id": 4,
-    "name": "Guns N Petals",
-  }, {
-    "id": 5,
-    "name": "Matt Quevedo",
-  }, {
-    "id": 6,
-    "name": "The Wild Sax Band",
-  }]
-  return render_template('pages/artists.html', artists=data)
-
-@app.route('/artists/search', methods=['POST'])
-def search_artists():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-  # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
-  # search for "band" should return "The Wild Sax Band".
-  response={
-    "count": 1,
-    "data": [{
-      "id": 4,
-      "name": "Guns N Petals",
-      "num_upcoming_shows": 0,
-    }]
+def show_listing(after=None, session=None):
+  query = (session or db.session).query(
+      Show.id,
+      Show.start_time,
+      Show.venue_id,
+      Venue.name.label('venue_name'),
+      Show.artist_id,
+      Artist.name.label('artist_name'),
+      Artist.image_link.label('artist_image_link'),
+      Show.updated_at,
+      Venue.updated_at.label('venue_updated_at'),
+      Artist.updated_at.label('artist_updated_at'),
+    ).join(Venue, Show.venue_id == Venue.id) \
+    .join(Artist, Show.artist_id == Artist.id) \
+    .order_by(Show.start_time, Show.id)
+  if after:
+    query = query.filter(db.tuple_(Show.start_time, Show.id) > parse_show_cursor(after))
+  return query
+
+def show_page(after, limit, session=None):
+  # One page of show_listing() plus the cursor of the next one, if any.
+  rows = show_listing(after, session).limit(limit + 1).all()
+  if len(rows) <= limit:
+    return rows, None
+  rows = rows[:limit]
+  return rows, show_cursor(rows[-1].start_time, rows[-1].id)
+
+def show_data(row):
+  return {
+    "id": row.id,
+    "updated_at": max(row.updated_at, row.venue_updated_at, row.artist_updated_at),
+    "venue_id": row.venue_id,
+    "venue_name": row.venue_name,
+    "artist_id": row.artist_id,
+    "artist_name": row.artist_name,
+    "artist_image_link": row.artist_image_link,
+    "start_time": row.start_time
   }
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
-
-@app.route('/artists/<int:artist_id>')
-def show_artist(artist_id):
-  # shows the artist page with the given artist_id
-  # TODO: replace with real artist data from the artist table, using artist_id
-  data1={
-    "id": 4,
-    "name": "Guns N Petals",
-    "genres": ["Rock n Roll"],
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "326-123-5000",
-    "website": "https://www.gunsnpetalsband.com",
-    "facebook_link": "https://www.facebook.com/GunsNPetals",
-    "seeking_venue": True,
-    "seeking_description": "Looking for shows to perform at in the San Francisco Bay Area!",
-    "image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80",
-    "past_shows": [{
-      "venue_id": 1,
-      "venue_name": "The Musical Hop",
-      "venue_image_link": "https://images.unsplash.com/photo-1543900694-133f37abaaa5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=400&q=60",
-      "start_time": "2019-05-21T21:30:00.000Z"
-    }],
-    "upcoming_shows": [],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 0,
+
+def stream_template(template_name, **context):
+  # Render a template incrementally so large pages are never held in memory.
+  # Nor in the fragment cache: a stream of every show would fill it.
+  context.setdefault('fragment_cache_store', False)
+  current_app.update_template_context(context)
+  stream = current_app.jinja_env.get_template(template_name).stream(context)
+  stream.enable_buffering(5)
+  return stream
+
+#----------------------------------------------------------------------------#
+# Read replicas.
+#----------------------------------------------------------------------------#
+
+# POST endpoints that only read.
+READ_ONLY_ENDPOINTS = {'venues.search_venues', 'artists.search_artists'}
+
+def is_read_only_request():
+  return request.method in ('GET', 'HEAD') or request.endpoint in READ_ONLY_ENDPOINTS
+
+def route_reads_to_replica():
+  # Serve read-only requests from a replica, unless this client wrote
+  # recently and has to see its own writes.
+  if replica_router and is_read_only_request() \
+      and session.get('read_primary_until', 0) < time.time():
+    g.db_bind = replica_router.choose()
+
+def stick_to_primary(response):
+  if replica_router and not is_read_only_request():
+    session['read_primary_until'] = time.time() + current_app.config['DB_REPLICA_STICKY_SECONDS']
+  return response
+
+def init_replicas(app):
+  app.extensions['replica_router'] = ReplicaRouter(app.config['DB_REPLICA_BINDS'],
+    engine_for=lambda bind: db.get_engine(app, bind=bind),
+    policy=app.config['DB_REPLICA_POLICY'])
+  app.before_request(route_reads_to_replica)
+  app.after_request(stick_to_primary)
+
+#----------------------------------------------------------------------------#
+# Background jobs.
+#----------------------------------------------------------------------------#
+
+# Follow-up work of write requests is queued in the Job table, in the same
+# transaction as the write, and run by `flask worker` once it commits. With
+# JOBS_EAGER (the default unless the page cache is shared, since a worker
+# cannot reach another process's memory) tasks run in the web process
+# instead, after the response has been built.
+job_queue = JobQueue(db.session, Job)
+
+def after_commit(task, key=None, **payload):
+  # Call before committing the change the task follows up on.
+  if not current_app.config['JOBS_EAGER']:
+    job_queue.enqueue(task, key=key, **payload)
+  elif has_request_context():
+    g.setdefault('eager_jobs', {})[key or len(g.eager_jobs)] = (task, payload)
+  else:
+    job_queue.tasks[task](**payload)
+
+def run_eager_jobs(response):
+  for task, payload in g.pop('eager_jobs', {}).values():
+    try:
+      job_queue.tasks[task](**payload)
+    except Exception:
+      current_app.logger.exception('Task %s failed', task)
+  return response
+
+def init_jobs(app):
+  job_queue.logger = app.logger
+  job_queue.max_attempts = app.config['JOB_MAX_ATTEMPTS']
+  job_queue.retry_delay = app.config['JOB_RETRY_SECONDS']
+  job_queue.timeout = app.config['JOB_TIMEOUT_SECONDS']
+  job_queue.retention = app.config['JOB_RETENTION_SECONDS']
+  app.after_request(run_eager_jobs)
+
+#----------------------------------------------------------------------------#
+# Page cache.
+#----------------------------------------------------------------------------#
+
+def cached_page(key):
+  # Cache the rendered page under key, formatted with the view arguments.
+  # Only plain GETs in the default locale and timezone are cached: query
+  # strings select other pages or modes, and neither pending flash messages
+  # nor a reader's own date formatting may be baked into a cached page.
+  # Write controllers invalidate the keys their changes show up under.
+  def cache_key(kwargs):
+    if request.method != 'GET' or request.args or session.get('_flashes') \
+        or request_locale() != current_app.config['BABEL_DEFAULT_LOCALE'] \
+        or request_timezone() != current_app.config['BABEL_DEFAULT_TIMEZONE']:
+      return None
+    return key.format(**kwargs)
+
+  def decorator(view):
+    if inspect.iscoroutinefunction(view):
+      @functools.wraps(view)
+      async def async_wrapper(**kwargs):
+        page_key = cache_key(kwargs)
+        page = page_cache.get(page_key) if page_key else None
+        if page is None:
+          page = await view(**kwargs)
+          if page_key and isinstance(page, str):
+            page_cache.set(page_key, page)
+        return page
+      return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(**kwargs):
+      page_key = cache_key(kwargs)
+      page = page_cache.get(page_key) if page_key else None
+      if page is None:
+        page = view(**kwargs)
+        if page_key and isinstance(page, str):
+          page_cache.set(page_key, page)
+      return page
+    return wrapper
+  return decorator
+
+@job_queue.task
+def invalidate_pages(keys):
+  page_cache.invalidate(*keys)
+
+@job_queue.task
+def invalidate_venue(venue_id):
+  # The venue page, its area on /venues, the shows list naming it and the
+  # pages of the artists who play there.
+  artist_ids = db.session.query(Show.artist_id).filter(Show.venue_id == venue_id) \
+    .union(db.session.query(ShowArchive.artist_id).filter(ShowArchive.venue_id == venue_id))
+  page_cache.invalidate('venue:%d' % venue_id, 'venues', 'shows',
+    *['artist:%d' % artist_id for artist_id, in artist_ids])
+
+@job_queue.task
+def invalidate_artist(artist_id):
+  venue_ids = db.session.query(Show.venue_id).filter(Show.artist_id == artist_id) \
+    .union(db.session.query(ShowArchive.venue_id).filter(ShowArchive.artist_id == artist_id))
+  page_cache.invalidate('artist:%d' % artist_id, 'artists', 'shows',
+    *['venue:%d' % venue_id for venue_id, in venue_ids])
+
+@job_queue.task
+def invalidate_show(venue_id, artist_id):
+  page_cache.invalidate('venue:%d' % venue_id, 'artist:%d' % artist_id, 'shows', 'venues')
+
+#----------------------------------------------------------------------------#
+# Instrumentation.
+#----------------------------------------------------------------------------#
+
+# Every request records its wall time, SQL statements and template render
+# time. Totals are served at /metrics and each response carries them in a
+# Server-Timing header. A request that runs one statement
+# N_PLUS_ONE_THRESHOLD times or more (typically a lazy load inside a loop)
+# is logged with the statement. PROFILE_SAMPLE_RATE of requests are run
+# under cProfile and dumped to PROFILE_DIR.
+
+request_metrics = RequestMetrics()
+
+def current_request_stats():
+  return g.get('request_stats') if has_request_context() else None
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+  conn.info.setdefault('statement_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_statement(conn, cursor, statement, parameters, context, executemany):
+  duration = time.perf_counter() - conn.info['statement_started'].pop()
+  stats = current_request_stats()
+  if stats is not None:
+    stats.record_statement(statement, duration)
+  if has_app_context() and duration > current_app.config['SLOW_QUERY_SECONDS']:
+    current_app.logger.warning('Slow query (%.3fs): %s', duration, statement)
+
+@event.listens_for(Engine, 'handle_error')
+def discard_statement_timer(context):
+  if context.connection is not None and context.connection.info.get('statement_started'):
+    context.connection.info['statement_started'].pop()
+
+def start_template_timer(sender, template, context, **extra):
+  g.template_started = time.perf_counter()
+
+def record_template_time(sender, template, context, **extra):
+  stats = current_request_stats()
+  started = g.pop('template_started', None)
+  if stats is not None and started is not None:
+    stats.template_time += time.perf_counter() - started
+
+def start_request_stats():
+  g.request_stats = RequestStats(time.perf_counter())
+  rate = current_app.config['PROFILE_SAMPLE_RATE']
+  if rate and random.random() < rate:
+    import cProfile
+    g.profiler = cProfile.Profile()
+    g.profiler.enable()
+
+def record_request_stats(response):
+  stats = g.pop('request_stats', None)
+  if stats is None:
+    return response
+  duration = time.perf_counter() - stats.started
+  repeated = stats.repeated_statements(current_app.config['N_PLUS_ONE_THRESHOLD'])
+  for statement, count in repeated:
+    current_app.logger.warning('Possible N+1 query in %s, ran %d times: %s', request.endpoint, count, statement)
+  if duration > current_app.config['SLOW_REQUEST_SECONDS']:
+    current_app.logger.warning('Slow request %s (%.3fs, %d queries, %.3fs in SQL); slowest: %s',
+      request.path, duration, stats.sql_count, stats.sql_time,
+      '; '.join('%.3fs %s' % slow for slow in stats.slowest))
+  request_metrics.record(request.endpoint, duration, stats, n_plus_one=bool(repeated))
+  response.headers['Server-Timing'] = 'app;dur=%.1f, db;dur=%.1f;desc="%d queries", tpl;dur=%.1f' % (
+    duration * 1000, stats.sql_time * 1000, stats.sql_count, stats.template_time * 1000)
+  return response
+
+def dump_profile(exception):
+  profiler = g.pop('profiler', None)
+  if profiler is not None:
+    profiler.disable()
+    os.makedirs(current_app.config['PROFILE_DIR'], exist_ok=True)
+    profiler.dump_stats(os.path.join(current_app.config['PROFILE_DIR'],
+      '%s-%d.prof' % (request.endpoint or 'unknown', time.time() * 1000)))
+
+def init_instrumentation(app):
+  before_render_template.connect(start_template_timer, app)
+  template_rendered.connect(record_template_time, app)
+  app.before_request(start_request_stats)
+  app.after_request(record_request_stats)
+  app.teardown_request(dump_profile)
+
+#----------------------------------------------------------------------------#
+# Forms.
+#----------------------------------------------------------------------------#
+
+def flash_form_errors(form):
+  for name, errors in form.errors.items():
+    for error in errors:
+      flash('%s: %s' % (getattr(form, name).label.text, error))
+
+def venue_form_data(venue):
+  return {
+    "name": venue.name,
+    "city": venue.city,
+    "state": venue.state,
+    "address": venue.address,
+    "phone": venue.phone,
+    "image_link": venue.image_link,
+    "genres": genre_names(venue),
+    "facebook_link": venue.facebook_link,
+    "website_link": venue.website,
+    "seeking_talent": venue.seeking_talent,
+    "seeking_description": venue.seeking_description,
   }
-  data2={
-    "id": 5,
-    "name": "Matt Quevedo",
-    "genres": ["Jazz"],
-    "city": "New York",
-    "state": "NY",
-    "phone": "300-400-5000",
-    "facebook_link": "https://www.facebook.com/mattquevedo923251523",
-    "seeking_venue": False,
-    "image_link": "https://images.unsplash.com/photo-1495223153807-b916f75de8c5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=334&q=80",
-    "past_shows": [{
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2019-06-15T23:00:00.000Z"
-    }],
-    "upcoming_shows": [],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 0,
+
+def venue_values(form):
+  return {
+    "name": form.name.data,
+    "city": form.city.data,
+    "state": form.state.data,
+    "address": form.address.data,
+    "phone": form.phone.data,
+    "image_link": form.image_link.data,
+    "genres": form.genres.data,
+    "facebook_link": form.facebook_link.data,
+    "website": form.website_link.data,
+    "seeking_talent": form.seeking_talent.data,
+    "seeking_description": form.seeking_description.data,
   }
-  data3={
-    "id": 6,
-    "name": "The Wild Sax Band",
-    "genres": ["Jazz", "Classical"],
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "432-325-5432",
-    "seeking_venue": False,
-    "image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "past_shows": [],
-    "upcoming_shows": [{
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2035-04-01T20:00:00.000Z"
-    }, {
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2035-04-08T20:00:00.000Z"
-    }, {
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2035-04-15T20:00:00.000Z"
-    }],
-    "past_shows_count": 0,
-    "upcoming_shows_count": 3,
+
+def artist_form_data(artist):
+  return {
+    "name": artist.name,
+    "city": artist.city,
+    "state": artist.state,
+    "phone": artist.phone,
+    "image_link": artist.image_link,
+    "genres": genre_names(artist),
+    "facebook_link": artist.facebook_link,
+    "website_link": artist.website,
+    "seeking_venue": artist.seeking_venue,
+    "seeking_description": artist.seeking_description,
   }
-  data = list(filter(lambda d: d['id'] == artist_id, [data1, data2, data3]))[0]
-  return render_template('pages/show_artist.html', artist=data)
 
-#  Update
-#  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
-def edit_artist(artist_id):
-  form = ArtistForm()
-  artist={
-    "id": 4,
-    "name": "Guns N Petals",
-    "genres": ["Rock n Roll"],
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "326-123-5000",
-    "website": "https://www.gunsnpetalsband.com",
-    "facebook_link": "https://www.facebook.com/GunsNPetals",
-    "seeking_venue": True,
-    "seeking_description": "Looking for shows to perform at in the San Francisco Bay Area!",
-    "image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80"
+def artist_values(form):
+  return {
+    "name": form.name.data,
+    "city": form.city.data,
+    "state": form.state.data,
+    "phone": form.phone.data,
+    "image_link": form.image_link.data,
+    "genres": form.genres.data,
+    "facebook_link": form.facebook_link.data,
+    "website": form.website_link.data,
+    "seeking_venue": form.seeking_venue.data,
+    "seeking_description": form.seeking_description.data,
   }
-  # TODO: populate form with fields from artist with ID <artist_id>
-  return render_template('forms/edit_artist.html', form=form, artist=artist)
-
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
-def edit_artist_submission(artist_id):
-  # TODO: take values from the form submitted, and update existing
-  # artist record with ID <artist_id> using the new attributes
-
-  return redirect(url_for('show_artist', artist_id=artist_id))
-
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
-def edit_venue(venue_id):
-  form = VenueForm()
-  venue={
-    "id": 1,
-    "name": "The Musical Hop",
-    "genres": ["Jazz", "Reggae", "Swing", "Classical", "Folk"],
-    "address": "1015 Folsom Street",
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "123-123-1234",
-    "website": "https://www.themusicalhop.com",
-    "facebook_link": "https://www.facebook.com/TheMusicalHop",
-    "seeking_talent": True,
-    "seeking_description": "We are on the lookout for a local artist to play every two weeks. Please call us.",
-    "image_link": "https://images.unsplash.com/photo-1543900694-133f37abaaa5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=400&q=60"
+
+def show_values(form):
+  start_time = form.start_time.data
+  return {
+    "artist_id": form.artist_id.data,
+    "venue_id": form.venue_id.data,
+    "start_time": start_time,
+    "end_time": start_time + timedelta(minutes=form.duration.data or DEFAULT_SHOW_MINUTES),
   }
-  # TODO: populate form with values from venue with ID <venue_id>
-  return render_template('forms/edit_venue.html', form=form, venue=venue)
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
-def edit_venue_submission(venue_id):
-  # TODO: take values from the form submitted, and update existing
-  # venue record with ID <venue_id> using the new attributes
-  return redirect(url_for('show_venue', venue_id=venue_id))
+def missing_show_parties(values):
+  # Messages for a venue or artist of the show that does not exist, both
+  # looked up in one query.
+  venue = db.select([Venue.id]).where(Venue.id == values["venue_id"]).as_scalar()
+  artist = db.select([Artist.id]).where(Artist.id == values["artist_id"]).as_scalar()
+  venue_id, artist_id = db.session.query(venue, artist).one()
+  return (['Venue %d does not exist' % values["venue_id"]] if venue_id is None else []) \
+    + (['Artist %d does not exist' % values["artist_id"]] if artist_id is None else [])
 
-#  Create Artist
-#  ----------------------------------------------------------------
+def genres_by_name(names):
+  # Genre rows for the given names, adding the ones that do not exist yet.
+  genres = {}
+  if names:
+    genres = {genre.name: genre for genre in Genre.query.filter(Genre.name.in_(names))}
+  for name in names:
+    if name not in genres:
+      genres[name] = Genre(name=name)
+      db.session.add(genres[name])
+  return genres
 
-@app.route('/artists/create', methods=['GET'])
-def create_artist_form():
-  form = ArtistForm()
-  return render_template('forms/new_artist.html', form=form)
-
-@app.route('/artists/create', methods=['POST'])
-def create_artist_submission():
-  # called upon submitting the new artist listing form
-  # TODO: insert form data as a new Venue record in the db, instead
-  # TODO: modify data to be the data object returned from db insertion
-
-  # on successful db insert, flash success
-  flash('Artist ' + request.form['name'] + ' was successfully listed!')
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Artist ' + data.name + ' could not be listed.')
+def with_genres(values, genres=None):
+  if genres is None:
+    genres = genres_by_name(set(values["genres"]))
+  return dict(values, genres=[genres[name] for name in values["genres"]])
+
+def update_from_form(entity, values):
+  for name, value in values.items():
+    setattr(entity, name, value)
+
+#----------------------------------------------------------------------------#
+# Controllers.
+#----------------------------------------------------------------------------#
+
+@main_bp.route('/')
+def index():
   return render_template('pages/home.html')
 
+def delete_submission(model, entity_id):
+  # Answers the delete buttons' requests with where to go next.
+  kind = model.__name__
+  try:
+    deleted = delete_entities(model, [entity_id])
+  except SQLAlchemyError:
+    db.session.rollback()
+    current_app.logger.exception('Could not delete %s %d', kind.lower(), entity_id)
+    return jsonify({"success": False, "error": kind + ' could not be deleted.'}), 500
+  if not deleted:
+    abort(404)
+  flash(kind + ' was successfully deleted.')
+  return jsonify({"success": True, "redirect": url_for('main.index')})
+
 
-#  Shows
+#  Static assets
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
-def shows():
-  # displays list of shows at /shows
-  # TODO: replace with real venues data.
-  data=[{
-    "venue_id": 1,
-    "venue_name": "The Musical Hop",
-    "artist_id": 4,
-    "artist_name": "Guns N Petals",
-    "artist_image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80",
-    "start_time": "2019-05-21T21:30:00.000Z"
-  }, {
-    "venue_id": 3,
-    "venue_name": "Park Square Live Music & Coffee",
-    "artist_id": 5,
-    "artist_name": "Matt Quevedo",
-    "artist_image_link": "https://images.unsplash.com/photo-1495223153807-b916f75de8c5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=334&q=80",
-    "start_time": "2019-06-15T23:00:00.000Z"
-  }, {
-    "venue_id": 3,
-    "venue_name": "Park Square Live Music & Coffee",
-    "artist_id": 6,
-    "artist_name": "The Wild Sax Band",
-    "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "start_time": "2035-04-01T20:00:00.000Z"
-  }, {
-    "venue_id": 3,
-    "venue_name": "Park Square Live Music & Coffee",
-    "artist_id": 6,
-    "artist_name": "The Wild Sax Band",
-    "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "start_time": "2035-04-08T20:00:00.000Z"
-  }, {
-    "venue_id": 3,
-    "venue_name": "Park Square Live Music & Coffee",
-    "artist_id": 6,
-    "artist_name": "The Wild Sax Band",
-    "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "start_time": "2035-04-15T20:00:00.000Z"
-  }]
-  return render_template('pages/shows.html', shows=data)
-
-@app.route('/shows/create')
-def create_shows():
-  # renders form. do not touch.
-  form = ShowForm()
-  return render_template('forms/new_show.html', form=form)
-
-@app.route('/shows/create', methods=['POST'])
-def create_show_submission():
-  # called to create new shows in the db, upon submitting new show listing form
-  # TODO: insert form data as a new Show record in the db, instead
-
-  # on successful db insert, flash success
-  flash('Show was successfully listed!')
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Show could not be listed.')
-  # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
-  return render_template('pages/home.html')
+@main_bp.route('/static/dist/<path:filename>')
+def dist_asset(filename):
+  # Build output is fingerprinted, so it may be cached for a year; text
+  # files are sent precompressed when the client accepts it.
+  import mimetypes
+  directory = os.path.join(current_app.static_folder, DIST)
+  for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+    # safe_join gives None for paths leaving the directory;
+    # send_from_directory answers those with a 404 below.
+    path = safe_join(directory, filename + suffix)
+    if request.accept_encodings[encoding] and path and os.path.isfile(path):
+      response = send_from_directory(directory, filename + suffix,
+        mimetype=mimetypes.guess_type(filename)[0], max_age=ASSET_MAX_AGE)
+      response.headers['Content-Encoding'] = encoding
+      break
+  else:
+    response = send_from_directory(directory, filename, max_age=ASSET_MAX_AGE)
+  response.vary.add('Accept-Encoding')
+  response.cache_control.public = True
+  response.cache_control.immutable = True
+  return response
+
+#  Async views
+#  ----------------------------------------------------------------
+# With ASYNC_VIEWS set, the read-heavy pages are served by async views,
+# which query through an asyncio driver and run independent queries
+# concurrently. They take over the endpoints of the sync views, so URLs and
+# url_for() are unchanged. Needs Flask 2.0+ (with its async extra) and
+# asyncpg or aiosqlite; the sync views remain the default.
+
+async_db = LocalProxy(lambda: current_app.extensions['async_db'])
+
+async def load_with_shows_async(model, show_fk, related, entity_id, past_page=1):
+  # The same two queries as load_with_shows(), run at the same time.
+  import asyncio
+  now = datetime.now()
+  row, shows = await asyncio.gather(
+    async_db.run(load_entity, model, show_fk, entity_id, now),
+    async_db.run(load_show_page, show_fk, related, entity_id, past_page, now),
+  )
+  return split_shows(row, shows, past_page, now)
+
+def init_async_views(app):
+  # Call after the blueprints are registered.
+  if not app.config['ASYNC_VIEWS']:
+    return
+  if not hasattr(app, 'ensure_sync'):
+    raise RuntimeError('ASYNC_VIEWS requires Flask 2.0 or later')
+  from aio import AsyncDatabase, async_database_url
+  app.extensions['async_db'] = AsyncDatabase(app.config['ASYNC_DATABASE_URL']
+    or async_database_url(app.config['SQLALCHEMY_DATABASE_URI']))
+  import venues, artists, shows
+  app.view_functions.update({
+    'venues.show_venue': venues.show_venue_async,
+    'artists.show_artist': artists.show_artist_async,
+    'shows.shows': shows.shows_async,
+  })
+
+#  Metrics
+#  ----------------------------------------------------------------
+
+@main_bp.route('/metrics')
+def metrics():
+  lines = request_metrics.render()
+  lines += gauge('fyyur_page_cache_hits_total', 'Page cache hits.', page_cache.hits, 'counter')
+  lines += gauge('fyyur_page_cache_misses_total', 'Page cache misses.', page_cache.misses, 'counter')
+  fragment_cache = current_app.jinja_env.fragment_cache
+  if fragment_cache is not None:
+    lines += gauge('fyyur_fragment_cache_hits_total', 'Template fragment cache hits.', fragment_cache.hits, 'counter')
+    lines += gauge('fyyur_fragment_cache_misses_total', 'Template fragment cache misses.', fragment_cache.misses, 'counter')
+  lines += gauge('fyyur_db_pool_checkouts_total', 'Connection pool checkouts.', pool_stats.checkouts, 'counter')
+  lines += gauge('fyyur_db_pool_wait_seconds_total', 'Time spent waiting for a connection.', pool_stats.wait_total, 'counter')
+  lines += gauge('fyyur_db_pool_wait_max_seconds', 'Longest wait for a connection.', pool_stats.wait_max)
+  lines += gauge('fyyur_db_pool_timeouts_total', 'Checkouts that timed out.', pool_stats.timeouts, 'counter')
+  jobs = job_queue.stats()
+  lines += ['# HELP fyyur_jobs Background jobs by state.', '# TYPE fyyur_jobs gauge']
+  lines += ['fyyur_jobs{state="%s"} %d' % (state, jobs['depth'][state]) for state in JOB_STATES]
+  lines += gauge('fyyur_job_lag_seconds', 'Age of the oldest due job.', jobs['lag'])
+  lines += gauge('fyyur_job_wait_seconds_avg', 'Mean wait from due to started, last 5 minutes.', jobs['wait_avg'])
+  lines += gauge('fyyur_job_wait_seconds_max', 'Longest wait from due to started, last 5 minutes.', jobs['wait_max'])
+  lines += gauge('fyyur_job_run_seconds_avg', 'Mean job run time, last 5 minutes.', jobs['run_avg'])
+  lines += gauge('fyyur_job_run_seconds_max', 'Longest job run time, last 5 minutes.', jobs['run_max'])
+  return Response('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
 
-@app.errorhandler(404)
+@main_bp.app_errorhandler(400)
+def bad_request_error(error):
+    if request.path.startswith('/api/'):
+        return jsonify({"error": "Bad request"}), 400
+    return error
+
+@main_bp.app_errorhandler(404)
 def not_found_error(error):
+    if request.path.startswith('/api/'):
+        return jsonify({"error": "Not found"}), 404
     return render_template('errors/404.html'), 404
 
-@app.errorhandler(500)
+@main_bp.app_errorhandler(500)
 def server_error(error):
+    if request.path.startswith('/api/'):
+        return jsonify({"error": "Internal server error"}), 500
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
+#----------------------------------------------------------------------------#
+# App factory.
+#----------------------------------------------------------------------------#
+
+class LazyAppGroup(AppGroup):
+  # app.cli, filled from commands.cli and bench.cli.cli the first time the
+  # command line looks a command up: web workers never ask, so never import
+  # them (nor seed, bench and forms through them).
+  loaded = False
+
+  def load_commands(self):
+    if not self.loaded:
+      from commands import cli
+      from bench.cli import cli as bench_cli
+      for command in itertools.chain(cli.commands.values(), bench_cli.commands.values()):
+        self.add_command(command)
+      self.loaded = True
+
+  def list_commands(self, ctx):
+    self.load_commands()
+    return super().list_commands(ctx)
+
+  def get_command(self, ctx, name):
+    self.load_commands()
+    return super().get_command(ctx, name)
+
+def create_app(config_name=None):
+  # config_name is a key of config.configs, FYYUR_CONFIG by default.
+  app = Flask(__name__)
+  app.config.from_object(config.configs[config_name or os.environ.get('FYYUR_CONFIG', 'development')])
+  if not app.config['SECRET_KEY']:
+    raise RuntimeError('Set SECRET_KEY (or SECRET_KEY_FILE): every worker must sign sessions '
+      'and CSRF tokens with the same key')
+
+  # Pooled engines record their checkout wait times; slow waits are logged.
+  if 'pool_size' in app.config['SQLALCHEMY_ENGINE_OPTIONS']:
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(
+      app.config['SQLALCHEMY_ENGINE_OPTIONS'], poolclass=TimedQueuePool)
+  pool_stats.slow_checkout_threshold = app.config['DB_POOL_WAIT_WARNING']
+  pool_stats.on_slow_checkout = lambda wait: app.logger.warning(
+    'Waited %.3fs for a database connection', wait)
+
+  db.init_app(app)
+  app.extensions['page_cache'] = make_cache(app.config)
+  app.session_interface = make_session_interface(app.config) or app.session_interface
+
+  # Request hooks run in the order they are added.
+  init_filters(app)
+  init_template_caching(app)
+  init_assets(app)
+  init_replicas(app)
+  init_jobs(app)
+  init_instrumentation(app)
+
+  from venues import venues_bp
+  from artists import artists_bp
+  from shows import shows_bp
+  from api import api_bp
+  for blueprint in (main_bp, venues_bp, artists_bp, shows_bp, api_bp):
+    app.register_blueprint(blueprint)
+  init_async_views(app)
+  app.cli = LazyAppGroup(app.name)
+
+  if not app.debug and app.config['LOG_FILE']:
+    file_handler = FileHandler(app.config['LOG_FILE'])
     file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+      Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
     )
     app.logger.setLevel(logging.INFO)
     file_handler.setLevel(logging.INFO)
     app.logger.addHandler(file_handler)
     app.logger.info('errors')
+  return app
 
 #----------------------------------------------------------------------------#
 # Launch.
@@ -511,11 +1699,15 @@ if not app.debug:
 
 # Default port:
 if __name__ == '__main__':
-    app.run()
+    # The area modules import this one as app; run as a script it is
+    # __main__, and would otherwise be imported a second time.
+    sys.modules['app'] = sys.modules[__name__]
+    create_app().run()
 
 # Or specify port manually:
 '''
 if __name__ == '__main__':
+    sys.modules['app'] = sys.modules[__name__]
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
 '''
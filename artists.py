@@ -0,0 +1,140 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+from flask import Blueprint, render_template, request, flash, redirect, url_for, current_app
+from sqlalchemy.exc import SQLAlchemyError
+from app import db, Genre, Artist, Show, artist_genres, cached_page, after_commit, delete_submission
+from app import artist_data, artist_detail, artist_form_data, artist_values, with_genres, update_from_form
+from app import search_by_name, search_paging, flash_form_errors, load_with_shows_async
+
+#----------------------------------------------------------------------------#
+# Controllers.
+#----------------------------------------------------------------------------#
+
+# Artist pages; create_app() registers them.
+artists_bp = Blueprint('artists', __name__)
+
+#  Artists
+#  ----------------------------------------------------------------
+def artist_query(genre=None, state=None):
+  query = db.session.query(Artist.id, Artist.name)
+  if genre:
+    query = query.join(artist_genres, artist_genres.c.artist_id == Artist.id) \
+      .join(Genre, Genre.id == artist_genres.c.genre_id) \
+      .filter(Genre.name == genre)
+  if state:
+    query = query.filter(Artist.state == state)
+  return query.order_by(Artist.name)
+
+def artist_list(genre=None, state=None):
+  return [{
+    "id": artist_id,
+    "name": name,
+  } for artist_id, name in artist_query(genre, state)]
+
+@artists_bp.route('/artists')
+@cached_page('artists')
+def artists():
+  return render_template('pages/artists.html', artists=artist_list())
+
+@artists_bp.route('/artists/filter')
+def filter_artists():
+  # artists by genre and/or state, e.g. /artists/filter?genre=Jazz&state=CA
+  data = artist_list(genre=request.args.get('genre'), state=request.args.get('state'))
+  return render_template('pages/artists.html', artists=data)
+
+@artists_bp.route('/artists/search', methods=['POST'])
+def search_artists():
+  # case-insensitive partial match on the artist name, ranked best match first.
+  # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
+  # search for "band" should return "The Wild Sax Band".
+  search_term = request.form.get('search_term', '')
+  limit, offset = search_paging(request.form)
+  response = search_by_name(Artist, search_term, limit=limit, offset=offset)
+  return render_template('pages/search_artists.html', results=response, search_term=search_term)
+
+@artists_bp.route('/artists/<int:artist_id>')
+@cached_page('artist:{artist_id}')
+def show_artist(artist_id):
+  # shows the artist page with the given artist_id
+  data = artist_detail(artist_id, past_page=max(request.args.get('past_page', 1, type=int), 1))
+  return render_template('pages/show_artist.html', artist=data)
+
+@artists_bp.route('/artists/<int:artist_id>', methods=['DELETE'])
+def delete_artist(artist_id):
+  return delete_submission(Artist, artist_id)
+
+#  Update
+#  ----------------------------------------------------------------
+@artists_bp.route('/artists/<int:artist_id>/edit', methods=['GET'])
+def edit_artist(artist_id):
+  from forms import ArtistForm
+  artist = Artist.query.get_or_404(artist_id)
+  form = ArtistForm(data=artist_form_data(artist))
+  return render_template('forms/edit_artist.html', form=form, artist=artist)
+
+@artists_bp.route('/artists/<int:artist_id>/edit', methods=['POST'])
+def edit_artist_submission(artist_id):
+  from forms import ArtistForm
+  artist = Artist.query.get_or_404(artist_id)
+  form = ArtistForm()
+  if not form.validate():
+    flash_form_errors(form)
+    return render_template('forms/edit_artist.html', form=form, artist=artist)
+
+  update_from_form(artist, with_genres(artist_values(form)))
+  after_commit('invalidate_artist', key='invalidate_artist:%d' % artist_id, artist_id=artist_id)
+  try:
+    db.session.commit()
+  except SQLAlchemyError:
+    db.session.rollback()
+    current_app.logger.exception('Could not update artist %d', artist_id)
+    flash('An error occurred. Artist ' + form.name.data + ' could not be updated.')
+    return render_template('forms/edit_artist.html', form=form, artist=artist)
+
+  return redirect(url_for('artists.show_artist', artist_id=artist_id))
+
+#  Create Artist
+#  ----------------------------------------------------------------
+
+@artists_bp.route('/artists/create', methods=['GET'])
+def create_artist_form():
+  from forms import ArtistForm
+  form = ArtistForm()
+  return render_template('forms/new_artist.html', form=form)
+
+@artists_bp.route('/artists/create', methods=['POST'])
+def create_artist_submission():
+  # called upon submitting the new artist listing form
+  from forms import ArtistForm
+  form = ArtistForm()
+  if not form.validate():
+    flash_form_errors(form)
+    return render_template('forms/new_artist.html', form=form)
+
+  artist = Artist(**with_genres(artist_values(form)))
+  try:
+    db.session.add(artist)
+    after_commit('invalidate_pages', key='invalidate_pages:artists', keys=['artists'])
+    db.session.commit()
+  except SQLAlchemyError:
+    db.session.rollback()
+    current_app.logger.exception('Could not create artist')
+    flash('An error occurred. Artist ' + form.name.data + ' could not be listed.')
+    return render_template('pages/home.html')
+
+  # on successful db insert, flash success
+  flash('Artist ' + artist.name + ' was successfully listed!')
+  return render_template('pages/home.html')
+
+
+#  Async views
+#  ----------------------------------------------------------------
+# Serves show_artist when ASYNC_VIEWS is set, see init_async_views().
+
+@cached_page('artist:{artist_id}')
+async def show_artist_async(artist_id):
+  past_page = max(request.args.get('past_page', 1, type=int), 1)
+  data = artist_data(await load_with_shows_async(Artist, Show.artist_id, Show.venue, artist_id, past_page))
+  return render_template('pages/show_artist.html', artist=data)
@@ -0,0 +1,186 @@
+import gzip
+import hashlib
+import io
+import json
+import os
+import posixpath
+import re
+import shutil
+
+# Bundles served by the layout, by logical name, in load order. Paths are
+# relative to the static folder.
+BUNDLES = {
+    'main.css': [
+        'css/bootstrap.min.css',
+        'css/layout.main.css',
+        'css/main.css',
+        'css/main.responsive.css',
+        'css/main.quickfix.css',
+    ],
+    'head.js': [
+        'js/libs/modernizr-2.8.2.min.js',
+        'js/libs/moment.min.js',
+    ],
+    # Deferred: script.js wires up elements of the page, so it must run
+    # after the document is parsed.
+    'main.js': [
+        'js/libs/bootstrap-3.1.1.min.js',
+        'js/plugins.js',
+        'js/script.js',
+    ],
+}
+
+# Images are resized to at most this width and converted to WebP next to a
+# recompressed original.
+IMAGES = ['img/front-splash.jpg']
+IMAGE_MAX_WIDTH = 1600
+
+# What the home page loads from static/, for the payload report.
+FIRST_PAGE = ['main.css', 'head.js', 'main.js', 'img/front-splash.jpg']
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json')
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+
+def minify_css(css):
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    # Spaces around ':' are kept: 'a :hover' and 'a:hover' differ.
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    return css.replace(';}', '}').strip()
+
+
+def minify_js(js):
+    # Without rjsmin the sources are only concatenated; most of them are
+    # already minified.
+    try:
+        import rjsmin
+    except ImportError:
+        return js
+    return rjsmin.jsmin(js)
+
+
+def rebase_css_urls(css, source, target):
+    '''Rewrite relative url()s in css read from source so they resolve from target.'''
+    def rebase(match):
+        quote, url = match.groups()
+        if url.startswith(('/', 'data:', 'http:', 'https:', '#')):
+            return match.group(0)
+        path = posixpath.normpath(posixpath.join(posixpath.dirname(source), url))
+        return 'url(%s%s%s)' % (quote, posixpath.relpath(path, posixpath.dirname(target)), quote)
+    return CSS_URL.sub(rebase, css)
+
+
+def fingerprint(name, content):
+    root, ext = posixpath.splitext(name)
+    return '%s.%s%s' % (root, hashlib.sha256(content).hexdigest()[:12], ext)
+
+
+class AssetBuilder(object):
+    '''Builds static/dist: bundles, fingerprinted copies and their manifest.
+
+    The manifest maps logical names ('main.css', 'img/front-splash.jpg') to
+    fingerprinted files under dist/, which can be cached forever since their
+    names change with their content. Text files get .gz and, with the brotli
+    package installed, .br siblings; images are converted to WebP when
+    Pillow is installed.
+    '''
+
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+        self.dist = os.path.join(static_folder, DIST)
+        self.manifest = {}
+
+    def build(self):
+        if os.path.isdir(self.dist):
+            shutil.rmtree(self.dist)
+        os.makedirs(self.dist)
+        for name, sources in BUNDLES.items():
+            self.write(name, self.bundle(name, sources))
+        for name in IMAGES:
+            self.image(name)
+        with open(os.path.join(self.dist, MANIFEST), 'w') as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        return self.manifest
+
+    def bundle(self, name, sources):
+        parts = []
+        for source in sources:
+            with open(os.path.join(self.static_folder, source), encoding='utf-8') as f:
+                text = f.read()
+            if name.endswith('.css'):
+                parts.append(minify_css(rebase_css_urls(text, source, posixpath.join(DIST, name))))
+            else:
+                # A statement ending without a semicolon must not run into
+                # the next file.
+                parts.append(minify_js(text).rstrip() + '\n;')
+        return '\n'.join(parts).encode('utf-8')
+
+    def image(self, name):
+        with open(os.path.join(self.static_folder, name), 'rb') as f:
+            original = f.read()
+        try:
+            from PIL import Image
+        except ImportError:
+            self.write(name, original)
+            return
+        image = Image.open(io.BytesIO(original))
+        if image.width > IMAGE_MAX_WIDTH:
+            image = image.resize((IMAGE_MAX_WIDTH, round(image.height * IMAGE_MAX_WIDTH / image.width)),
+                                 Image.LANCZOS)
+        for fmt, options in (('JPEG', {'quality': 82, 'progressive': True, 'optimize': True}),
+                             ('WEBP', {'quality': 80, 'method': 6})):
+            output = io.BytesIO()
+            image.convert('RGB').save(output, fmt, **options)
+            target = name if fmt == 'JPEG' else posixpath.splitext(name)[0] + '.webp'
+            self.write(target, output.getvalue())
+
+    def write(self, name, content):
+        filename = fingerprint(name, content)
+        path = os.path.join(self.dist, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+        if filename.endswith(COMPRESSIBLE):
+            with open(path + '.gz', 'wb') as f:
+                f.write(gzip.compress(content, 9))
+            try:
+                import brotli
+            except ImportError:
+                pass
+            else:
+                with open(path + '.br', 'wb') as f:
+                    f.write(brotli.compress(content, quality=11))
+        self.manifest[name] = filename
+
+
+def load_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, DIST, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def payload_report(static_folder, manifest):
+    '''Rows of (asset, requests and bytes before, requests and bytes after)
+    for the home page, counting the smallest encoding served for each file.'''
+    def size(path):
+        return os.path.getsize(os.path.join(static_folder, path))
+
+    def served_size(filename):
+        path = posixpath.join(DIST, filename)
+        for suffix in ('.br', '.gz'):
+            if os.path.exists(os.path.join(static_folder, path + suffix)):
+                return size(path + suffix)
+        return size(path)
+
+    rows = []
+    for name in FIRST_PAGE:
+        sources = BUNDLES.get(name, [name])
+        after = manifest.get(posixpath.splitext(name)[0] + '.webp') or manifest[name]
+        rows.append((name, len(sources), sum(size(source) for source in sources), 1, served_size(after)))
+    return rows
@@ -0,0 +1,468 @@
+import importlib
+import itertools
+import json
+import multiprocessing
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, namedtuple
+from http.client import HTTPConnection, HTTPException
+from urllib.parse import urlencode
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+# One request of a benchmark plan; data is form data for POSTs.
+BenchRequest = namedtuple('BenchRequest', 'method url data')
+
+
+def percentile(ordered, fraction):
+    '''Nearest-rank percentile of an already sorted list.'''
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def peak_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class StatementCounter(object):
+    '''Counts the SQL statements this process runs while active.'''
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        event.listen(Engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(Engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        with self._lock:
+            self.count += 1
+
+
+def summarize(latencies, elapsed, statements, statuses):
+    ordered = sorted(latencies)
+    count = len(ordered)
+    return {
+        'requests': count,
+        'statuses': {str(status): n for status, n in sorted(statuses.items(), key=str)},
+        'throughput_rps': round(count / elapsed, 1) if elapsed else None,
+        'mean_ms': round(1000 * sum(ordered) / count, 3) if count else 0.0,
+        'p50_ms': round(1000 * percentile(ordered, 0.50), 3),
+        'p95_ms': round(1000 * percentile(ordered, 0.95), 3),
+        'p99_ms': round(1000 * percentile(ordered, 0.99), 3),
+        'sql_per_request': round(statements / count, 2) if count else 0.0,
+    }
+
+
+def time_calls(call, repeat, warmup=1):
+    '''Times call(i) for i in range(repeat), after warmup untimed calls,
+    and summarizes the latencies as summarize() does requests.'''
+    for i in range(warmup):
+        call(i)
+    latencies = []
+    with StatementCounter() as statements:
+        for i in range(repeat):
+            started = time.perf_counter()
+            call(i)
+            latencies.append(time.perf_counter() - started)
+    result = summarize(latencies, sum(latencies), statements.count, {})
+    del result['statuses']
+    return result
+
+
+def time_concurrent_calls(call, threads, repeat):
+    '''Times call(i) from `threads` threads at once, each making `repeat`
+    calls, and summarizes the latencies as time_calls() does.'''
+    latencies = []
+    lock = threading.Lock()
+    numbers = itertools.count()
+
+    def worker():
+        for j in range(repeat):
+            with lock:
+                i = next(numbers)
+            started = time.perf_counter()
+            call(i)
+            latency = time.perf_counter() - started
+            with lock:
+                latencies.append(latency)
+
+    with StatementCounter() as statements:
+        started = time.perf_counter()
+        workers = [threading.Thread(target=worker) for i in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    result = summarize(latencies, elapsed, statements.count, {})
+    del result['statuses']
+    return result
+
+def traced(call):
+    '''Runs call() under tracemalloc; returns its seconds (slowed by the
+    tracing) and peak allocation in kB.'''
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        call()
+        return round(time.perf_counter() - started, 3), round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class Benchmark(object):
+    '''Times every endpoint of a plan through the Flask test client and,
+    optionally, over HTTP against a local threaded server.
+
+    plan maps endpoint names to functions taking a request number and
+    returning a BenchRequest. before_request, when given, runs before every
+    timed request but outside its timing, e.g. to empty caches.
+    '''
+
+    def __init__(self, app, plan, requests=50, warmup=5, before_request=None):
+        self.app = app
+        self.plan = plan
+        self.requests = requests
+        self.warmup = warmup
+        self.before_request = before_request or (lambda: None)
+
+    def run_client(self):
+        # Without cookies every request starts a fresh session, so flash
+        # messages left by a write do not leak into the next request.
+        client = self.app.test_client(use_cookies=False)
+        results = {}
+        for endpoint, make_request in sorted(self.plan.items()):
+            numbers = itertools.count()
+            for i in range(self.warmup):
+                self._send_client(client, make_request(next(numbers)))
+            latencies, statuses = [], Counter()
+            elapsed = 0.0
+            with StatementCounter() as statements:
+                for i in range(self.requests):
+                    request = make_request(next(numbers))
+                    self.before_request()
+                    started = time.perf_counter()
+                    statuses[self._send_client(client, request)] += 1
+                    latency = time.perf_counter() - started
+                    latencies.append(latency)
+                    elapsed += latency
+            results[endpoint] = summarize(latencies, elapsed, statements.count, statuses)
+            results[endpoint]['peak_alloc_kb'] = self._peak_alloc_kb(client, make_request(next(numbers)))
+        return results
+
+    def run_http(self, endpoints, concurrency=8):
+        '''Drive the given GET endpoints from `concurrency` threads over
+        HTTP; each thread sends self.requests requests per endpoint.'''
+        server = make_server('127.0.0.1', 0, self.app, threaded=True, request_handler=QuietRequestHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        results = {}
+        try:
+            for endpoint in sorted(endpoints):
+                results[endpoint] = self._load(server.server_port, self.plan[endpoint], concurrency)
+        finally:
+            server.shutdown()
+        return results
+
+    def _load(self, port, make_request, concurrency):
+        latencies, statuses = [], Counter()
+        lock = threading.Lock()
+        numbers = itertools.count()
+
+        def worker():
+            for i in range(self.requests):
+                with lock:
+                    request = make_request(next(numbers))
+                connection = HTTPConnection('127.0.0.1', port, timeout=60)
+                started = time.perf_counter()
+                try:
+                    connection.request('GET', request.url)
+                    response = connection.getresponse()
+                    response.read()
+                    status = response.status
+                except (OSError, HTTPException):
+                    status = 'error'
+                latency = time.perf_counter() - started
+                connection.close()
+                with lock:
+                    latencies.append(latency)
+                    statuses[status] += 1
+
+        with StatementCounter() as statements:
+            started = time.perf_counter()
+            workers = [threading.Thread(target=worker) for i in range(concurrency)]
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+            elapsed = time.perf_counter() - started
+        result = summarize(latencies, elapsed, statements.count, statuses)
+        result['concurrency'] = concurrency
+        return result
+
+    def _send_client(self, client, request):
+        response = client.open(request.url, method=request.method, data=request.data)
+        response.get_data()
+        return response.status_code
+
+    def _peak_alloc_kb(self, client, request):
+        # Measured on one extra request: tracing would distort the timings.
+        self.before_request()
+        tracemalloc.start()
+        try:
+            self._send_client(client, request)
+            return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+        finally:
+            tracemalloc.stop()
+
+
+def serve_app(import_name, port):
+    '''Import module:attribute and serve it on port until killed.'''
+    module, _, attribute = import_name.partition(':')
+    app = getattr(importlib.import_module(module), attribute or 'app')
+    make_server('127.0.0.1', port, app, threaded=True, request_handler=QuietRequestHandler).serve_forever()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class WorkerPool(object):
+    '''Worker processes that each import the app afresh, as the workers of
+    a server without preloading do, and serve it on a port of their own.'''
+
+    def __init__(self, import_name, workers=8, startup_timeout=60):
+        self.import_name = import_name
+        self.workers = workers
+        self.startup_timeout = startup_timeout
+        self.ports = []
+        self._processes = []
+
+    def __enter__(self):
+        # Spawned rather than forked: nothing, not even SECRET_KEY, is
+        # inherited from this process except the environment.
+        context = multiprocessing.get_context('spawn')
+        self.ports = [free_port() for i in range(self.workers)]
+        self._processes = [context.Process(target=serve_app, args=(self.import_name, port), daemon=True)
+                           for port in self.ports]
+        for process in self._processes:
+            process.start()
+        deadline = time.monotonic() + self.startup_timeout
+        for process, port in zip(self._processes, self.ports):
+            while True:
+                try:
+                    socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                    break
+                except OSError:
+                    if not process.is_alive() or time.monotonic() > deadline:
+                        self.__exit__()
+                        raise RuntimeError('Worker on port %d did not start' % port)
+                    time.sleep(0.1)
+        return self
+
+    def __exit__(self, *exc_info):
+        for process in self._processes:
+            process.terminate()
+        for process in self._processes:
+            process.join()
+
+
+# Run in a fresh interpreter by measure_startup(): imports the app, then
+# sends it its first requests, and prints the timings as JSON.
+STARTUP_PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+import importlib
+module, _, attribute = sys.argv[1].partition(":")
+app = getattr(importlib.import_module(module), attribute or "app")
+timings = {"import_ms": (time.perf_counter() - started) * 1000, "modules": len(sys.modules), "requests": []}
+client = app.test_client()
+for path in sys.argv[2:]:
+    started = time.perf_counter()
+    response = client.get(path)
+    response.get_data()
+    timings["requests"].append([path, response.status_code, (time.perf_counter() - started) * 1000])
+print(json.dumps(timings))
+'''
+
+
+def slowest_imports(entry, env=None, count=10):
+    '''The top-level packages taking longest to import with the app,
+    from python -X importtime.'''
+    module = entry.partition(':')[0]
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                            env=env, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                            universal_newlines=True)
+    totals = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        fields = line.split('|')
+        name = fields[2].strip()
+        if fields[1].strip().isdigit() and '.' not in name:
+            totals[name] = max(totals.get(name, 0), int(fields[1]))
+    totals.pop(module, None)
+    return [[name, round(micros / 1000, 1)] for name, micros in
+            sorted(totals.items(), key=lambda item: -item[1])[:count]]
+
+
+def measure_startup(entry, paths=('/',), runs=10, env=None):
+    '''Cold start of the app named by entry (module:attribute), in runs
+    fresh interpreters: the import (including building the app), then the
+    first request to each of paths in turn.
+
+    Returns medians and maxima in milliseconds; process_ms is the whole
+    interpreter's run, start-up and exit included.
+    '''
+    samples = []
+    for i in range(runs):
+        started = time.perf_counter()
+        output = subprocess.check_output([sys.executable, '-c', STARTUP_PROBE, entry] + list(paths),
+                                         env=env, stderr=subprocess.DEVNULL)
+        timings = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+        timings['process_ms'] = (time.perf_counter() - started) * 1000
+        samples.append(timings)
+
+    def stats(values):
+        ordered = sorted(values)
+        return {'p50_ms': round(percentile(ordered, 0.5), 1), 'max_ms': round(ordered[-1], 1)}
+
+    requests = []
+    for position, path in enumerate(paths):
+        request = {'path': path, 'status': samples[0]['requests'][position][1]}
+        request.update(stats(sample['requests'][position][2] for sample in samples))
+        requests.append(request)
+    return {
+        'runs': runs,
+        'import': stats(sample['import_ms'] for sample in samples),
+        'first_request': requests[0] if requests else None,
+        'time_to_first_request': stats(sample['import_ms'] + sample['requests'][0][2] for sample in samples)
+            if paths else None,
+        'first_requests': requests,
+        'process': stats(sample['process_ms'] for sample in samples),
+        'modules': samples[0]['modules'],
+    }
+
+
+CSRF_TOKEN = re.compile(r'name="csrf_token"[^>]*value="([^"]*)"')
+
+
+class FormPostLoadTest(object):
+    '''Clients that each fetch a form from one worker and post it back to
+    another, carrying the session cookie and CSRF token they were given,
+    as a load balancer spreading a browser's requests would.
+
+    make_form takes a post number and returns the form data; a post
+    succeeded when its response contains success_text.
+    '''
+
+    def __init__(self, ports, path, make_form, success_text, clients=16, posts=25,
+                 cookie_name='session'):
+        self.ports = ports
+        self.path = path
+        self.make_form = make_form
+        self.success_text = success_text
+        self.clients = clients
+        self.posts = posts
+        self.cookie_name = cookie_name
+
+    def run(self):
+        latencies, outcomes = [], Counter()
+        lock = threading.Lock()
+        numbers = itertools.count()
+
+        def client(offset):
+            cookies = {}
+            for i in range(self.posts):
+                with lock:
+                    number = next(numbers)
+                    form = self.make_form(number)
+                form_port = self.ports[(offset + i) % len(self.ports)]
+                post_port = self.ports[(offset + i + 1) % len(self.ports)]
+                try:
+                    status, body = self._request(form_port, 'GET', cookies)
+                    token = CSRF_TOKEN.search(body)
+                    if status != 200 or not token:
+                        outcome, latency = 'no_form', 0.0
+                    else:
+                        data = urlencode(list(form.items(multi=True)) + [('csrf_token', token.group(1))])
+                        started = time.perf_counter()
+                        status, body = self._request(post_port, 'POST', cookies, data)
+                        latency = time.perf_counter() - started
+                        if status == 200 and self.success_text in body:
+                            outcome = 'succeeded'
+                        elif 'CSRF' in body:
+                            outcome = 'csrf_rejected'
+                        else:
+                            outcome = 'failed'
+                except (OSError, HTTPException):
+                    outcome, latency = 'error', 0.0
+                with lock:
+                    outcomes[outcome] += 1
+                    if latency:
+                        latencies.append(latency)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(self.clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        ordered = sorted(latencies)
+        return {
+            'workers': len(self.ports),
+            'clients': self.clients,
+            'posts': self.clients * self.posts,
+            'outcomes': dict(sorted(outcomes.items())),
+            'posts_per_second': round(self.clients * self.posts / elapsed, 1),
+            'post_p50_ms': round(1000 * percentile(ordered, 0.50), 3),
+            'post_p95_ms': round(1000 * percentile(ordered, 0.95), 3),
+            'post_p99_ms': round(1000 * percentile(ordered, 0.99), 3),
+        }
+
+    def _request(self, port, method, cookies, data=None):
+        headers = {}
+        if cookies:
+            headers['Cookie'] = '; '.join('%s=%s' % item for item in cookies.items())
+        if data is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        connection = HTTPConnection('127.0.0.1', port, timeout=60)
+        try:
+            connection.request(method, self.path, body=data, headers=headers)
+            response = connection.getresponse()
+            body = response.read().decode('utf-8', 'replace')
+            for header in response.headers.get_all('Set-Cookie') or ():
+                name, _, value = header.split(';', 1)[0].partition('=')
+                if name == self.cookie_name:
+                    if value:
+                        cookies[name] = value
+                    else:
+                        cookies.pop(name, None)
+            return response.status, body
+        finally:
+            connection.close()
@@ -0,0 +1,1075 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import os
+import json
+import contextlib
+import time
+import itertools
+import random
+import tempfile
+import subprocess
+from urllib.parse import urlencode
+from datetime import datetime, timedelta
+from flask import render_template, g, current_app
+from flask import before_render_template, template_rendered
+from flask.cli import AppGroup, with_appcontext
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import click
+import config
+import geo
+from importer import form_data
+from cache import make_cache, LRUCache, PageCache
+from fragments import FragmentCacheExtension
+from pool import pool_stats
+from scheduling import find_conflicts, DEFAULT_SHOW_MINUTES
+from seed import DataGenerator, ADJECTIVES as SEARCH_WORDS, VENUE_NOUNS, ARTIST_NOUNS
+from bench import Benchmark, BenchRequest, WorkerPool, FormPostLoadTest, time_calls, traced, peak_rss_kb
+from bench import measure_startup, slowest_imports, summarize, StatementCounter, time_concurrent_calls
+from app import db, page_cache, job_queue, Venue, Artist, Show
+from app import delete_entities, asset_manifest
+from app import search_by_name, SEARCH_PAGE_SIZE, show_listing, show_data, show_cursor
+from app import typeahead_indexes, build_index, TYPEAHEAD_LIMIT
+from app import check_counters, rollover_counters, schedule_conflicts, booked_shows
+from app import ShowArchive, archive_shows, is_partitioned, monthly_partitions, month_start, next_month
+from app import create_show_partition, upcoming_shows_by_venue, SHOWS_PAGE_SIZE
+from app import venues_near, NEAR_RADIUS_KM
+from app import DATETIME_FORMATS, format_datetimes, _format_datetime
+from app import start_statement_timer, record_statement, discard_statement_timer
+from app import start_template_timer, record_template_time, start_request_stats, record_request_stats, dump_profile
+from app import load_with_shows, venue_data, artist_data, init_async_views
+from venues import venue_areas
+from api import API_PAGE_SIZE
+from artists import artist_list, artist_query
+from commands import GENRE_NAMES, insert_rows, seed_database
+
+#----------------------------------------------------------------------------#
+# Benchmark commands.
+#----------------------------------------------------------------------------#
+
+# `flask bench` and its scenarios, `flask loadtest` and `flask startup`.
+# Like commands, create_app() loads this module the first time the command
+# line asks for a command, so serving the app never imports it.
+
+cli = AppGroup()
+
+def report_options(seeded=True):
+  # --output for the JSON report, and --seed for the commands that generate
+  # data or pick rows at random.
+  def decorate(command):
+    command = click.option('--output', type=click.File('w'), default='-',
+      help='File for the JSON report (default: stdout).')(command)
+    if seeded:
+      command = click.option('--seed', 'random_seed', default=0, show_default=True, help='Random seed.')(command)
+    return command
+  return decorate
+
+def generated_form(generator, values):
+  # Form data for a generated venue or artist, as a browser would post it.
+  return form_data(dict(values, genres=generator.genre_names(), website_link=values["website"]))
+
+def bench_plan(rng):
+  # A request builder for every endpoint, against rows of the seeded
+  # database. Writes create, edit and delete rows of their own.
+  venue_ids = [id for id, in db.session.query(Venue.id).order_by(db.func.random()).limit(1000)]
+  artist_ids = [id for id, in db.session.query(Artist.id).order_by(db.func.random()).limit(1000)]
+  if not venue_ids or not artist_ids:
+    raise click.ClickException('No venues or artists; run `flask seed` first')
+  located = db.session.query(Venue.latitude, Venue.longitude) \
+    .filter(Venue.latitude.isnot(None)).limit(100).all() or [(37.7749, -122.4194)]
+  generator = DataGenerator(rng.random(), GENRE_NAMES)
+  first_show = datetime(2100, 1, 1)
+
+  def get(url):
+    return lambda i: BenchRequest('GET', url() if callable(url) else url, None)
+
+  def form(values):
+    return generated_form(generator, values)
+
+  def disposable(model, values):
+    # A row for a delete request to remove, inserted before the timing starts.
+    columns = set(model.__table__.c.keys())
+    result = db.session.execute(model.__table__.insert(),
+      {key: value for key, value in values.items() if key in columns})
+    db.session.commit()
+    return result.inserted_primary_key[0]
+
+  def near():
+    latitude, longitude = rng.choice(located)
+    return '/api/v1/venues/near?lat=%f&lng=%f&radius=25' % (latitude, longitude)
+
+  def typed():
+    # What has been typed so far of a name: one to three words, the last
+    # one partly.
+    name = ('%s %s' % (rng.choice(SEARCH_WORDS), rng.choice(VENUE_NOUNS + ARTIST_NOUNS))).lower()
+    return name[:rng.randint(1, len(name))]
+
+  plan = {
+    "index": get('/'),
+    "venues": get('/venues'),
+    "filter_venues": get(lambda: '/venues/filter?' + urlencode({"genre": rng.choice(GENRE_NAMES)})),
+    "search_venues": lambda i: BenchRequest('POST', '/venues/search', {"search_term": rng.choice(SEARCH_WORDS)}),
+    "show_venue": get(lambda: '/venues/%d' % rng.choice(venue_ids)),
+    "create_venue_form": get('/venues/create'),
+    "create_venue_submission": lambda i: BenchRequest('POST', '/venues/create', form(generator.venue(i))),
+    "edit_venue": get(lambda: '/venues/%d/edit' % rng.choice(venue_ids)),
+    "edit_venue_submission": lambda i: BenchRequest('POST', '/venues/%d/edit' % rng.choice(venue_ids), form(generator.venue(i))),
+    "delete_venue": lambda i: BenchRequest('DELETE', '/venues/%d' % disposable(Venue, generator.venue(i)), None),
+    "artists": get('/artists'),
+    "filter_artists": get(lambda: '/artists/filter?' + urlencode({"genre": rng.choice(GENRE_NAMES)})),
+    "search_artists": lambda i: BenchRequest('POST', '/artists/search', {"search_term": rng.choice(SEARCH_WORDS)}),
+    "show_artist": get(lambda: '/artists/%d' % rng.choice(artist_ids)),
+    "create_artist_form": get('/artists/create'),
+    "create_artist_submission": lambda i: BenchRequest('POST', '/artists/create', form(generator.artist(i))),
+    "edit_artist": get(lambda: '/artists/%d/edit' % rng.choice(artist_ids)),
+    "edit_artist_submission": lambda i: BenchRequest('POST', '/artists/%d/edit' % rng.choice(artist_ids), form(generator.artist(i))),
+    "delete_artist": lambda i: BenchRequest('DELETE', '/artists/%d' % disposable(Artist, generator.artist(i)), None),
+    "shows": get('/shows'),
+    "create_shows": get('/shows/create'),
+    # Each new show gets a slot of its own, so none is refused as a double booking.
+    "create_show_submission": lambda i: BenchRequest('POST', '/shows/create', {
+      "venue_id": rng.choice(venue_ids),
+      "artist_id": rng.choice(artist_ids),
+      "start_time": (first_show + timedelta(hours=3 * i)).strftime('%Y-%m-%d %H:%M:%S'),
+    }),
+    "api_venues": get('/api/v1/venues'),
+    "api_search_venues": get(lambda: '/api/v1/venues/search?' + urlencode({"search_term": rng.choice(SEARCH_WORDS)})),
+    "api_venue": get(lambda: '/api/v1/venues/%d' % rng.choice(venue_ids)),
+    "api_venues_near": get(near),
+    "api_artists": get('/api/v1/artists'),
+    "api_search_artists": get(lambda: '/api/v1/artists/search?' + urlencode({"search_term": rng.choice(SEARCH_WORDS)})),
+    "api_artist": get(lambda: '/api/v1/artists/%d' % rng.choice(artist_ids)),
+    "api_venue_typeahead": get(lambda: '/api/v1/venues/typeahead?' + urlencode({"q": typed()})),
+    "api_artist_typeahead": get(lambda: '/api/v1/artists/typeahead?' + urlencode({"q": typed()})),
+    "api_shows": get('/api/v1/shows'),
+    "metrics": get('/metrics'),
+    "static": get('/static/css/main.css'),
+  }
+  manifest = asset_manifest()
+  if manifest is not None:
+    plan["dist_asset"] = get('/static/dist/' + manifest['main.css'])
+  return plan
+
+def git_commit():
+  try:
+    return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(__file__) or '.',
+      stderr=subprocess.DEVNULL).decode().strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+@cli.group('bench', invoke_without_command=True)
+@click.option('--requests', 'request_count', default=50, show_default=True, help='Timed requests per endpoint.')
+@click.option('--warmup', default=5, show_default=True, help='Untimed requests per endpoint first.')
+@click.option('--http', 'concurrency', default=0, help='Also load the read endpoints over HTTP from this many threads.')
+@click.option('--cold', is_flag=True, help='Empty the page and fragment caches before every request.')
+@click.option('--only', help='Comma separated endpoints to run (default: all).')
+@report_options()
+@click.pass_context
+@with_appcontext
+def bench_command(ctx, request_count, warmup, concurrency, cold, only, random_seed, output):
+  '''Time every route on the current database and report the results as JSON.
+
+  Write routes create, change and delete rows: run it against a database
+  made by `flask seed`, not one whose data matters. The subcommands run
+  narrower scenarios; those given row counts drop and refill every table.
+  '''
+  if ctx.invoked_subcommand is not None:
+    return
+  app = current_app._get_current_object()
+  app.config['WTF_CSRF_ENABLED'] = False
+  plan = bench_plan(random.Random(random_seed))
+  if only:
+    plan = {endpoint: plan[endpoint] for endpoint in only.split(',') if endpoint in plan}
+
+  benchmark = Benchmark(app, plan, request_count, warmup, empty_caches if cold else None)
+  report = {
+    "rows": {model.__tablename__: db.session.query(db.func.count(model.id)).scalar()
+      for model in (Venue, Artist, Show)},
+    "settings": {
+      "requests": request_count,
+      "warmup": warmup,
+      "cold": cold,
+      "cache_type": app.config['CACHE_TYPE'],
+      "async_views": app.config['ASYNC_VIEWS'],
+      "seed": random_seed,
+    },
+    # Plans name endpoints without their blueprint.
+    "skipped": sorted({endpoint.rpartition('.')[2] for endpoint in app.view_functions} - set(plan)),
+  }
+  db.session.remove()
+  report["client"] = benchmark.run_client()
+  if concurrency:
+    read_only = {rule.endpoint.rpartition('.')[2] for rule in app.url_map.iter_rules()
+      if rule.methods - {'HEAD', 'OPTIONS'} == {'GET'} and rule.endpoint.rpartition('.')[2] in plan}
+    report["http"] = benchmark.run_http(read_only, concurrency)
+  report["peak_rss_kb"] = peak_rss_kb()
+  write_report(report, output)
+
+def write_report(report, output):
+  report = dict(report, commit=git_commit(), created_at=datetime.utcnow().isoformat() + 'Z',
+    database=db.engine.dialect.name)
+  json.dump(report, output, indent=2, sort_keys=True)
+  output.write('\n')
+
+def empty_caches():
+  page_cache.clear()
+  if current_app.jinja_env.fragment_cache is not None:
+    current_app.jinja_env.fragment_cache.clear()
+
+def reseed(counts, random_seed=0):
+  # Drops and refills every table, for scenarios run at given row counts.
+  db.session.remove()
+  db.drop_all()
+  db.create_all()
+  return round(seed_database(counts, random_seed), 1)
+
+def time_pages(urls, request_count, warmup=2):
+  # GETs each of {name: url} through the test client, caches emptied first.
+  app = current_app._get_current_object()
+  plan = {name: (lambda i, url=url: BenchRequest('GET', url, None)) for name, url in urls.items()}
+  return Benchmark(app, plan, request_count, warmup, empty_caches).run_client()
+
+def size_list(ctx, param, value):
+  try:
+    return [int(size) for size in value.split(',')]
+  except ValueError:
+    raise click.BadParameter('expected comma separated numbers')
+
+# Scenarios given row counts start from an empty database.
+drops_tables = click.confirmation_option(prompt='This drops every table. Continue?')
+
+#  Benchmark scenarios
+#  ----------------------------------------------------------------
+
+@bench_command.command('scaling')
+@click.option('--venues', 'sizes', default='500,5000,50000', show_default=True, callback=size_list,
+  help='Comma separated venue counts to run at.')
+@click.option('--shows-per-venue', default=10, show_default=True, help='Shows generated per venue.')
+@click.option('--requests', 'request_count', default=10, show_default=True, help='Timed requests per size.')
+@report_options(seeded=False)
+@drops_tables
+def bench_scaling_command(sizes, shows_per_venue, request_count, output):
+  '''Time /venues and its grouped area query as the tables grow.'''
+  runs = []
+  for size in sizes:
+    counts = {"venues": size, "artists": max(1, size // 5), "shows": size * shows_per_venue}
+    seconds = reseed(counts)
+    runs.append({
+      "rows": counts,
+      "seed_s": seconds,
+      "page": time_pages({"venues": '/venues'}, request_count)["venues"],
+      "query": time_calls(lambda i: venue_areas(), request_count),
+    })
+  write_report({"runs": runs}, output)
+
+@bench_command.command('search')
+@click.option('--artists', default=1000000, show_default=True, help='Artists to generate.')
+@click.option('--queries', default=200, show_default=True, help='Search terms to time.')
+@report_options()
+@drops_tables
+def bench_search_command(artists, queries, random_seed, output):
+  '''Time the artist search against a plain ILIKE scan.'''
+  rows = {"venues": 100, "artists": artists, "shows": 1000}
+  seconds = reseed(rows, random_seed)
+  # Terms are pieces of names as someone types them: 3 to 8 characters.
+  rng = random.Random(random_seed)
+  names = [name for name, in db.session.query(Artist.name).order_by(db.func.random()).limit(queries)]
+  terms = []
+  for name in names:
+    start = rng.randrange(max(1, len(name) - 3))
+    terms.append(name[start:start + rng.randint(3, 8)])
+
+  def scan(term):
+    pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    matching = Artist.name.ilike(pattern, escape='\\')
+    query = db.session.query(Artist.id, Artist.name, Artist.upcoming_shows_count).filter(matching)
+    return query.order_by(Artist.name).limit(SEARCH_PAGE_SIZE).all(), query.count()
+
+  started = time.perf_counter()
+  search_by_name(Artist, terms[0])
+  first_search = time.perf_counter() - started
+  write_report({
+    "rows": rows,
+    "seed_s": seconds,
+    "terms": len(terms),
+    # Includes building the in-process index when the database has no
+    # trigram index.
+    "first_search_s": round(first_search, 2),
+    "engine": time_calls(lambda i: search_by_name(Artist, terms[i]), len(terms)),
+    "scan": time_calls(lambda i: scan(terms[i]), len(terms)),
+  }, output)
+
+@bench_command.command('typeahead')
+@click.option('--names', default=1000000, show_default=True, help='Artists to generate.')
+@click.option('--queries', default=500, show_default=True, help='Typed texts to look up.')
+@click.option('--clients', 'levels', default='1,8,32', show_default=True, callback=size_list,
+  help='Comma separated numbers of concurrent clients to run at.')
+@click.option('--requests', 'request_count', default=50, show_default=True,
+  help='Index lookups and endpoint requests per client.')
+@report_options()
+@drops_tables
+def bench_typeahead_command(names, queries, levels, request_count, random_seed, output):
+  '''Time the typeahead index and its endpoint from more and more clients
+  at once.'''
+  app = current_app._get_current_object()
+  rows = {"venues": 100, "artists": names, "shows": 1000}
+  report = {"rows": rows, "seed_s": reseed(rows, random_seed)}
+  # Texts as someone types a name: from one of its words on, cut anywhere.
+  rng = random.Random(random_seed)
+  terms = []
+  for name, in db.session.query(Artist.name).order_by(db.func.random()).limit(queries):
+    words = name.split()
+    text = ' '.join(words[rng.randrange(len(words)):])
+    terms.append(text[:rng.randint(1, len(text))])
+
+  index = typeahead_indexes[Artist]
+  started = time.perf_counter()
+  build_index(index, Artist)
+  report["build_s"] = round(time.perf_counter() - started, 2)
+  report["peak_rss_kb"] = peak_rss_kb()
+  db.session.remove()
+  plan = {"typeahead": lambda i: BenchRequest('GET', '/api/v1/artists/typeahead?'
+    + urlencode({"q": terms[i % len(terms)]}), None)}
+  report["runs"] = [{
+    "clients": clients,
+    "index": time_concurrent_calls(lambda i: index.search(terms[i % len(terms)], TYPEAHEAD_LIMIT),
+      clients, request_count),
+    "endpoint": Benchmark(app, plan, request_count).run_http(['typeahead'], clients)["typeahead"],
+  } for clients in levels]
+  write_report(report, output)
+
+@bench_command.command('listing')
+@click.option('--shows', 'sizes', default='10000,100000,1000000', show_default=True, callback=size_list,
+  help='Comma separated show counts to run at.')
+@click.option('--requests', 'request_count', default=20, show_default=True, help='Timed requests per page.')
+@click.option('--full-max', default=100000, show_default=True,
+  help='Largest table to also render whole, in one render_template() call, and to '
+  'trace allocations for (tracing is slow).')
+@report_options(seeded=False)
+@drops_tables
+def bench_listing_command(sizes, request_count, full_max, output):
+  '''Time /shows pages, the streamed listing and a whole-table render.'''
+  app = current_app._get_current_object()
+  client = app.test_client(use_cookies=False)
+  runs = []
+  for size in sizes:
+    rows = {"venues": 1000, "artists": 2000, "shows": size}
+    run = {"rows": rows, "seed_s": reseed(rows)}
+    middle = db.session.query(Show.start_time, Show.id).order_by(Show.start_time, Show.id) \
+      .offset(size // 2).first()
+    run["pages"] = time_pages({
+      "first": '/shows',
+      "middle": '/shows?' + urlencode({"after": show_cursor(*middle)}),
+    }, request_count)
+
+    def stream(result):
+      empty_caches()
+      started = time.perf_counter()
+      chunks = iter(client.get('/shows?stream=1', buffered=False).response)
+      first = next(chunks, b'')
+      result["stream_first_byte_ms"] = round(1000 * (time.perf_counter() - started), 3)
+      result["stream_bytes"] = len(first) + sum(len(chunk) for chunk in chunks)
+      result["stream_s"] = round(time.perf_counter() - started, 3)
+    stream(run)
+
+    if size <= full_max:
+      run["stream_peak_alloc_kb"] = traced(lambda: stream({}))[1]
+
+      def render_all():
+        with app.test_request_context('/shows'):
+          run["full_bytes"] = len(render_template('pages/shows.html',
+            shows=[show_data(row) for row in show_listing().all()]))
+      run["full_peak_alloc_kb"] = traced(render_all)[1]
+      started = time.perf_counter()
+      render_all()
+      run["full_s"] = round(time.perf_counter() - started, 3)
+    runs.append(run)
+  write_report({"runs": runs}, output)
+
+@bench_command.command('cache')
+@click.option('--requests', 'request_count', default=200, show_default=True, help='Timed requests per page.')
+@click.option('--hot', default=20, show_default=True, help='Venues and artists whose pages are read.')
+@click.option('--write-every', default=10, show_default=True,
+  help='In the last run, reads per show created (each invalidates the pages it appears on).')
+@report_options()
+def bench_cache_command(request_count, hot, write_every, random_seed, output):
+  '''Time the cached pages without the page cache, with it, and with it
+  under writes, on the current database.'''
+  app = current_app._get_current_object()
+  app.config['WTF_CSRF_ENABLED'] = False
+  rng = random.Random(random_seed)
+  plan = bench_plan(rng)
+  venue_ids = [id for id, in db.session.query(Venue.id).order_by(Venue.id).limit(hot)]
+  artist_ids = [id for id, in db.session.query(Artist.id).order_by(Artist.id).limit(hot)]
+  pages = {
+    "venues": lambda i: BenchRequest('GET', '/venues', None),
+    "artists": lambda i: BenchRequest('GET', '/artists', None),
+    "shows": lambda i: BenchRequest('GET', '/shows', None),
+    "show_venue": lambda i: BenchRequest('GET', '/venues/%d' % venue_ids[i % len(venue_ids)], None),
+    "show_artist": lambda i: BenchRequest('GET', '/artists/%d' % artist_ids[i % len(artist_ids)], None),
+  }
+  # New shows take slots after every show made so far, so none is refused.
+  writes = itertools.count(db.session.query(db.func.count(Show.id)).scalar())
+  client = app.test_client(use_cookies=False)
+
+  def write_sometimes():
+    number = next(writes)
+    if number % write_every == 0:
+      request = plan["create_show_submission"](number)
+      client.open(request.url, method=request.method, data=request.data)
+
+  runs = {}
+  for name, cache_type, before_request in (
+      ("without", 'null', empty_caches),
+      ("with", 'simple', None),
+      ("with_writes", 'simple', write_sometimes)):
+    app.extensions['page_cache'] = make_cache(dict(app.config, CACHE_TYPE=cache_type))
+    db.session.remove()
+    runs[name] = {
+      "pages": Benchmark(app, pages, request_count, 5, before_request).run_client(),
+      "hits": page_cache.hits,
+      "misses": page_cache.misses,
+    }
+  write_report({"hot": hot, "write_every": write_every, "runs": runs}, output)
+
+def query_plan(query):
+  # How the database runs a query, one line per step.
+  sql = str(query.statement.compile(db.engine, compile_kwargs={"literal_binds": True}))
+  if db.engine.dialect.name == 'sqlite':
+    return [row[-1] for row in db.session.execute('EXPLAIN QUERY PLAN ' + sql)]
+  return [row[0] for row in db.session.execute('EXPLAIN ' + sql)]
+
+@bench_command.command('genres')
+@click.option('--artists', default=1000000, show_default=True, help='Artists to generate.')
+@click.option('--queries', default=50, show_default=True, help='Timed queries per filter.')
+@report_options()
+@drops_tables
+def bench_genres_command(artists, queries, random_seed, output):
+  '''Time the genre and state artist filters.'''
+  rows = {"venues": 1000, "artists": artists, "shows": 10000}
+  seconds = reseed(rows, random_seed)
+  rng = random.Random(random_seed)
+  states = [state for state, in db.session.query(Artist.state).distinct()]
+  filters = {
+    "genre": lambda: {"genre": rng.choice(GENRE_NAMES)},
+    "genre_state": lambda: {"genre": rng.choice(GENRE_NAMES), "state": rng.choice(states)},
+    "state": lambda: {"state": rng.choice(states)},
+  }
+  results = {}
+  for name, make_filter in filters.items():
+    arguments = [make_filter() for i in range(queries)]
+    matched = [len(artist_list(**kwargs)) for kwargs in arguments[:5]]
+    results[name] = {
+      "artists_matched_avg": sum(matched) // len(matched),
+      "query": time_calls(lambda i: artist_list(**arguments[i]), queries),
+      "page": time_pages({"page": '/artists/filter?' + urlencode(arguments[0])}, min(queries, 10))["page"],
+      "plan": query_plan(artist_query(**arguments[0])),
+    }
+  write_report({"rows": rows, "seed_s": seconds, "filters": results}, output)
+
+@bench_command.command('concurrency')
+@click.option('--clients', 'levels', default='32,64,128', show_default=True, callback=size_list,
+  help='Comma separated numbers of concurrent clients to run at.')
+@click.option('--requests', 'request_count', default=10, show_default=True, help='Requests per client and page.')
+@click.option('--only', default='venues,shows,show_venue,show_artist', show_default=True,
+  help='Comma separated GET endpoints of the route benchmark to load.')
+@report_options()
+def bench_concurrency_command(levels, request_count, only, random_seed, output):
+  '''Load pages over HTTP from more and more clients at once, on the
+  current database, and report the connection pool's checkout waits.
+
+  The page cache is switched off, so every request reaches the database.
+  '''
+  app = current_app._get_current_object()
+  app.extensions['page_cache'] = make_cache(dict(app.config, CACHE_TYPE='null'))
+  plan = bench_plan(random.Random(random_seed))
+  endpoints = [endpoint for endpoint in only.split(',') if endpoint in plan]
+  db.session.remove()
+  runs = []
+  for clients in levels:
+    before = (pool_stats.checkouts, pool_stats.wait_total, pool_stats.timeouts)
+    pool_stats.wait_max = 0.0
+    pages = Benchmark(app, plan, request_count).run_http(endpoints, clients)
+    checkouts = pool_stats.checkouts - before[0]
+    runs.append({
+      "clients": clients,
+      "pages": pages,
+      "pool": {
+        "checkouts": checkouts,
+        "wait_avg_ms": round(1000 * (pool_stats.wait_total - before[1]) / checkouts, 3) if checkouts else None,
+        "wait_max_ms": round(1000 * pool_stats.wait_max, 3),
+        "timeouts": pool_stats.timeouts - before[2],
+      },
+    })
+  write_report({"engine_options": {key: value for key, value in app.config['SQLALCHEMY_ENGINE_OPTIONS'].items()
+    if key != 'poolclass'}, "runs": runs}, output)
+
+def format_datetime_before(value, format='medium'):
+  # The datetime filter as it was: parse the string, re-parse the pattern.
+  import babel.dates
+  import dateutil.parser
+  date = dateutil.parser.parse(value)
+  return babel.dates.format_datetime(date, DATETIME_FORMATS.get(format, format), locale='en')
+
+@bench_command.command('formats')
+@click.option('--count', default=100000, show_default=True, help='Dates formatted per run.')
+@click.option('--distinct', default=500, show_default=True, help='Distinct dates in the repeated runs.')
+@report_options(seeded=False)
+def bench_formats_command(count, distinct, output):
+  '''Time the datetime filter before and after its caches, over distinct
+  and over repeated dates.'''
+  first = datetime(2026, 1, 1, 20)
+  dates = {
+    "distinct": [first + timedelta(minutes=37 * i) for i in range(count)],
+    "repeated": [first + timedelta(minutes=37 * (i % distinct)) for i in range(count)],
+  }
+  runs = {}
+  with current_app.test_request_context():
+    for name, values in dates.items():
+      strings = [str(value) for value in values]
+      timings = {}
+      for label, call in (
+          ("before", lambda: [format_datetime_before(value) for value in strings]),
+          ("after", lambda: format_datetimes(values)),
+          ("after_strings", lambda: format_datetimes(strings))):
+        _format_datetime.cache_clear()
+        started = time.perf_counter()
+        call()
+        seconds = time.perf_counter() - started
+        timings[label] = {"seconds": round(seconds, 3), "us_per_format": round(1e6 * seconds / count, 2)}
+      runs[name] = timings
+    sample = [str(value) for value in dates["distinct"][:1000]]
+    same = [format_datetime_before(value) for value in sample] == format_datetimes(sample)
+  write_report({"count": count, "distinct": distinct, "same_output": same, "runs": runs}, output)
+
+@bench_command.command('etag')
+@click.option('--polls', default=500, show_default=True, help='Conditional polls per endpoint.')
+@click.option('--write-every', default=20, show_default=True,
+  help='Polls per show created, which changes what the endpoints return (0: never).')
+@report_options()
+def bench_etag_command(polls, write_every, random_seed, output):
+  '''Poll the JSON API with If-None-Match, as a client keeping a copy
+  would, on the current database; report the 304 rate, latencies and
+  bytes sent.'''
+  app = current_app._get_current_object()
+  app.config['WTF_CSRF_ENABLED'] = False
+  plan = bench_plan(random.Random(random_seed))
+  venue_id = db.session.query(db.func.min(Venue.id)).scalar()
+  artist_id = db.session.query(db.func.min(Artist.id)).scalar()
+  urls = {
+    "api_venues": '/api/v1/venues',
+    "api_venue": '/api/v1/venues/%d' % venue_id,
+    "api_artists": '/api/v1/artists',
+    "api_artist": '/api/v1/artists/%d' % artist_id,
+    "api_shows": '/api/v1/shows',
+  }
+  writes = itertools.count(db.session.query(db.func.count(Show.id)).scalar())
+  client = app.test_client(use_cookies=False)
+  db.session.remove()
+  results = {}
+  for name, url in sorted(urls.items()):
+    etag, full_size, sent = None, 0, 0
+    latencies, statements = {200: [], 304: []}, {200: 0, 304: 0}
+    for i in range(polls):
+      if write_every and i and i % write_every == 0:
+        request = plan["create_show_submission"](next(writes))
+        client.open(request.url, method=request.method, data=request.data)
+      with StatementCounter() as counter:
+        started = time.perf_counter()
+        response = client.get(url, headers={"If-None-Match": etag} if etag else {})
+        size = len(response.get_data())
+        latency = time.perf_counter() - started
+      if response.status_code == 200:
+        etag, full_size = response.headers.get('ETag'), size
+      latencies.setdefault(response.status_code, []).append(latency)
+      statements[response.status_code] = statements.get(response.status_code, 0) + counter.count
+      sent += size
+    results[name] = {
+      "hit_rate": round(len(latencies[304]) / polls, 3),
+      "bytes_sent": sent,
+      "bytes_without_etags": full_size * polls,
+      "responses": {str(status): summarize(times, sum(times), statements[status], {status: len(times)})
+        for status, times in sorted(latencies.items()) if times},
+    }
+  write_report({"polls": polls, "write_every": write_every, "endpoints": results}, output)
+
+@contextlib.contextmanager
+def instrumentation_off(app):
+  # Detaches what init_instrumentation() and the engine listeners attach,
+  # for a baseline; all of it is put back on exit.
+  listeners = [('before_cursor_execute', start_statement_timer), ('after_cursor_execute', record_statement),
+    ('handle_error', discard_statement_timer)]
+  hooks = [(app.before_request_funcs[None], start_request_stats),
+    (app.after_request_funcs[None], record_request_stats), (app.teardown_request_funcs[None], dump_profile)]
+  signals = [(before_render_template, start_template_timer), (template_rendered, record_template_time)]
+  for name, listener in listeners:
+    event.remove(Engine, name, listener)
+  positions = [(functions, functions.index(hook), hook) for functions, hook in hooks]
+  for functions, position, hook in positions:
+    functions.remove(hook)
+  for signal, receiver in signals:
+    signal.disconnect(receiver, app)
+  try:
+    yield
+  finally:
+    for name, listener in listeners:
+      event.listen(Engine, name, listener)
+    for functions, position, hook in positions:
+      functions.insert(position, hook)
+    for signal, receiver in signals:
+      signal.connect(receiver, app)
+
+def detects_n_plus_one(app):
+  # Loads venues' genres one venue at a time, the textbook N+1, inside
+  # the request hooks, and reports whether it was flagged.
+  threshold = app.config['N_PLUS_ONE_THRESHOLD']
+  with app.test_request_context('/venues'):
+    start_request_stats()
+    stats = g.request_stats
+    for venue in Venue.query.limit(threshold + 1):
+      venue.genres
+    record_request_stats(app.response_class())
+    return bool(stats.repeated_statements(threshold))
+
+@bench_command.command('instrumentation')
+@click.option('--requests', 'request_count', default=100, show_default=True, help='Timed requests per page.')
+@click.option('--only', default='venues,artists,shows,show_venue,show_artist,api_venues,api_shows', show_default=True,
+  help='Comma separated endpoints of the route benchmark to time.')
+@report_options()
+def bench_instrumentation_command(request_count, only, random_seed, output):
+  '''Time pages (caches emptied) without the request instrumentation, with it,
+  and with every request profiled, on the current database; check that an
+  N+1 query is flagged.'''
+  app = current_app._get_current_object()
+  app.extensions['page_cache'] = make_cache(dict(app.config, CACHE_TYPE='null'))
+  plan = bench_plan(random.Random(random_seed))
+  plan = {endpoint: plan[endpoint] for endpoint in only.split(',') if endpoint in plan}
+  db.session.remove()
+  runs = {}
+  with instrumentation_off(app):
+    runs["off"] = Benchmark(app, plan, request_count, before_request=empty_caches).run_client()
+  runs["on"] = Benchmark(app, plan, request_count, before_request=empty_caches).run_client()
+  with tempfile.TemporaryDirectory() as profile_dir:
+    app.config.update(PROFILE_SAMPLE_RATE=1.0, PROFILE_DIR=profile_dir)
+    runs["profiled"] = Benchmark(app, plan, request_count, before_request=empty_caches).run_client()
+    app.config['PROFILE_SAMPLE_RATE'] = 0
+  overhead = {endpoint: {mode: round(runs[mode][endpoint]["mean_ms"] - runs["off"][endpoint]["mean_ms"], 3)
+    for mode in ("on", "profiled")} for endpoint in plan}
+  write_report({"runs": runs, "overhead_ms": overhead, "n_plus_one_detected": detects_n_plus_one(app)}, output)
+
+@bench_command.command('tiles')
+@click.option('--tiles', default=1000, show_default=True, help='Tiles per page.')
+@click.option('--renders', default=20, show_default=True, help='Timed renders per page and mode.')
+@report_options(seeded=False)
+def bench_tiles_command(tiles, renders, output):
+  '''Time rendering the tiled pages without the fragment cache, with it
+  emptied before every render and with it warm, on the current database;
+  and loading every template from source and from bytecode.'''
+  app = current_app._get_current_object()
+  shows = [{
+    "id": row.id,
+    "updated_at": row.updated_at,
+    "start_time": row.start_time,
+    "venue_id": row.venue_id,
+    "venue_name": row.venue_name,
+    "venue_image_link": row.venue_image_link,
+    "artist_id": row.artist_id,
+    "artist_name": row.artist_name,
+    "artist_image_link": row.artist_image_link,
+  } for row in db.session.query(Show.id, Show.updated_at, Show.start_time, Show.venue_id,
+      Venue.name.label('venue_name'), Venue.image_link.label('venue_image_link'), Show.artist_id,
+      Artist.name.label('artist_name'), Artist.image_link.label('artist_image_link'))
+    .join(Venue, Show.venue_id == Venue.id).join(Artist, Show.artist_id == Artist.id)
+    .order_by(Show.id).limit(tiles)]
+  if len(shows) < tiles:
+    raise click.ClickException('Only %d shows; run `flask seed` with more first' % len(shows))
+  areas, venue_count = [], 0
+  for area in venue_areas():
+    if venue_count >= tiles:
+      break
+    areas.append(area)
+    venue_count += len(area["venues"])
+  venue_id, artist_id = shows[0]["venue_id"], shows[0]["artist_id"]
+  venue = venue_data(load_with_shows(Venue, Show.venue_id, Show.artist, venue_id))
+  artist = artist_data(load_with_shows(Artist, Show.artist_id, Show.venue, artist_id))
+  pages = {
+    "shows": ('pages/shows.html', {"shows": shows, "next_cursor": None}),
+    "venues": ('pages/venues.html', {"areas": areas}),
+    "show_venue": ('pages/show_venue.html', {"venue": dict(venue, upcoming_shows=shows, past_shows=[])}),
+    "show_artist": ('pages/show_artist.html', {"artist": dict(artist, upcoming_shows=shows, past_shows=[])}),
+  }
+  fragment_cache = PageCache(LRUCache(app.config['FRAGMENT_CACHE_THRESHOLD'], app.config['FRAGMENT_CACHE_TIMEOUT']))
+  results = {}
+  with app.test_request_context('/'):
+    for name, (template, context) in pages.items():
+      results[name] = {}
+      for mode in ("none", "cold", "warm"):
+        app.jinja_env.fragment_cache = None if mode == "none" else fragment_cache
+        fragment_cache.clear()
+        fragment_cache.hits = fragment_cache.misses = 0
+
+        def render(i):
+          if mode == "cold":
+            fragment_cache.clear()
+          render_template(template, **context)
+        results[name][mode] = dict(time_calls(render, renders),
+          fragment_hits=fragment_cache.hits, fragment_misses=fragment_cache.misses)
+  app.jinja_env.fragment_cache = None
+
+  def load_templates(bytecode_cache):
+    environment = app.create_jinja_environment()
+    environment.add_extension(FragmentCacheExtension)
+    environment.filters.update(app.jinja_env.filters)
+    environment.bytecode_cache = bytecode_cache
+    started = time.perf_counter()
+    for name in environment.list_templates(extensions=['html']):
+      environment.get_template(name)
+    return round(1000 * (time.perf_counter() - started), 1)
+  with tempfile.TemporaryDirectory() as directory:
+    loading = {"source_ms": load_templates(None)}
+    load_templates(FileSystemBytecodeCache(directory))
+    loading["bytecode_ms"] = load_templates(FileSystemBytecodeCache(directory))
+  write_report({"tiles": tiles, "pages": results, "template_loading": loading}, output)
+
+@bench_command.command('async')
+@click.option('--clients', 'levels', default='64,256', show_default=True, callback=size_list,
+  help='Comma separated numbers of concurrent clients to run at.')
+@click.option('--requests', 'request_count', default=10, show_default=True, help='Requests per client and page.')
+@report_options()
+def bench_async_command(levels, request_count, random_seed, output):
+  '''Load /shows and /venues/<id> over HTTP with the sync views, then
+  with the async ones, on the current database.'''
+  app = current_app._get_current_object()
+  app.extensions['page_cache'] = make_cache(dict(app.config, CACHE_TYPE='null'))
+  plan = bench_plan(random.Random(random_seed))
+  db.session.remove()
+  runs = {"sync": {}, "async": {}}
+  for clients in levels:
+    runs["sync"][clients] = Benchmark(app, plan, request_count).run_http(['shows', 'show_venue'], clients)
+  if not app.config['ASYNC_VIEWS']:
+    app.config['ASYNC_VIEWS'] = True
+    try:
+      init_async_views(app)
+    except (RuntimeError, ImportError) as e:
+      runs["async"] = {"error": str(e)}
+  if "error" not in runs["async"]:
+    for clients in levels:
+      runs["async"][clients] = Benchmark(app, plan, request_count).run_http(['shows', 'show_venue'], clients)
+  write_report({"runs": runs}, output)
+
+@bench_command.command('queue')
+@click.option('--requests', 'request_count', default=200, show_default=True, help='Timed posts per form.')
+@report_options()
+def bench_queue_command(request_count, random_seed, output):
+  '''Time the write forms with their follow-up tasks run in the request
+  (JOBS_EAGER) and queued, then drain the queue with a burst worker, on the
+  current database.'''
+  app = current_app._get_current_object()
+  app.config['WTF_CSRF_ENABLED'] = False
+  app.extensions['page_cache'] = make_cache(dict(app.config, CACHE_TYPE='simple'))
+  plan = bench_plan(random.Random(random_seed))
+  # New shows take slots after every show made so far, so none is refused.
+  slots = itertools.count(db.session.query(db.func.count(Show.id)).scalar())
+  posts = {
+    "edit_venue_submission": plan["edit_venue_submission"],
+    "edit_artist_submission": plan["edit_artist_submission"],
+    "create_show_submission": lambda i: plan["create_show_submission"](next(slots)),
+  }
+  # Jobs left by earlier runs would count against this one.
+  job_queue.work(burst=True)
+
+  runs = {}
+  for name, eager in (("eager", True), ("queued", False)):
+    app.config['JOBS_EAGER'] = eager
+    db.session.remove()
+    started = time.perf_counter()
+    runs[name] = {"posts": Benchmark(app, posts, request_count, 5).run_client()}
+    if not eager:
+      runs[name]["queued"] = job_queue.stats()["depth"]["queued"]
+      drained = time.perf_counter()
+      jobs = job_queue.work(burst=True)
+      seconds = time.perf_counter() - drained
+      runs[name]["worker"] = {"jobs": jobs, "seconds": round(seconds, 3),
+        "jobs_per_s": round(jobs / seconds, 1) if seconds else None}
+      stats = job_queue.stats(window=time.perf_counter() - started + 1)
+      runs[name]["jobs"] = {key: round(value, 3) if isinstance(value, float) else value
+        for key, value in stats.items()}
+  write_report({"runs": runs}, output)
+
+@bench_command.command('radius')
+@click.option('--venues', default=1000000, show_default=True, help='Venues to generate.')
+@click.option('--queries', default=200, show_default=True, help='Timed radius searches per radius.')
+@click.option('--scans', default=10, show_default=True, help='Searches also answered by scanning every venue.')
+@click.option('--radius', 'radii', default='%d,50' % NEAR_RADIUS_KM, show_default=True, callback=size_list,
+  help='Comma separated radii in km.')
+@report_options()
+@drops_tables
+def bench_radius_command(venues, queries, scans, radii, random_seed, output):
+  '''Time the venues near a point search against a scan of every venue.'''
+  rows = {"venues": venues, "artists": 1000, "shows": 10000}
+  seconds = reseed(rows, random_seed)
+  # Searches start where venues are, as a reader's location would be.
+  points = db.session.query(Venue.latitude, Venue.longitude) \
+    .filter(Venue.latitude.isnot(None)).order_by(db.func.random()).limit(queries).all()
+
+  def scan(latitude, longitude, radius):
+    nearby = [(distance, id) for distance, id in (
+      (geo.distance_km(latitude, longitude, row.latitude, row.longitude), row.id)
+      for row in db.session.query(Venue.id, Venue.latitude, Venue.longitude).filter(Venue.latitude.isnot(None)))
+      if distance <= radius]
+    return sorted(nearby)[:API_PAGE_SIZE]
+
+  runs = {}
+  for radius in radii:
+    found = [len(venues_near(latitude, longitude, radius, API_PAGE_SIZE)) for latitude, longitude in points]
+    runs[radius] = {
+      "found_avg": round(sum(found) / len(found), 1),
+      "index": time_calls(lambda i: venues_near(*points[i], radius, API_PAGE_SIZE), len(points)),
+      "scan": time_calls(lambda i: scan(*points[i], radius), min(scans, len(points))),
+    }
+  write_report({"rows": rows, "seed_s": seconds, "limit": API_PAGE_SIZE, "radius_km": runs}, output)
+
+@bench_command.command('delete')
+@click.option('--shows', default=100000, show_default=True, help='Shows of the one venue deleted alone.')
+@click.option('--bulk', default=5000, show_default=True,
+  help='Venues, then artists, deleted in one call, out of twice as many.')
+@click.option('--orm/--no-orm', default=True, show_default=True,
+  help='Also delete a venue with as many shows through the ORM, as a baseline.')
+@report_options()
+@drops_tables
+def bench_delete_command(shows, bulk, orm, random_seed, output):
+  '''Time deleting a venue with many shows, and many venues and artists at
+  once, with delete_entities().'''
+  # About 20 shows per venue and artist; the bulk deletes take half of each.
+  rows = {"venues": 2 * bulk, "artists": 2 * bulk, "shows": 40 * bulk}
+  seconds = reseed(rows, random_seed)
+  generator = DataGenerator(random_seed, GENRE_NAMES)
+  artist_ids = [id for id, in db.session.query(Artist.id)]
+  rng = random.Random(random_seed)
+
+  def crowded_venue(number):
+    # A venue booked every three hours from 2000 on, partly past and partly
+    # upcoming, with the counters rebuilt to match.
+    venue = Venue(**generator.venue(2 * bulk + number))
+    db.session.add(venue)
+    db.session.flush()
+    first = datetime(2000, 1, 1) + timedelta(minutes=number)
+    insert_rows(Show.__table__, ({"venue_id": venue.id, "artist_id": rng.choice(artist_ids),
+      "start_time": first + timedelta(hours=3 * i)} for i in range(shows)), 10000)
+    db.session.commit()
+    check_counters(fix=True)
+    return venue.id
+
+  def timed(delete):
+    with StatementCounter() as statements:
+      started = time.perf_counter()
+      deleted = delete()
+      seconds = time.perf_counter() - started
+    return {"deleted": deleted, "seconds": round(seconds, 3), "statements": statements.count}
+
+  def orm_delete(venue_id):
+    # Loads the venue and its shows and deletes each; the Show mapper
+    # events adjust the artists' counters.
+    for show in Show.query.filter_by(venue_id=venue_id):
+      db.session.delete(show)
+    db.session.delete(db.session.get(Venue, venue_id))
+    db.session.commit()
+    return 1
+
+  report = {"rows": rows, "seed_s": seconds, "venue_shows": shows}
+  venue_id = crowded_venue(0)
+  report["one_venue"] = timed(lambda: delete_entities(Venue, [venue_id]))
+  if orm:
+    venue_id = crowded_venue(1)
+    report["one_venue_orm"] = timed(lambda: orm_delete(venue_id))
+  for name, model in (("bulk_venues", Venue), ("bulk_artists", Artist)):
+    ids = [id for id, in db.session.query(model.id).order_by(model.id).limit(bulk)]
+    report[name] = timed(lambda: delete_entities(model, ids))
+  report["wrong_counters"] = check_counters()
+  write_report(report, output)
+
+@bench_command.command('archive')
+@click.option('--history', default=1000000, show_default=True, help='Past shows generated before the seeded ones.')
+@click.option('--years', default=5, show_default=True, help='Years the history spans.')
+@click.option('--shows', default=100000, show_default=True, help='Shows seeded around now, half of them upcoming.')
+@click.option('--days', type=int, help='Archive shows that started more than this many days ago [default: SHOW_ARCHIVE_DAYS].')
+@click.option('--requests', 'request_count', default=50, show_default=True, help='Timed requests per page and query.')
+@report_options()
+@drops_tables
+def bench_archive_command(history, years, shows, days, request_count, random_seed, output):
+  '''Time the upcoming-show queries and /shows over a long history, before
+  and after archiving it.'''
+  if days is None:
+    days = current_app.config['SHOW_ARCHIVE_DAYS']
+  rows = {"venues": 1000, "artists": 2000, "shows": shows}
+  report = {"rows": rows, "history": history, "years": years, "archive_days": days,
+    "seed_s": reseed(rows, random_seed)}
+
+  # The history ends where the seeded shows start and, like them, has no
+  # double bookings: partitions on PostgreSQL refuse them.
+  started = time.monotonic()
+  connection = db.session.connection()
+  end = db.session.query(db.func.min(Show.start_time)).scalar() - timedelta(days=1)
+  slot_length = timedelta(minutes=DEFAULT_SHOW_MINUTES + 60)
+  slots = int(timedelta(days=365 * years) / slot_length)
+  report["partitioned"] = is_partitioned(connection, 'Show')
+  if report["partitioned"]:
+    # Monthly partitions for the history too, so archiving detaches them.
+    existing = monthly_partitions(connection, 'Show')
+    month = month_start(end - slot_length * slots)
+    created = 0
+    while month < month_start(datetime.now()):
+      if month not in existing:
+        create_show_partition(connection, month)
+        created += 1
+      month = next_month(month)
+    report["partitions_created"] = created
+  generator = DataGenerator(random_seed + 1, GENRE_NAMES)
+  venue_ids = [id for id, in db.session.query(Venue.id).order_by(Venue.id)]
+  artist_ids = [id for id, in db.session.query(Artist.id).order_by(Artist.id)]
+  insert_rows(Show.__table__, generator.shows(venue_ids, artist_ids, history,
+    end - slot_length * (slots // 2), DEFAULT_SHOW_MINUTES, slots), 10000)
+  db.session.commit()
+  check_counters(fix=True)
+  report["history_s"] = round(time.monotonic() - started, 1)
+
+  venue_id, past_count = db.session.query(Venue.id, Venue.past_shows_count) \
+    .order_by(Venue.past_shows_count.desc()).first()
+  sample = venue_ids[:100]
+
+  def measure():
+    db.session.remove()
+    return {
+      "show_rows": db.session.query(db.func.count(Show.id)).scalar(),
+      "archived_rows": db.session.query(db.func.count(ShowArchive.id)).scalar(),
+      "queries": {
+        "upcoming_count": time_calls(lambda i: db.session.query(db.func.count(Show.id))
+          .filter(Show.start_time > datetime.now()).scalar(), request_count),
+        "upcoming_by_venue": time_calls(lambda i: upcoming_shows_by_venue(sample), request_count),
+      },
+      "pages": time_pages({
+        "shows": '/shows',
+        "show_venue": '/venues/%d' % venue_id,
+        "show_venue_oldest": '/venues/%d?past_page=%d' % (venue_id, max(1, -(-past_count // SHOWS_PAGE_SIZE))),
+      }, request_count),
+    }
+
+  report["before"] = measure()
+  with StatementCounter() as statements:
+    started = time.perf_counter()
+    rollover_counters()
+    moved = archive_shows(datetime.now() - timedelta(days=days))
+    seconds = time.perf_counter() - started
+  page_cache.clear()
+  report["archive"] = {"moved": moved, "seconds": round(seconds, 3), "statements": statements.count}
+  report["after"] = measure()
+  report["wrong_counters"] = check_counters()
+  write_report(report, output)
+
+@bench_command.command('conflicts')
+@click.option('--proposals', default=10000, show_default=True, help='Shows proposed in the batch.')
+@click.option('--repeat', default=5, show_default=True, help='Timed checks of the batch.')
+@click.option('--one-by-one', default=500, show_default=True,
+  help='Proposals also checked with a query each, as a baseline.')
+@report_options()
+def bench_conflicts_command(proposals, repeat, one_by_one, random_seed, output):
+  '''Time checking a batch of proposed shows for double bookings, on the
+  current database.'''
+  rng = random.Random(random_seed)
+  venue_ids = [id for id, in db.session.query(Venue.id)]
+  artist_ids = [id for id, in db.session.query(Artist.id)]
+  first, last = db.session.query(db.func.min(Show.start_time), db.func.max(Show.start_time)).one()
+  if not venue_ids or not artist_ids or first is None:
+    raise click.ClickException('No shows; run `flask seed` first')
+  hours = int((last - first).total_seconds() // 3600) + 1
+  length = timedelta(minutes=DEFAULT_SHOW_MINUTES)
+  batch = []
+  for i in range(proposals):
+    start = first + timedelta(hours=rng.randrange(hours))
+    batch.append({"venue_id": rng.choice(venue_ids), "artist_id": rng.choice(artist_ids),
+      "start_time": start, "end_time": start + length})
+
+  def one_query(i):
+    show = batch[i]
+    return db.session.query(Show.id).filter(
+      db.or_(Show.venue_id == show["venue_id"], Show.artist_id == show["artist_id"]),
+      Show.start_time < show["end_time"], Show.end_time > show["start_time"]).first()
+
+  with current_app.test_request_context():
+    booked = list(booked_shows(batch))
+    report = {
+      "proposals": proposals,
+      "booked_in_span": len(booked),
+      "conflicting_proposals": len(schedule_conflicts(batch)),
+      "batch": time_calls(lambda i: schedule_conflicts(batch), repeat),
+      "booked_query": time_calls(lambda i: booked_shows(batch), repeat),
+      "interval_index": time_calls(lambda i: find_conflicts(batch, booked), repeat),
+      "one_query_each": time_calls(one_query, min(one_by_one, proposals)),
+    }
+  write_report(report, output)
+
+@cli.command('loadtest')
+@click.option('--workers', default=8, show_default=True, help='Worker processes to start.')
+@click.option('--clients', default=16, show_default=True, help='Concurrent clients.')
+@click.option('--posts', default=25, show_default=True, help='Form posts per client.')
+@report_options()
+def loadtest_command(workers, clients, posts, random_seed, output):
+  '''Post the new venue form through a pool of workers and report the results as JSON.
+
+  Every form is posted to a different worker than the one that rendered
+  it, so its CSRF token and session only validate if the workers share
+  SECRET_KEY and, with server-side sessions, the session store. The
+  workers import wsgi:app in fresh processes with this environment, as
+  production workers do. Exits with status 1 unless every post succeeds.
+  Each post creates a venue: run it against a database made by `flask seed`.
+  '''
+  if not current_app.config.get('WTF_CSRF_ENABLED', True):
+    raise click.ClickException('CSRF protection is off in this configuration')
+  generator = DataGenerator(random_seed, GENRE_NAMES)
+  with WorkerPool('wsgi:app', workers) as pool:
+    result = FormPostLoadTest(pool.ports, '/venues/create',
+      lambda i: generated_form(generator, generator.venue(i)), 'was successfully listed',
+      clients, posts, current_app.session_cookie_name).run()
+  report = {
+    "commit": git_commit(),
+    "created_at": datetime.utcnow().isoformat() + 'Z',
+    "database": db.engine.dialect.name,
+    "settings": {
+      "session_type": current_app.config['SESSION_TYPE'],
+      "shared_secret": bool(config.secret_key()),
+      "seed": random_seed,
+    },
+    "results": result,
+  }
+  json.dump(report, output, indent=2, sort_keys=True)
+  output.write('\n')
+  if result["outcomes"].get('succeeded', 0) != result["posts"]:
+    raise SystemExit(1)
+
+@cli.command('startup')
+@click.option('--runs', default=10, show_default=True, help='Fresh processes to start.')
+@click.option('--path', 'paths', multiple=True, help='Path of a first request, in order (repeatable) '
+  '[default: /, /venues/create, /shows].')
+@click.option('--entry', default='wsgi:app', show_default=True, help='module:attribute of the app to start.')
+@report_options(seeded=False)
+def startup_command(runs, paths, entry, output):
+  '''Time a cold start and report the results as JSON.
+
+  Each run imports the app in a new interpreter with this environment, as
+  a freshly started worker does, then sends it its first requests. The
+  report also lists the packages that take longest to import.
+  '''
+  root = current_app.root_path
+  env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')])))
+  report = {
+    "commit": git_commit(),
+    "created_at": datetime.utcnow().isoformat() + 'Z',
+    "entry": entry,
+    "results": measure_startup(entry, paths or ('/', '/venues/create', '/shows'), runs, env),
+    "slowest_imports": slowest_imports(entry, env),
+  }
+  json.dump(report, output, indent=2, sort_keys=True)
+  output.write('\n')
@@ -0,0 +1,129 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    '''In-process least-recently-used cache whose entries expire after ttl seconds.'''
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisCache(object):
+    '''Cache backed by a Redis-compatible server, shared by every worker.'''
+
+    def __init__(self, url, ttl=300, prefix='fyyur:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_TYPE = 'redis' requires the redis package")
+        self.ttl = ttl
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self._client.get(self.prefix + key)
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key, value, ttl=None):
+        self._client.setex(self.prefix + key, self.ttl if ttl is None else ttl,
+                           pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+    def delete(self, *keys):
+        if keys:
+            self._client.delete(*[self.prefix + key for key in keys])
+
+    def clear(self):
+        for key in self._client.scan_iter(match=self.prefix + '*'):
+            self._client.delete(key)
+
+
+class NullCache(object):
+    '''Stores nothing; used to switch caching off.'''
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def clear(self):
+        pass
+
+
+class PageCache(object):
+    '''Counts hits and misses on top of one of the backends above.'''
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.backend.set(key, value, ttl)
+
+    def invalidate(self, *keys):
+        self.backend.delete(*keys)
+
+    def clear(self):
+        self.backend.clear()
+
+
+def make_cache(config):
+    cache_type = config.get('CACHE_TYPE', 'simple')
+    ttl = config.get('CACHE_DEFAULT_TIMEOUT', 300)
+    if cache_type == 'simple':
+        backend = LRUCache(config.get('CACHE_THRESHOLD', 1024), ttl)
+    elif cache_type == 'redis':
+        backend = RedisCache(config['CACHE_REDIS_URL'], ttl,
+                             config.get('CACHE_KEY_PREFIX', 'fyyur:'))
+    elif cache_type == 'null':
+        backend = NullCache()
+    else:
+        raise ValueError('Unknown CACHE_TYPE %r' % cache_type)
+    return PageCache(backend)
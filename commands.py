@@ -0,0 +1,404 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import os
+import time
+import multiprocessing
+from datetime import datetime, timedelta
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy.exc import SQLAlchemyError
+import click
+from importer import read_rows, batches, form_data, ImportReport
+from assets import AssetBuilder, DIST, load_manifest, payload_report
+from scheduling import DEFAULT_SHOW_MINUTES
+from forms import VenueForm, ArtistForm, ShowForm
+from seed import DataGenerator
+from app import db, page_cache, job_queue, Venue, Artist, Show, Geocode, venue_genres, artist_genres
+from app import venue_values, artist_values, show_values, genres_by_name, delete_entities
+from app import count_shows, check_counters, rollover_counters, schedule_conflicts
+from app import create_show_partitions, archive_shows, is_partitioned
+from app import normalize_place, geocode_places, locate_venue_rows
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+# The `flask` commands. create_app() loads this module the first time the
+# command line asks for a command, so serving the app never imports it.
+
+cli = AppGroup()
+
+GENRE_NAMES = [name for name, label in VenueForm.genres.kwargs['choices']]
+
+IMPORT_KINDS = {
+  'venues': (Venue, VenueForm, venue_values),
+  'artists': (Artist, ArtistForm, artist_values),
+  'shows': (Show, ShowForm, show_values),
+}
+
+def resolve_references(rows, report, model, key):
+  # Shows may reference their artist/venue by <key>_id or by <key>_name;
+  # resolve the whole batch with one query per kind of reference.
+  id_key, name_key = key + '_id', key + '_name'
+  ids, names = set(), set()
+  for line, row, values in rows:
+    if values[id_key]:
+      try:
+        values[id_key] = int(values[id_key])
+        ids.add(values[id_key])
+      except ValueError:
+        pass
+    elif row.get(name_key):
+      names.add(row[name_key])
+
+  known_ids = set()
+  if ids:
+    known_ids = {id for id, in db.session.query(model.id).filter(model.id.in_(ids))}
+  by_name = {}
+  if names:
+    by_name = {name: (id, count) for name, id, count in db.session.query(
+      model.name, db.func.min(model.id), db.func.count(model.id)
+    ).filter(model.name.in_(names)).group_by(model.name)}
+
+  resolved = []
+  for line, row, values in rows:
+    if values[id_key]:
+      if values[id_key] not in known_ids:
+        report.reject(line, row, {id_key: ['No %s with this id' % key]})
+        continue
+    else:
+      id, count = by_name.get(row.get(name_key), (None, 0))
+      if count != 1:
+        report.reject(line, row, {name_key: ['No %s with this name' % key if not count
+          else 'Several %ss have this name' % key]})
+        continue
+      values[id_key] = id
+    resolved.append((line, row, values))
+  return resolved
+
+def reject_conflicts(rows, report):
+  # Shows double booking a venue or artist, against the database or an
+  # earlier row of the batch.
+  conflicts = schedule_conflicts([values for line, row, values in rows])
+  for position, messages in conflicts.items():
+    line, row, values = rows[position]
+    report.reject(line, row, {'conflict': messages})
+  return [row for position, row in enumerate(rows) if position not in conflicts]
+
+GENRE_LINKS = {Venue: (venue_genres, 'venue_id'), Artist: (artist_genres, 'artist_id')}
+
+def insert_ids(connection, table, rows):
+  # INSERTs rows with one executemany; returns their new ids, in order.
+  if connection.dialect.name == 'postgresql':
+    # Taken from the sequence first, so concurrent inserts cannot interleave.
+    ids = [id for id, in connection.execute(db.text(
+      "SELECT nextval(pg_get_serial_sequence(:table, 'id')) FROM generate_series(1, :count)"),
+      {"table": '"%s"' % table.name, "count": len(rows)})]
+    connection.execute(table.insert(), [dict(row, id=id) for row, id in zip(rows, ids)])
+    return ids
+  # SQLite numbers new rows on from the largest id, and the INSERT holds
+  # the write lock until commit, so the batch has the last len(rows) ids.
+  connection.execute(table.insert(), rows)
+  last = connection.execute(db.select([db.func.max(table.c.id)])).scalar()
+  return list(range(last - len(rows) + 1, last + 1))
+
+def insert_with_genres(connection, model, rows):
+  # Venues or artists (column values plus a "genres" list of names) and
+  # their genre links, in one INSERT each.
+  if model is Venue:
+    locate_venue_rows(connection, rows)
+  genres = genres_by_name({name for values in rows for name in values["genres"]})
+  db.session.flush()
+  columns = set(model.__table__.c.keys())
+  ids = insert_ids(connection, model.__table__, [
+    {key: value for key, value in values.items() if key in columns} for values in rows])
+  links, key = GENRE_LINKS[model]
+  link_rows = [{"genre_id": genres[name].id, key: id}
+    for id, values in zip(ids, rows) for name in dict.fromkeys(values["genres"])]
+  if link_rows:
+    connection.execute(links.insert(), link_rows)
+  return ids
+
+@cli.command('import')
+@click.argument('kind', type=click.Choice(sorted(IMPORT_KINDS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'jsonl']),
+  help='Input format, guessed from the file extension by default.')
+@click.option('--batch-size', default=1000, show_default=True,
+  help='Rows validated, inserted and committed per transaction.')
+@click.option('--rejects', type=click.Path(dir_okay=False),
+  help='Where rejected rows are written, PATH.rejects.jsonl by default.')
+def import_command(kind, path, file_format, batch_size, rejects):
+  '''Bulk load venues, artists or shows from a CSV or JSON Lines file.'''
+  model, form_class, values = IMPORT_KINDS[kind]
+  with ImportReport(rejects or path + '.rejects.jsonl') as report:
+    for batch in batches(read_rows(path, file_format), batch_size):
+      rows = []
+      for line, row, errors in batch:
+        if errors is None:
+          form = form_class(formdata=form_data(row), meta={'csrf': False})
+          if form.validate():
+            rows.append((line, row, values(form)))
+            continue
+          errors = form.errors
+        report.reject(line, row, errors)
+      if kind == 'shows':
+        rows = resolve_references(rows, report, Artist, 'artist')
+        rows = resolve_references(rows, report, Venue, 'venue')
+        rows = reject_conflicts(rows, report)
+      if not rows:
+        continue
+
+      try:
+        # Core executemany skips the ORM events: shows are counted, venues
+        # located and genres linked here, a batch at a time.
+        connection = db.session.connection()
+        if kind == 'shows':
+          shows = [values for line, row, values in rows]
+          connection.execute(model.__table__.insert(), shows)
+          count_shows(connection, shows)
+        else:
+          insert_with_genres(connection, model, [values for line, row, values in rows])
+        db.session.commit()
+        report.load(len(rows))
+      except SQLAlchemyError as e:
+        db.session.rollback()
+        for line, row, values in rows:
+          report.reject(line, row, {'database': [str(e.orig if hasattr(e, 'orig') else e)]})
+      click.echo('%s: %s' % (kind, report.summary()), err=True)
+
+  page_cache.clear()
+  click.echo('%s: %s' % (kind, report.summary()))
+
+@cli.group('shows')
+def shows_cli():
+  '''Partition and archive the Show table.'''
+
+@shows_cli.command('partition')
+@click.option('--months', type=int, help='Months ahead to create partitions for [default: SHOW_PARTITION_MONTHS_AHEAD].')
+def partition_command(months):
+  '''Create the monthly Show partitions that do not exist yet (PostgreSQL).'''
+  connection = db.session.connection()
+  if not is_partitioned(connection, 'Show'):
+    click.echo('The Show table is not partitioned; nothing to do')
+    return
+  if months is None:
+    months = current_app.config['SHOW_PARTITION_MONTHS_AHEAD']
+  created = create_show_partitions(connection, months)
+  db.session.commit()
+  click.echo('%d partitions created' % len(created))
+
+@shows_cli.command('archive')
+@click.option('--days', type=int, help='Archive shows that started more than this many days ago [default: SHOW_ARCHIVE_DAYS].')
+def archive_command(days):
+  '''Move long past shows from Show to ShowArchive.'''
+  if days is None:
+    days = current_app.config['SHOW_ARCHIVE_DAYS']
+  rollover_counters()
+  moved = archive_shows(datetime.now() - timedelta(days=days))
+  page_cache.clear()
+  click.echo('%d shows archived' % moved)
+
+@cli.group()
+def counters():
+  '''Maintain the upcoming/past show counters.'''
+
+@counters.command('rollover')
+def rollover_command():
+  '''Move shows that have started since the last rollover to the past counts.'''
+  moved = rollover_counters()
+  page_cache.invalidate('venues')
+  click.echo('%d shows moved to past' % moved)
+
+@counters.command('check')
+@click.option('--fix', is_flag=True, help='Rebuild the counters that are wrong.')
+def check_command(fix):
+  '''Compare the counters with the shows table.'''
+  wrong = check_counters(fix)
+  click.echo('%d venues/artists had wrong counters%s' % (wrong, ' (fixed)' if fix else ''))
+  if wrong and not fix:
+    raise SystemExit(1)
+
+def run_worker(app, burst, poll):
+  with app.app_context():
+    return job_queue.work(burst, poll)
+
+@cli.command('worker')
+@click.option('--processes', default=1, show_default=True, help='Worker processes to start.')
+@click.option('--burst', is_flag=True, help='Exit once no job is due.')
+@click.option('--poll', default=1.0, show_default=True, help='Seconds between polls of an empty queue.')
+def worker_command(processes, burst, poll):
+  '''Run the background jobs queued by the web app.'''
+  app = current_app._get_current_object()
+  if processes == 1:
+    click.echo('%d jobs run' % run_worker(app, burst, poll))
+    return
+  # Connections must not be shared with the forked workers.
+  db.engine.dispose()
+  workers = [multiprocessing.Process(target=run_worker, args=(app, burst, poll)) for i in range(processes)]
+  for worker in workers:
+    worker.start()
+  for worker in workers:
+    worker.join()
+
+@cli.command('delete')
+@click.argument('kind', type=click.Choice(['venues', 'artists']))
+@click.argument('ids', nargs=-1, type=int)
+@click.option('--ids-file', type=click.File(), help='File of ids, one per line.')
+def delete_command(kind, ids, ids_file):
+  '''Delete venues or artists, with their shows.'''
+  ids = list(ids)
+  if ids_file:
+    ids += [int(line) for line in ids_file if line.strip()]
+  deleted = delete_entities({'venues': Venue, 'artists': Artist}[kind], ids)
+  click.echo('%d %s deleted' % (deleted, kind))
+
+@cli.group('geocode')
+def geocode_cli():
+  '''Load offline geocoding data and locate venues with it.'''
+
+@geocode_cli.command('load')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'jsonl']),
+  help='File format (default: from the extension).')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows per INSERT.')
+def geocode_load_command(path, file_format, batch_size):
+  '''Replace the geocoding table with the rows of a CSV or JSON Lines file
+  (state, city, latitude, longitude and optionally address).'''
+  def places():
+    for line, row, error in read_rows(path, file_format):
+      try:
+        if error:
+          raise ValueError(error)
+        place = {
+          "state": normalize_place(row["state"]),
+          "city": normalize_place(row["city"]),
+          "address": normalize_place(row.get("address")),
+          "latitude": float(row["latitude"]),
+          "longitude": float(row["longitude"]),
+        }
+        if not place["state"] or not place["city"] \
+            or not -90 <= place["latitude"] <= 90 or not -180 <= place["longitude"] <= 180:
+          raise ValueError('missing place or coordinates out of range')
+      except (KeyError, TypeError, ValueError) as e:
+        click.echo('line %d skipped: %s' % (line, e), err=True)
+        continue
+      yield place
+
+  loaded = 0
+  db.session.query(Geocode).delete()
+  for batch in batches(places(), batch_size):
+    db.session.execute(Geocode.__table__.insert(), batch)
+    loaded += len(batch)
+  db.session.commit()
+  click.echo('%d places loaded' % loaded)
+
+@geocode_cli.command('venues')
+@click.option('--all', 'relocate', is_flag=True, help='Geocode venues that already have coordinates too.')
+@click.option('--batch-size', default=1000, show_default=True, help='Venues per transaction.')
+def geocode_venues_command(relocate, batch_size):
+  '''Fill in venue coordinates from the geocoding table.'''
+  after, located, missing = 0, 0, 0
+  while True:
+    query = Venue.query.filter(Venue.id > after)
+    if not relocate:
+      query = query.filter(Venue.latitude.is_(None))
+    venues = query.order_by(Venue.id).limit(batch_size).all()
+    if not venues:
+      break
+    coordinates = geocode_places(db.session.connection(),
+      [(venue.city, venue.state, venue.address) for venue in venues])
+    for venue in venues:
+      venue.latitude, venue.longitude = coordinates[(venue.city, venue.state, venue.address)]
+      if venue.latitude is None:
+        missing += 1
+      else:
+        located += 1
+    after = venues[-1].id
+    db.session.commit()
+  page_cache.clear()
+  click.echo('%d venues located, %d not found' % (located, missing))
+
+def insert_rows(table, rows, batch_size):
+  inserted = 0
+  for batch in batches(rows, batch_size):
+    db.session.execute(table.insert(), batch)
+    inserted += len(batch)
+  return inserted
+
+@cli.command('seed')
+@click.option('--scale', default=1.0, show_default=True,
+  help='1 is 100 venues, 200 artists and 700 shows; 10000 is 10M rows.')
+@click.option('--venues', type=int, help='Venues to generate (overrides --scale).')
+@click.option('--artists', type=int, help='Artists to generate (overrides --scale).')
+@click.option('--shows', type=int, help='Shows to generate (overrides --scale).')
+@click.option('--seed', 'random_seed', default=0, show_default=True, help='Random seed.')
+@click.option('--reset', is_flag=True, help='Drop and recreate every table first.')
+@click.option('--batch-size', default=10000, show_default=True, help='Rows per INSERT.')
+def seed_command(scale, venues, artists, shows, random_seed, reset, batch_size):
+  '''Fill an empty database (tables are created as needed) with generated
+  venues, artists and shows.'''
+  counts = {
+    "venues": venues if venues is not None else max(1, int(100 * scale)),
+    "artists": artists if artists is not None else max(1, int(200 * scale)),
+    "shows": shows if shows is not None else int(700 * scale),
+  }
+  if reset:
+    db.drop_all()
+  db.create_all()
+  if db.session.query(Venue.id).first() or db.session.query(Artist.id).first():
+    raise click.ClickException('The database is not empty; use --reset to replace its contents')
+
+  elapsed = seed_database(counts, random_seed, batch_size)
+  total = sum(counts.values())
+  click.echo('%d rows in %.1fs (%d rows/s)' % (total, elapsed, total / elapsed if elapsed else 0))
+
+def seed_database(counts, random_seed=0, batch_size=10000):
+  # Fills the (empty) tables, returns the seconds it took.
+  started = time.monotonic()
+  generator = DataGenerator(random_seed, GENRE_NAMES)
+  genres = genres_by_name(GENRE_NAMES)
+  db.session.flush()
+  genre_ids = {name: genre.id for name, genre in genres.items()}
+  ids = {}
+  for model, links, make in ((Venue, venue_genres, generator.venue), (Artist, artist_genres, generator.artist)):
+    kind = model.__tablename__.lower()
+    insert_rows(model.__table__, (make(i) for i in range(counts[kind + 's'])), batch_size)
+    ids[model] = [id for id, in db.session.query(model.id).order_by(model.id)]
+    insert_rows(links, ({"genre_id": genre_ids[name], kind + "_id": id}
+      for id in ids[model] for name in generator.genre_names()), batch_size)
+    db.session.commit()
+    click.echo('%d %ss' % (len(ids[model]), kind), err=True)
+  # Core INSERTs skip the Show events, so the counters are rebuilt after.
+  insert_rows(Show.__table__, generator.shows(ids[Venue], ids[Artist], counts["shows"],
+    datetime.now(), DEFAULT_SHOW_MINUTES), batch_size)
+  db.session.commit()
+  check_counters(fix=True)
+  page_cache.clear()
+  return time.monotonic() - started
+
+@cli.group('assets')
+def assets_cli():
+  '''Build and measure the static asset bundles.'''
+
+@assets_cli.command('build')
+def build_assets_command():
+  '''Bundle, minify, fingerprint and compress static assets into static/dist.'''
+  manifest = AssetBuilder(current_app.static_folder).build()
+  click.echo('%d assets written to %s' % (len(manifest), os.path.join(current_app.static_folder, DIST)))
+
+@assets_cli.command('report')
+def assets_report_command():
+  '''Compare the home page's static payload before and after the build.'''
+  manifest = load_manifest(current_app.static_folder)
+  if manifest is None:
+    raise click.ClickException('No build found; run `flask assets build` first')
+  rows = payload_report(current_app.static_folder, manifest)
+  click.echo('%-22s %18s %18s' % ('asset', 'before', 'after'))
+  for name, requests_before, bytes_before, requests_after, bytes_after in rows:
+    click.echo('%-22s %2d req %9d B %2d req %9d B' % (name, requests_before, bytes_before, requests_after, bytes_after))
+  totals = [sum(column) for column in list(zip(*rows))[1:]]
+  click.echo('%-22s %2d req %9d B %2d req %9d B' % ('total', *totals))
+
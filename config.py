@@ -1,13 +1,179 @@
 import os
-SECRET_KEY = os.urandom(32)
+
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-# Enable debug mode.
-DEBUG = True
+# Settings are grouped per environment below; the app loads the class named
+# by FYYUR_CONFIG (development, testing or production, default development).
+# Anything deployment specific is read from the environment.
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def env_bool(name, default=False):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+def engine_options(database_uri):
+    # Pool settings only apply to client/server databases; SQLite uses its
+    # own single-connection pools.
+    if database_uri.startswith('sqlite'):
+        return {}
+    options = {
+        'pool_size': env_int('DB_POOL_SIZE', 5),
+        'max_overflow': env_int('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': env_int('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': env_int('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': env_bool('DB_POOL_PRE_PING', True),
+    }
+    statement_timeout = env_int('DB_STATEMENT_TIMEOUT_MS', 0)
+    if statement_timeout and database_uri.startswith('postgres'):
+        options['connect_args'] = {'options': '-c statement_timeout=%d' % statement_timeout}
+    return options
+
+
+def secret_key():
+    # SECRET_KEY, or the contents of the file SECRET_KEY_FILE names (e.g. a
+    # mounted secret).
+    path = os.environ.get('SECRET_KEY_FILE')
+    if path:
+        with open(path) as f:
+            return f.read().strip()
+    return os.environ.get('SECRET_KEY')
+
+
+def replica_binds():
+    # DATABASE_REPLICA_URLS is a comma separated list of read replicas,
+    # registered as the binds replica1, replica2, ...
+    urls = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    return {'replica%d' % i: url for i, url in enumerate(urls, 1)}
+
+
+class Config(object):
+    # Sessions, flash messages and CSRF tokens are signed with SECRET_KEY, so
+    # every worker and node must share it. Production refuses to start
+    # without it; elsewhere each process makes up its own.
+    SECRET_KEY = secret_key() or os.urandom(32)
+    DEBUG = False
+    TESTING = False
+
+    # Connect to the database
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql://localhost:5432/fyyur')
+    SQLALCHEMY_BINDS = replica_binds()
+    # Read-only requests are spread over these binds ('round-robin' or
+    # 'least-connections'); a client that has just written reads from the
+    # primary for DB_REPLICA_STICKY_SECONDS so it sees its own writes.
+    DB_REPLICA_BINDS = sorted(SQLALCHEMY_BINDS)
+    DB_REPLICA_POLICY = os.environ.get('DB_REPLICA_POLICY', 'round-robin')
+    DB_REPLICA_STICKY_SECONDS = env_int('DB_REPLICA_STICKY_SECONDS', 10)
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    SQLALCHEMY_ECHO = env_bool('SQLALCHEMY_ECHO')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Pool checkouts waiting longer than this (seconds) are logged.
+    DB_POOL_WAIT_WARNING = float(os.environ.get('DB_POOL_WAIT_WARNING', 0.1))
+    # Serve /shows, /venues/<id> and /artists/<id> from async views on an
+    # asyncio driver. ASYNC_DATABASE_URL defaults to DATABASE_URL with the
+    # driver swapped (postgresql+asyncpg, sqlite+aiosqlite).
+    ASYNC_VIEWS = env_bool('ASYNC_VIEWS')
+    ASYNC_DATABASE_URL = os.environ.get('ASYNC_DATABASE_URL')
+
+    # Request instrumentation: statements and requests slower than these
+    # (seconds) are logged, as are requests running one statement
+    # N_PLUS_ONE_THRESHOLD times. PROFILE_SAMPLE_RATE (0 to 1) of requests
+    # are profiled into PROFILE_DIR.
+    SLOW_QUERY_SECONDS = float(os.environ.get('SLOW_QUERY_SECONDS', 0.25))
+    SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', 1.0))
+    N_PLUS_ONE_THRESHOLD = env_int('N_PLUS_ONE_THRESHOLD', 5)
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(basedir, 'profiles'))
+    # Outside debug mode the app log (INFO and up) goes to LOG_FILE, relative
+    # to the working directory; empty to leave it to the default handler.
+    LOG_FILE = os.environ.get('LOG_FILE', 'error.log') or None
+
+    # Dates are shown in the best of LANGUAGES for the request's
+    # Accept-Language and, when the client sets a `timezone` cookie, in that
+    # timezone; otherwise in the defaults below (None keeps stored times).
+    LANGUAGES = ['en']
+    BABEL_DEFAULT_LOCALE = 'en'
+    BABEL_DEFAULT_TIMEZONE = os.environ.get('BABEL_DEFAULT_TIMEZONE')
+
+    # Page cache: 'simple' (in-process LRU), 'redis' (shared between workers)
+    # or 'null' to switch caching off.
+    CACHE_TYPE = os.environ.get('CACHE_TYPE', 'simple')
+    CACHE_DEFAULT_TIMEOUT = env_int('CACHE_DEFAULT_TIMEOUT', 300)
+    CACHE_THRESHOLD = env_int('CACHE_THRESHOLD', 1024)
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+
+    # Sessions: 'cookie' (Flask's signed cookie), or 'filesystem' (shared by
+    # the workers of one host) or 'redis' to keep them on the server, with
+    # only a signed session id in the cookie.
+    SESSION_TYPE = os.environ.get('SESSION_TYPE', 'cookie')
+    SESSION_FILE_DIR = os.environ.get('SESSION_FILE_DIR', os.path.join(basedir, '.sessions'))
+    SESSION_REDIS_URL = os.environ.get('SESSION_REDIS_URL', 'redis://localhost:6379/1')
+    SESSION_COOKIE_SECURE = env_bool('SESSION_COOKIE_SECURE')
+    SESSION_COOKIE_SAMESITE = 'Lax'
+
+    # Write requests queue their follow-up work (page cache invalidation) in
+    # the Job table for `flask worker`. Only a shared cache can be
+    # invalidated from another process, so otherwise tasks run eagerly, in
+    # the web process at the end of the request. Failed jobs are retried
+    # after JOB_RETRY_SECONDS, doubling each time.
+    JOBS_EAGER = env_bool('JOBS_EAGER', CACHE_TYPE != 'redis')
+    JOB_MAX_ATTEMPTS = env_int('JOB_MAX_ATTEMPTS', 5)
+    JOB_RETRY_SECONDS = env_int('JOB_RETRY_SECONDS', 10)
+    JOB_TIMEOUT_SECONDS = env_int('JOB_TIMEOUT_SECONDS', 600)
+    JOB_RETENTION_SECONDS = env_int('JOB_RETENTION_SECONDS', 86400)
+
+    # `flask shows archive` moves shows older than SHOW_ARCHIVE_DAYS out of
+    # the Show table. On PostgreSQL, Show is partitioned by month and
+    # `flask shows partition` keeps partitions this many months ahead.
+    SHOW_ARCHIVE_DAYS = env_int('SHOW_ARCHIVE_DAYS', 365)
+    SHOW_PARTITION_MONTHS_AHEAD = env_int('SHOW_PARTITION_MONTHS_AHEAD', 12)
+
+    # Templates are compiled at startup and their bytecode kept in
+    # TEMPLATE_BYTECODE_CACHE_DIR (empty to disable) for the next worker.
+    # Rendered tiles are cached per worker in the fragment cache.
+    TEMPLATE_BYTECODE_CACHE_DIR = os.environ.get('TEMPLATE_BYTECODE_CACHE_DIR', os.path.join(basedir, '.jinja_cache'))
+    TEMPLATE_PRECOMPILE = env_bool('TEMPLATE_PRECOMPILE', True)
+    FRAGMENT_CACHE_THRESHOLD = env_int('FRAGMENT_CACHE_THRESHOLD', 10000)
+    FRAGMENT_CACHE_TIMEOUT = env_int('FRAGMENT_CACHE_TIMEOUT', 3600)
+
+    # Link the bundles built by `flask assets build` instead of the sources.
+    ASSETS_USE_BUILD = env_bool('ASSETS_USE_BUILD', True)
+
+
+class DevelopmentConfig(Config):
+    # Enable debug mode.
+    DEBUG = True
+    ASSETS_USE_BUILD = env_bool('ASSETS_USE_BUILD', False)
+
+
+class TestingConfig(Config):
+    TESTING = True
+    # Only log to a file when LOG_FILE asks for one, so tests leave error.log alone.
+    LOG_FILE = os.environ.get('LOG_FILE') or None
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite://')
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    WTF_CSRF_ENABLED = False
+    CACHE_TYPE = 'null'
+    JOBS_EAGER = True
+    TEMPLATE_BYTECODE_CACHE_DIR = None
+    TEMPLATE_PRECOMPILE = False
+    ASSETS_USE_BUILD = False
+
 
-# Connect to the database
+class ProductionConfig(Config):
+    SECRET_KEY = secret_key()
+    SESSION_COOKIE_SECURE = env_bool('SESSION_COOKIE_SECURE', True)
 
 
-# TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = '<Put your local database url>'
+configs = {
+    'development': DevelopmentConfig,
+    'testing': TestingConfig,
+    'production': ProductionConfig,
+}
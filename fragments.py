@@ -0,0 +1,51 @@
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+
+class FragmentCacheExtension(Extension):
+    '''Adds a {% cache key, version, ... %}...{% endcache %} tag.
+
+    The rendered body is stored in environment.fragment_cache under the given
+    parts plus whatever environment.fragment_cache_vary() returns, so a
+    fragment keyed by an entity's id and last update is re-rendered only when
+    the entity changes. Without a fragment_cache the body is always rendered.
+    A render whose context sets fragment_cache_store to False uses the cached
+    fragments but stores no new ones.
+    '''
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super(FragmentCacheExtension, self).__init__(environment)
+        environment.extend(fragment_cache=None, fragment_cache_vary=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        args = [nodes.ContextReference(), nodes.List(parts)]
+        return nodes.CallBlock(self.call_method('_render', args), [], [], body).set_lineno(lineno)
+
+    def _render(self, context, parts, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        key = self._key_prefix(context) + ':'.join(map(str, parts))
+        fragment = cache.get(key)
+        if fragment is None:
+            fragment = caller()
+            if context.get('fragment_cache_store', True):
+                cache.set(key, fragment)
+        return Markup(fragment)
+
+    def _key_prefix(self, context):
+        # fragment_cache_vary() is called once per render, not once per tile.
+        prefix = getattr(context, '_fragment_key_prefix', None)
+        if prefix is None:
+            vary = self.environment.fragment_cache_vary
+            prefix = 'fragment:' + ''.join('%s:' % part for part in (vary() if vary else ()))
+            context._fragment_key_prefix = prefix
+        return prefix
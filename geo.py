@@ -0,0 +1,99 @@
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+# Stored geohashes are about 5 m across.
+PRECISION = 9
+EARTH_RADIUS_KM = 6371.0088
+
+
+def encode(latitude, longitude, precision=PRECISION):
+    '''Geohash of a point: alternating longitude and latitude bisections,
+    five bits per character, so points in one cell share a prefix.'''
+    south, north, west, east = -90.0, 90.0, -180.0, 180.0
+    chars = []
+    value = bits = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            middle = (west + east) / 2
+            if longitude >= middle:
+                value, west = value * 2 + 1, middle
+            else:
+                value, east = value * 2, middle
+        else:
+            middle = (south + north) / 2
+            if latitude >= middle:
+                value, south = value * 2 + 1, middle
+            else:
+                value, north = value * 2, middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            value = bits = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    '''(height, width) in degrees of a geohash cell.'''
+    return 180.0 / 2 ** (5 * precision // 2), 360.0 / 2 ** ((5 * precision + 1) // 2)
+
+
+def distance_km(latitude1, longitude1, latitude2, longitude2):
+    '''Great-circle (haversine) distance.'''
+    phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+    a = math.sin((phi2 - phi1) / 2) ** 2 + \
+        math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(longitude2 - longitude1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(latitude, longitude, radius_km):
+    '''(south, west, north, east) around the circle. West and east are not
+    wrapped, so west < -180 or east > 180 when the box crosses the
+    antimeridian; near a pole the box spans every longitude.'''
+    angle = radius_km / EARTH_RADIUS_KM
+    south = max(latitude - math.degrees(angle), -90.0)
+    north = min(latitude + math.degrees(angle), 90.0)
+    if south == -90.0 or north == 90.0 or math.sin(angle) >= math.cos(math.radians(latitude)):
+        return south, -180.0, north, 180.0
+    delta = math.degrees(math.asin(math.sin(angle) / math.cos(math.radians(latitude))))
+    return south, longitude - delta, north, longitude + delta
+
+
+def prefix_end(prefix):
+    '''The smallest string above every geohash starting with prefix, or None.'''
+    while prefix and prefix[-1] == BASE32[-1]:
+        prefix = prefix[:-1]
+    if not prefix:
+        return None
+    return prefix[:-1] + BASE32[BASE32.index(prefix[-1]) + 1]
+
+
+def covering_ranges(latitude, longitude, radius_km, max_cells=16):
+    '''Geohash ranges [low, high) holding every point within radius_km.
+
+    Uses the finest cells of which at most max_cells cover the bounding box;
+    adjacent cells are merged into one range. high is None for a range
+    running to the end of the alphabet.
+    '''
+    south, west, north, east = bounding_box(latitude, longitude, radius_km)
+    for precision in range(PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        last_row, columns = int(round(180.0 / height)) - 1, int(round(360.0 / width))
+        rows = range(int((south + 90) // height), min(int((north + 90) // height), last_row) + 1)
+        first_column, last_column = int((west + 180) // width), int((east + 180) // width)
+        if last_column - first_column + 1 >= columns:
+            first_column, last_column = 0, columns - 1
+        if len(rows) * (last_column - first_column + 1) <= max_cells:
+            break
+    cells = sorted({
+        encode(-90 + (row + 0.5) * height, -180 + (column % columns + 0.5) * width, precision)
+        for row in rows for column in range(first_column, last_column + 1)
+    })
+    ranges = []
+    for cell in cells:
+        if ranges and ranges[-1][1] == cell:
+            ranges[-1][1] = prefix_end(cell)
+        else:
+            ranges.append([cell, prefix_end(cell)])
+    return [tuple(item) for item in ranges]
@@ -0,0 +1,41 @@
+import multiprocessing
+import os
+
+# gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Every worker must get the same SECRET_KEY (and, with SESSION_TYPE
+# filesystem, the same SESSION_FILE_DIR) or a form rendered by one worker is
+# refused by the next.
+
+bind = os.environ.get('BIND', '0.0.0.0:%s' % os.environ.get('PORT', '8000'))
+
+# Processes render pages in parallel; threads overlap the database waits
+# within each one. Keep threads at or below DB_POOL_SIZE + DB_MAX_OVERFLOW.
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Workers are restarted after this many requests, at staggered points, so
+# slow leaks cannot build up.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+
+# The app is imported once in the master and the workers are forked from it,
+# sharing the compiled templates and asset manifest.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1').lower() in ('1', 'true', 'yes', 'on')
+# Heartbeat files on tmpfs, so a slow disk cannot get workers killed.
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+forwarded_allow_ips = os.environ.get('FORWARDED_ALLOW_IPS', '127.0.0.1')
+
+
+def post_fork(server, worker):
+    # Connections opened by the master must not be shared with the workers.
+    from app import db
+    from wsgi import app
+    with app.app_context():
+        db.engine.dispose()
@@ -0,0 +1,110 @@
+import csv
+import json
+import time
+from itertools import islice
+
+from werkzeug.datastructures import MultiDict
+
+
+def read_rows(path, file_format=None):
+    '''Yield (line number, row dict, error) for every record in a CSV or JSON Lines file.
+
+    Rows are read lazily so files of any size are processed in constant
+    memory. A JSON line that cannot be decoded is yielded with row None and
+    the decoding error.
+    '''
+    if file_format is None:
+        file_format = 'jsonl' if path.endswith(('.jsonl', '.json')) else 'csv'
+    with open(path, newline='', encoding='utf-8') as f:
+        if file_format == 'csv':
+            for line, row in enumerate(csv.DictReader(f), 2):
+                yield line, row, None
+        else:
+            for line, text in enumerate(f, 1):
+                if not text.strip():
+                    continue
+                try:
+                    row = json.loads(text)
+                except ValueError as e:
+                    yield line, None, {'json': [str(e)]}
+                    continue
+                if isinstance(row, dict):
+                    yield line, row, None
+                else:
+                    yield line, None, {'json': ['Expected an object']}
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def form_data(row):
+    '''Turn an imported row into form data the WTForms classes can validate.
+
+    Lists (and comma separated genres) become repeated keys, booleans and
+    numbers become the strings a browser would have posted.
+    '''
+    data = MultiDict()
+    for name, value in row.items():
+        if value is None:
+            continue
+        if name == 'genres' and isinstance(value, str):
+            value = [genre.strip() for genre in value.split(',') if genre.strip()]
+        if isinstance(value, list):
+            for item in value:
+                data.add(name, str(item))
+        elif isinstance(value, bool):
+            data.add(name, 'y' if value else '')
+        elif name.startswith('seeking_') and str(value).lower() in ('false', 'no', 'n', '0'):
+            data.add(name, '')
+        else:
+            data.add(name, str(value))
+    return data
+
+
+class ImportReport(object):
+    '''Counts loaded and rejected rows and writes rejects as JSON Lines.'''
+
+    def __init__(self, rejects_path):
+        self.rejects_path = rejects_path
+        self.loaded = 0
+        self.rejected = 0
+        self._rejects = None
+        self._started = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._rejects is not None:
+            self._rejects.close()
+
+    @property
+    def rows(self):
+        return self.loaded + self.rejected
+
+    @property
+    def rate(self):
+        elapsed = time.monotonic() - self._started
+        return self.rows / elapsed if elapsed else 0.0
+
+    def load(self, count):
+        self.loaded += count
+
+    def reject(self, line, row, errors):
+        if self._rejects is None:
+            self._rejects = open(self.rejects_path, 'w', encoding='utf-8')
+        self._rejects.write(json.dumps({'line': line, 'row': row, 'errors': errors}, default=str) + '\n')
+        self.rejected += 1
+
+    def summary(self):
+        summary = '%d rows: %d loaded, %d rejected (%.0f rows/s)' % (
+            self.rows, self.loaded, self.rejected, self.rate)
+        if self.rejected:
+            summary += ', rejects written to %s' % self.rejects_path
+        return summary
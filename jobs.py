@@ -0,0 +1,199 @@
+import json
+import logging
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+# What a worker needs of a job it has claimed; attempts includes this one.
+ClaimedJob = namedtuple('ClaimedJob', 'id task payload attempts max_attempts key')
+
+STATES = ('queued', 'running', 'done', 'failed', 'superseded')
+
+
+class JobQueue(object):
+    '''Background jobs kept in a database table and run by worker processes.
+
+    Jobs are inserted in the transaction of the change that needs them, so
+    they exist exactly when that change was committed. A job is claimed by
+    one worker, run, and on failure retried with exponential backoff until
+    max_attempts; a job left running past timeout (its worker died) is
+    retried the same way, so tasks must be safe to run twice.
+
+    A job may carry an idempotency key: while a job with that key is still
+    queued, enqueueing another one with the same key does nothing.
+    '''
+
+    def __init__(self, session, model, logger=None, max_attempts=5, retry_delay=10,
+                 timeout=600, retention=86400):
+        self.session = session
+        self.model = model
+        self.logger = logger or logging.getLogger(__name__)
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+        self.retention = retention
+        self.tasks = {}
+
+    def task(self, fn):
+        '''Register fn as a task, under its name.'''
+        self.tasks[fn.__name__] = fn
+        return fn
+
+    def enqueue(self, task, key=None, delay=0, **payload):
+        if task not in self.tasks:
+            raise ValueError('Unknown task %r' % task)
+        now = datetime.utcnow()
+        self.session.execute(self._insert(), {
+            'task': task,
+            'payload': json.dumps(payload, sort_keys=True),
+            'idempotency_key': key,
+            'state': 'queued',
+            'attempts': 0,
+            'max_attempts': self.max_attempts,
+            'created_at': now,
+            'run_at': now + timedelta(seconds=delay),
+        })
+
+    def _insert(self):
+        table = self.model.__table__
+        dialect = self.session.connection().dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            # No ON CONFLICT: a duplicate key fails the transaction.
+            return table.insert()
+        return insert(table).on_conflict_do_nothing()
+
+    def claim(self):
+        '''Mark the next due job running and return it, or None.'''
+        model = self.model
+        while True:
+            now = datetime.utcnow()
+            # SKIP LOCKED lets PostgreSQL workers pass over each other's
+            # candidates; elsewhere FOR UPDATE is not rendered and the state
+            # check in the UPDATE decides which worker gets the job.
+            job = self.session.query(model) \
+                .filter(model.state == 'queued', model.run_at <= now) \
+                .order_by(model.run_at, model.id) \
+                .with_for_update(skip_locked=True).first()
+            if job is None:
+                self.session.rollback()
+                return None
+            claimed = ClaimedJob(job.id, job.task, job.payload, job.attempts + 1,
+                                 job.max_attempts, job.idempotency_key)
+            updated = self.session.query(model) \
+                .filter(model.id == job.id, model.state == 'queued') \
+                .update({'state': 'running', 'started_at': now, 'finished_at': None,
+                         'attempts': model.attempts + 1}, synchronize_session=False)
+            self.session.commit()
+            if updated:
+                return claimed
+
+    def run(self, job):
+        '''Run a claimed job; returns whether it succeeded.'''
+        try:
+            self.tasks[job.task](**json.loads(job.payload))
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            self.logger.exception('Job %d (%s) failed, attempt %d of %d',
+                                  job.id, job.task, job.attempts, job.max_attempts)
+            self.retry(job, '%s: %s' % (type(e).__name__, e))
+            return False
+        self._update(job.id, state='done', finished_at=datetime.utcnow(), last_error=None)
+        return True
+
+    def retry(self, job, error):
+        now = datetime.utcnow()
+        values = {'finished_at': now, 'last_error': error}
+        if job.attempts >= job.max_attempts:
+            values['state'] = 'failed'
+        elif job.key and self._key_queued(job.key):
+            # A newer job with the same key will do the work.
+            values['state'] = 'superseded'
+        else:
+            delay = self.retry_delay * 2 ** (job.attempts - 1)
+            values.update(state='queued', finished_at=None, run_at=now + timedelta(seconds=delay))
+        self._update(job.id, **values)
+
+    def requeue_stalled(self):
+        model = self.model
+        cutoff = datetime.utcnow() - timedelta(seconds=self.timeout)
+        stalled = self.session.query(model) \
+            .filter(model.state == 'running', model.started_at < cutoff).all()
+        jobs = [ClaimedJob(job.id, job.task, job.payload, job.attempts, job.max_attempts,
+                           job.idempotency_key) for job in stalled]
+        self.session.rollback()
+        for job in jobs:
+            self.logger.warning('Job %d (%s) timed out', job.id, job.task)
+            self.retry(job, 'Timed out after %ds' % self.timeout)
+        return len(jobs)
+
+    def prune(self):
+        '''Delete finished jobs older than retention; failed ones are kept.'''
+        model = self.model
+        cutoff = datetime.utcnow() - timedelta(seconds=self.retention)
+        deleted = self.session.query(model) \
+            .filter(model.state.in_(('done', 'superseded')), model.run_at < cutoff) \
+            .delete(synchronize_session=False)
+        self.session.commit()
+        return deleted
+
+    def work(self, burst=False, poll=1.0, maintenance_interval=60):
+        '''Run jobs until interrupted or, with burst, until none is due.
+        Returns the number of jobs run.'''
+        done = 0
+        maintained = None
+        try:
+            while True:
+                if maintained is None or time.monotonic() - maintained > maintenance_interval:
+                    self.requeue_stalled()
+                    self.prune()
+                    maintained = time.monotonic()
+                job = self.claim()
+                if job is None:
+                    if burst:
+                        return done
+                    time.sleep(poll)
+                    continue
+                self.run(job)
+                done += 1
+        except KeyboardInterrupt:
+            return done
+
+    def stats(self, window=300):
+        '''Queue depth per state, the age of the oldest due job and the wait
+        and run times of the jobs that became due in the last window seconds.'''
+        model = self.model
+        now = datetime.utcnow()
+        depth = dict.fromkeys(STATES, 0)
+        depth.update(self.session.query(model.state, func.count(model.id)).group_by(model.state))
+        oldest = self.session.query(func.min(model.run_at)) \
+            .filter(model.state == 'queued', model.run_at <= now).scalar()
+        recent = self.session.query(model.run_at, model.started_at, model.finished_at) \
+            .filter(model.state == 'done', model.run_at >= now - timedelta(seconds=window)).all()
+        waits = [max((started - run_at).total_seconds(), 0) for run_at, started, finished in recent]
+        runs = [(finished - started).total_seconds() for run_at, started, finished in recent]
+        return {
+            'depth': depth,
+            'lag': (now - oldest).total_seconds() if oldest else 0.0,
+            'finished': len(recent),
+            'wait_avg': sum(waits) / len(waits) if waits else 0.0,
+            'wait_max': max(waits, default=0.0),
+            'run_avg': sum(runs) / len(runs) if runs else 0.0,
+            'run_max': max(runs, default=0.0),
+        }
+
+    def _key_queued(self, key):
+        model = self.model
+        return self.session.query(model.id) \
+            .filter(model.idempotency_key == key, model.state == 'queued').first() is not None
+
+    def _update(self, job_id, **values):
+        self.session.query(self.model).filter(self.model.id == job_id) \
+            .update(values, synchronize_session=False)
+        self.session.commit()
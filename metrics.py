@@ -0,0 +1,100 @@
+import threading
+from collections import Counter, defaultdict
+
+# Upper bounds (seconds) of the request duration histogram buckets.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestStats(object):
+    '''What one request spent its time on; kept on flask.g while it runs.'''
+
+    def __init__(self, started, keep_slowest=5):
+        self.started = started
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.statements = Counter()
+        self.slowest = []
+        self._keep_slowest = keep_slowest
+
+    def record_statement(self, statement, duration):
+        self.sql_count += 1
+        self.sql_time += duration
+        self.statements[statement] += 1
+        if len(self.slowest) < self._keep_slowest or duration > self.slowest[-1][0]:
+            self.slowest.append((duration, statement))
+            self.slowest.sort(key=lambda item: item[0], reverse=True)
+            del self.slowest[self._keep_slowest:]
+
+    def repeated_statements(self, threshold):
+        '''Statements run at least threshold times, the signature of an N+1 query.'''
+        return [(statement, count) for statement, count in self.statements.most_common()
+                if count >= threshold]
+
+
+class _EndpointMetrics(object):
+    def __init__(self):
+        self.requests = 0
+        self.seconds = 0.0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.sql_max_seconds = 0.0
+        self.template_seconds = 0.0
+        self.n_plus_one = 0
+
+
+class RequestMetrics(object):
+    '''Per-endpoint request aggregates, rendered in the Prometheus text format.'''
+
+    def __init__(self):
+        self._endpoints = defaultdict(_EndpointMetrics)
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, duration, stats, n_plus_one=False):
+        with self._lock:
+            metrics = self._endpoints[endpoint or 'unknown']
+            metrics.requests += 1
+            metrics.seconds += duration
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    metrics.buckets[i] += 1
+            metrics.sql_statements += stats.sql_count
+            metrics.sql_seconds += stats.sql_time
+            if stats.slowest:
+                metrics.sql_max_seconds = max(metrics.sql_max_seconds, stats.slowest[0][0])
+            metrics.template_seconds += stats.template_time
+            if n_plus_one:
+                metrics.n_plus_one += 1
+
+    def render(self):
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+            lines = [
+                '# HELP fyyur_request_duration_seconds Request wall time.',
+                '# TYPE fyyur_request_duration_seconds histogram',
+            ]
+            for endpoint, metrics in endpoints:
+                for bound, count in zip(DURATION_BUCKETS, metrics.buckets):
+                    lines.append('fyyur_request_duration_seconds_bucket{endpoint="%s",le="%s"} %d'
+                                 % (endpoint, bound, count))
+                lines.append('fyyur_request_duration_seconds_bucket{endpoint="%s",le="+Inf"} %d'
+                             % (endpoint, metrics.requests))
+                lines.append('fyyur_request_duration_seconds_sum{endpoint="%s"} %f' % (endpoint, metrics.seconds))
+                lines.append('fyyur_request_duration_seconds_count{endpoint="%s"} %d' % (endpoint, metrics.requests))
+            for name, kind, help_text, attribute in (
+                ('fyyur_sql_statements_total', 'counter', 'SQL statements executed.', 'sql_statements'),
+                ('fyyur_sql_seconds_total', 'counter', 'Time spent executing SQL.', 'sql_seconds'),
+                ('fyyur_sql_statement_max_seconds', 'gauge', 'Slowest single SQL statement.', 'sql_max_seconds'),
+                ('fyyur_template_seconds_total', 'counter', 'Time spent rendering templates.', 'template_seconds'),
+                ('fyyur_n_plus_one_requests_total', 'counter', 'Requests that repeated a statement.', 'n_plus_one'),
+            ):
+                lines.append('# HELP %s %s' % (name, help_text))
+                lines.append('# TYPE %s %s' % (name, kind))
+                for endpoint, metrics in endpoints:
+                    lines.append('%s{endpoint="%s"} %s' % (name, endpoint, getattr(metrics, attribute)))
+            return lines
+
+
+def gauge(name, help_text, value, kind='gauge'):
+    return ['# HELP %s %s' % (name, help_text), '# TYPE %s %s' % (name, kind), '%s %s' % (name, value)]
@@ -0,0 +1,45 @@
+import threading
+import time
+
+from sqlalchemy.pool import QueuePool
+
+
+class PoolStats(object):
+    '''Connection checkout wait times, aggregated across every pool.'''
+
+    def __init__(self):
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+        self.slow_checkout_threshold = None
+        self.on_slow_checkout = None
+        self._lock = threading.Lock()
+
+    def record(self, wait, timed_out=False):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            if timed_out:
+                self.timeouts += 1
+        threshold = self.slow_checkout_threshold
+        if self.on_slow_checkout is not None and threshold is not None and wait > threshold:
+            self.on_slow_checkout(wait)
+
+
+pool_stats = PoolStats()
+
+
+class TimedQueuePool(QueuePool):
+    '''QueuePool that records how long each checkout waited for a connection.'''
+
+    def _do_get(self):
+        started = time.perf_counter()
+        timed_out = True
+        try:
+            connection = super(TimedQueuePool, self)._do_get()
+            timed_out = False
+            return connection
+        finally:
+            pool_stats.record(time.perf_counter() - started, timed_out)
@@ -0,0 +1,59 @@
+import itertools
+import threading
+
+from flask import g, has_app_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm
+
+
+class ReplicaRouter(object):
+    '''Picks the replica bind a read-only request is served from.
+
+    policy is 'round-robin', or 'least-connections' to prefer the replica
+    whose pool has the fewest connections checked out.
+    '''
+
+    def __init__(self, binds, engine_for, policy='round-robin'):
+        if policy not in ('round-robin', 'least-connections'):
+            raise ValueError('Unknown replica policy %r' % policy)
+        self.binds = list(binds)
+        self.policy = policy
+        self._engine_for = engine_for
+        self._next = itertools.cycle(self.binds)
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return bool(self.binds)
+
+    def choose(self):
+        if self.policy == 'least-connections':
+            return min(self.binds, key=self._checked_out)
+        with self._lock:
+            return next(self._next)
+
+    def _checked_out(self, bind):
+        checkedout = getattr(self._engine_for(bind).pool, 'checkedout', None)
+        return checkedout() if checkedout is not None else 0
+
+
+class RoutingSession(SignallingSession):
+    '''Session that reads from the bind named by g.db_bind, when set.
+
+    Flushes always go to the bind the model would normally use, so a
+    request routed to a replica still cannot write to it.
+    '''
+
+    def __init__(self, db, **options):
+        self.db = db
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        bind = g.get('db_bind') if has_app_context() else None
+        if bind is not None and not self._flushing:
+            return self.db.get_engine(self.app, bind=bind)
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
@@ -0,0 +1,79 @@
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import timedelta
+from operator import itemgetter
+
+# Show length in minutes.
+DEFAULT_SHOW_MINUTES = 120
+MAX_SHOW_MINUTES = 24 * 60
+
+
+class IntervalIndex(object):
+    '''Half-open [start, end) intervals per key, e.g. the bookings of each venue.
+
+    Intervals are kept sorted by start. An interval overlapping [start, end)
+    starts before end and, being no longer than the longest one indexed,
+    after start minus that length; a lookup bisects to that window and only
+    compares the ends inside it.
+    '''
+
+    def __init__(self):
+        self._starts = defaultdict(list)
+        self._intervals = defaultdict(list)
+        self.max_length = timedelta(0)
+
+    def add(self, key, start, end, value=None):
+        starts = self._starts[key]
+        position = bisect_right(starts, start)
+        starts.insert(position, start)
+        self._intervals[key].insert(position, (start, end, value))
+        self.max_length = max(self.max_length, end - start)
+
+    def extend(self, intervals):
+        '''Add (key, start, end, value) tuples, sorting each key's intervals once.'''
+        touched = set()
+        longest = self.max_length
+        for key, start, end, value in intervals:
+            self._intervals[key].append((start, end, value))
+            if end - start > longest:
+                longest = end - start
+            touched.add(key)
+        self.max_length = longest
+        for key in touched:
+            self._intervals[key].sort(key=itemgetter(0))
+            self._starts[key] = [start for start, end, value in self._intervals[key]]
+
+    def overlapping(self, key, start, end):
+        starts = self._starts.get(key)
+        if not starts:
+            return []
+        low = bisect_right(starts, start - self.max_length)
+        high = bisect_left(starts, end)
+        return [interval for interval in self._intervals[key][low:high] if interval[1] > start]
+
+
+def find_conflicts(proposed, booked=()):
+    '''Check proposed shows against booked ones and against each other.
+
+    Shows are mappings with venue_id, artist_id, start_time and end_time.
+    Returns {position in proposed: [('venue' or 'artist', show), ...]}.
+    Proposals are accepted in order, so of two overlapping proposals only
+    the later one is reported.
+    '''
+    booked = list(booked)
+    venues, artists = IntervalIndex(), IntervalIndex()
+    venues.extend((show['venue_id'], show['start_time'], show['end_time'], show) for show in booked)
+    artists.extend((show['artist_id'], show['start_time'], show['end_time'], show) for show in booked)
+
+    conflicts = {}
+    for position, show in enumerate(proposed):
+        found = [('venue', other) for start, end, other in
+                 venues.overlapping(show['venue_id'], show['start_time'], show['end_time'])]
+        found += [('artist', other) for start, end, other in
+                  artists.overlapping(show['artist_id'], show['start_time'], show['end_time'])]
+        if found:
+            conflicts[position] = found
+            continue
+        venues.add(show['venue_id'], show['start_time'], show['end_time'], show)
+        artists.add(show['artist_id'], show['start_time'], show['end_time'], show)
+    return conflicts
@@ -0,0 +1,228 @@
+import heapq
+import re
+import threading
+import time
+from array import array
+from collections import defaultdict
+
+WORD = re.compile(r'\w+')
+
+
+def ngrams(text, n=3):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def normalize(text):
+    # Lowercased words separated by single spaces.
+    return ' '.join(WORD.findall((text or '').lower()))
+
+
+def word_starts(text):
+    return [0] + [i + 1 for i, char in enumerate(text) if char == ' ']
+
+
+def rank(name, term):
+    # Sort key for a lowercased name containing term: names starting with the
+    # term first, then matches at a word boundary, then earlier and shorter.
+    position = name.find(term)
+    word_start = position == 0 or not name[position - 1].isalnum()
+    return (position != 0, not word_start, position, len(name), name)
+
+
+class NgramIndex(object):
+    '''Inverted n-gram index over entity names.
+
+    Used for case-insensitive partial matching when the database has no
+    trigram index. Postings hold distinct names, each naming the keys that
+    carry it, so a name shared by many entities is checked and ranked once.
+    Candidates are the intersection of the posting sets of the term's
+    n-grams (every name, for a term shorter than an n-gram), checked
+    against the name and returned ranked.
+    '''
+
+    def __init__(self, n=3):
+        self.n = n
+        self.built = False
+        self.built_at = None
+        self._postings = defaultdict(set)
+        self._names = {}
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._names)
+
+    def build(self, rows):
+        with self._lock:
+            self._postings.clear()
+            self._names.clear()
+            self._keys.clear()
+            for key, name in rows:
+                self._add(key, name)
+            self.built = True
+            self.built_at = time.monotonic()
+
+    def add(self, key, name):
+        with self._lock:
+            self._remove(key)
+            self._add(key, name)
+
+    def remove(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def search(self, term):
+        '''Return the ranked keys whose name contains term.'''
+        return self.search_page(term, len(self._names))[1]
+
+    def search_page(self, term, limit, offset=0):
+        '''Return (count, keys): how many keys match term, and the ranked
+        keys from offset to offset + limit. Only the names needed for that
+        page are sorted.
+        '''
+        term = term.lower()
+        with self._lock:
+            if len(term) < self.n:
+                candidates = self._keys
+            else:
+                postings = sorted(
+                    (self._postings.get(gram, ()) for gram in ngrams(term, self.n)),
+                    key=len
+                )
+                candidates = set(postings[0])
+                for posting in postings[1:]:
+                    if not candidates:
+                        break
+                    candidates.intersection_update(posting)
+            matches = [name for name in candidates if term in name]
+            count = sum(len(self._keys[name]) for name in matches)
+            # Every name carries at least one key, so the first
+            # offset + limit names cover the page.
+            keys = []
+            for name in heapq.nsmallest(offset + limit, matches, key=lambda name: rank(name, term)):
+                keys.extend(sorted(self._keys[name]))
+                if len(keys) >= offset + limit:
+                    break
+            return count, keys[offset:offset + limit]
+
+    def _add(self, key, name):
+        name = (name or '').lower()
+        self._names[key] = name
+        keys = self._keys.get(name)
+        if keys is None:
+            self._keys[name] = {key}
+            for gram in ngrams(name, self.n):
+                self._postings[gram].add(name)
+        else:
+            keys.add(key)
+
+    def _remove(self, key):
+        name = self._names.pop(key, None)
+        if name is None:
+            return
+        keys = self._keys[name]
+        keys.discard(key)
+        if keys:
+            return
+        del self._keys[name]
+        for gram in ngrams(name, self.n):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(name)
+                if not posting:
+                    del self._postings[gram]
+
+
+class PrefixIndex(object):
+    '''Sorted array of name suffixes starting at a word, for typeahead.
+
+    A name matches when some word of it, followed by the next words, starts
+    with the typed text: "pianos b" finds "The Dueling Pianos Bar". Names
+    are stored once, lowercased with their words separated by single
+    spaces; an entry is a (key, offset) pair naming the suffix from one of
+    its words. Entries are kept sorted by suffix in two parallel arrays, so
+    the matches for a text are one range, found by bisection. Adding or
+    removing a name inserts or deletes its entries in place.
+    '''
+
+    def __init__(self):
+        self.built = False
+        self.built_at = None
+        self._names = {}
+        self._keys = array('q')
+        self._offsets = array('I')
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._names)
+
+    def build(self, rows):
+        # Built aside and swapped in, so lookups go on meanwhile.
+        names, entries = {}, []
+        for key, name in rows:
+            text = names[key] = normalize(name)
+            entries.extend((text[offset:], key, offset) for offset in word_starts(text))
+        entries.sort()
+        with self._lock:
+            self._names = names
+            self._keys = array('q', [key for suffix, key, offset in entries])
+            self._offsets = array('I', [offset for suffix, key, offset in entries])
+            self.built = True
+            self.built_at = time.monotonic()
+
+    def add(self, key, name):
+        with self._lock:
+            self._remove(key)
+            text = self._names[key] = normalize(name)
+            for offset in word_starts(text):
+                position = self._bisect(text[offset:], key)
+                self._keys.insert(position, key)
+                self._offsets.insert(position, offset)
+
+    def remove(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def search(self, term, limit=10):
+        '''Return up to limit keys whose name matches term, names starting
+        with it first.'''
+        text = normalize(term)
+        if not text:
+            return []
+        matches = []
+        with self._lock:
+            names, keys, offsets = self._names, self._keys, self._offsets
+            position = self._bisect(text)
+            while position < len(keys) and len(matches) < limit:
+                key = keys[position]
+                if not names[key].startswith(text, offsets[position]):
+                    break
+                if key not in matches:
+                    matches.append(key)
+                position += 1
+            return sorted(matches, key=lambda key: (not names[key].startswith(text), names[key]))
+
+    def _bisect(self, text, key=-1):
+        # Position of the first entry not below (text, key).
+        names, keys, offsets = self._names, self._keys, self._offsets
+        low, high = 0, len(keys)
+        while low < high:
+            middle = (low + high) // 2
+            entry = keys[middle]
+            suffix = names[entry][offsets[middle]:]
+            if suffix < text or (suffix == text and entry < key):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _remove(self, key):
+        text = self._names.get(key)
+        if text is None:
+            return
+        for offset in word_starts(text):
+            position = self._bisect(text[offset:], key)
+            if position < len(self._keys) and self._keys[position] == key and self._offsets[position] == offset:
+                del self._keys[position]
+                del self._offsets[position]
+        del self._names[key]
@@ -0,0 +1,139 @@
+import math
+import random
+from datetime import timedelta
+
+import geo
+
+# (city, state, latitude, longitude) of the places generated rows are in.
+CITIES = [
+    ('New York', 'NY', 40.7128, -74.0060),
+    ('Brooklyn', 'NY', 40.6782, -73.9442),
+    ('Los Angeles', 'CA', 34.0522, -118.2437),
+    ('San Francisco', 'CA', 37.7749, -122.4194),
+    ('Oakland', 'CA', 37.8044, -122.2712),
+    ('Chicago', 'IL', 41.8781, -87.6298),
+    ('Houston', 'TX', 29.7604, -95.3698),
+    ('Austin', 'TX', 30.2672, -97.7431),
+    ('Nashville', 'TN', 36.1627, -86.7816),
+    ('Memphis', 'TN', 35.1495, -90.0490),
+    ('New Orleans', 'LA', 29.9511, -90.0715),
+    ('Seattle', 'WA', 47.6062, -122.3321),
+    ('Portland', 'OR', 45.5152, -122.6784),
+    ('Denver', 'CO', 39.7392, -104.9903),
+    ('Atlanta', 'GA', 33.7490, -84.3880),
+    ('Miami', 'FL', 25.7617, -80.1918),
+    ('Boston', 'MA', 42.3601, -71.0589),
+    ('Philadelphia', 'PA', 39.9526, -75.1652),
+    ('Detroit', 'MI', 42.3314, -83.0458),
+    ('Minneapolis', 'MN', 44.9778, -93.2650),
+]
+
+ADJECTIVES = ['Blue', 'Velvet', 'Golden', 'Electric', 'Rusty', 'Midnight', 'Silver', 'Wild',
+              'Crimson', 'Lucky', 'Dueling', 'Hollow', 'Neon', 'Painted', 'Broken', 'Humble',
+              'Copper', 'Lonesome', 'Smoky', 'Little']
+VENUE_NOUNS = ['Room', 'Lounge', 'Hall', 'Garage', 'Basement', 'Theatre', 'Tavern', 'Club',
+               'Stage', 'Warehouse', 'Pianos Bar', 'Music & Coffee', 'Ballroom', 'Cellar']
+ARTIST_NOUNS = ['Petals', 'Foxes', 'Machines', 'Sax Band', 'Collective', 'Tigers', 'Ghosts',
+                'Rivers', 'Orchestra', 'Trio', 'Brothers', 'Static', 'Hearts', 'Satellites']
+FIRST_NAMES = ['Matt', 'Ana', 'Jo', 'Lena', 'Marcus', 'Priya', 'Sam', 'Nina', 'Theo', 'Ruth']
+LAST_NAMES = ['Quevedo', 'Holloway', 'Okafor', 'Lindqvist', 'Moreau', 'Tanaka', 'Reyes', 'Abbott']
+STREETS = ['Musical Hop', 'Folsom', 'Mission', 'Main', 'Broadway', 'Market', 'Canal', 'Frenchmen',
+           'Beale', 'Sunset', 'Division', 'Halsted', 'Peachtree', 'Colfax']
+STREET_TYPES = ['Street', 'Avenue', 'Boulevard', 'Way']
+DESCRIPTIONS = [
+    'We are on the lookout for a local artist to play every two weeks. Please call us.',
+    'Looking for shows to perform at in the area!',
+    'Open mic nights every Thursday, bands welcome.',
+]
+
+
+class DataGenerator(object):
+    '''Deterministic, realistic-looking venues, artists and shows.
+
+    Rows are plain dicts of column values, ready for executemany INSERTs.
+    The same seed always generates the same rows.
+    '''
+
+    def __init__(self, seed=0, genres=()):
+        self.random = random.Random(seed)
+        self.genres = list(genres)
+
+    def place(self):
+        city, state, latitude, longitude = self.random.choice(CITIES)
+        latitude += self.random.uniform(-0.15, 0.15)
+        longitude += self.random.uniform(-0.15, 0.15)
+        return city, state, latitude, longitude
+
+    def phone(self):
+        return '%03d-%03d-%04d' % (self.random.randint(200, 999), self.random.randint(200, 999),
+                                   self.random.randint(0, 9999))
+
+    def venue(self, number):
+        city, state, latitude, longitude = self.place()
+        name = 'The %s %s' % (self.random.choice(ADJECTIVES), self.random.choice(VENUE_NOUNS))
+        slug = 'venue%d' % number
+        seeking = self.random.random() < 0.3
+        return {
+            'name': name,
+            'city': city,
+            'state': state,
+            'address': '%d %s %s' % (self.random.randint(1, 9999), self.random.choice(STREETS),
+                                     self.random.choice(STREET_TYPES)),
+            'phone': self.phone(),
+            'image_link': 'https://picsum.photos/seed/%s/600/400' % slug,
+            'facebook_link': 'https://www.facebook.com/%s' % slug,
+            'website': 'https://www.%s.example.com' % slug,
+            'seeking_talent': seeking,
+            'seeking_description': self.random.choice(DESCRIPTIONS) if seeking else None,
+            'latitude': latitude,
+            'longitude': longitude,
+            'geohash': geo.encode(latitude, longitude),
+        }
+
+    def artist(self, number):
+        city, state, latitude, longitude = self.place()
+        if self.random.random() < 0.3:
+            name = '%s %s' % (self.random.choice(FIRST_NAMES), self.random.choice(LAST_NAMES))
+        else:
+            name = 'The %s %s' % (self.random.choice(ADJECTIVES), self.random.choice(ARTIST_NOUNS))
+        slug = 'artist%d' % number
+        seeking = self.random.random() < 0.4
+        return {
+            'name': name,
+            'city': city,
+            'state': state,
+            'phone': self.phone(),
+            'image_link': 'https://picsum.photos/seed/%s/600/400' % slug,
+            'facebook_link': 'https://www.facebook.com/%s' % slug,
+            'website': 'https://www.%s.example.com' % slug,
+            'seeking_venue': seeking,
+            'seeking_description': self.random.choice(DESCRIPTIONS) if seeking else None,
+        }
+
+    def genre_names(self):
+        return self.random.sample(self.genres, min(len(self.genres), self.random.randint(1, 3)))
+
+    def shows(self, venue_ids, artist_ids, count, middle, minutes, slots=4 * 365):
+        '''count shows spread over `slots` consecutive time slots centred on
+        middle, half of them in the past. No venue or artist is booked
+        twice in a slot, and slots do not overlap, so there are no double
+        bookings.'''
+        per_slot = max(1, min(len(venue_ids), len(artist_ids), math.ceil(count / slots)))
+        slot_length = timedelta(minutes=minutes + 60)
+        start = middle - slot_length * (math.ceil(count / per_slot) // 2)
+        start = start.replace(minute=0, second=0, microsecond=0)
+        duration = timedelta(minutes=minutes)
+        slot = 0
+        while count > 0:
+            venue_offset = self.random.randrange(len(venue_ids))
+            artist_offset = self.random.randrange(len(artist_ids))
+            start_time = start + slot_length * slot
+            for j in range(min(per_slot, count)):
+                yield {
+                    'venue_id': venue_ids[(venue_offset + j) % len(venue_ids)],
+                    'artist_id': artist_ids[(artist_offset + j) % len(artist_ids)],
+                    'start_time': start_time,
+                    'end_time': start_time + duration,
+                }
+            count -= per_slot
+            slot += 1
@@ -0,0 +1,207 @@
+import os
+import random
+import secrets
+import tempfile
+import time
+import zlib
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+from itsdangerous import BadSignature, Signer
+
+
+class CompactSerializer(object):
+    '''Flask's tagged JSON (tuples, bytes, Markup and datetimes survive the
+    round trip), zlib-compressed when that is smaller. Unlike pickle, data
+    read back from a shared store cannot run code.'''
+
+    def __init__(self):
+        self.json = TaggedJSONSerializer()
+
+    def dumps(self, data):
+        payload = self.json.dumps(data).encode('utf-8')
+        compressed = zlib.compress(payload)
+        if len(compressed) < len(payload):
+            return b'z' + compressed
+        return b'j' + payload
+
+    def loads(self, value):
+        kind, payload = value[:1], value[1:]
+        if kind == b'z':
+            payload = zlib.decompress(payload)
+        elif kind != b'j':
+            raise ValueError('Unknown session encoding %r' % kind)
+        return self.json.loads(payload.decode('utf-8'))
+
+
+class FileSystemSessionStore(object):
+    '''One file per session in a directory all workers of a host share.
+
+    A file starts with its expiry time. Writes go to a temporary file that
+    is renamed over the old one, so readers never see half a session. About
+    one write in prune_every also deletes the expired files.
+    '''
+
+    def __init__(self, directory, prune_every=1000):
+        self.directory = directory
+        self.prune_every = prune_every
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, sid):
+        return os.path.join(self.directory, sid)
+
+    def get(self, sid):
+        try:
+            with open(self._path(sid), 'rb') as f:
+                expires, value = f.read().split(b'\n', 1)
+        except (OSError, ValueError):
+            return None
+        if float(expires) < time.time():
+            self.delete(sid)
+            return None
+        return value
+
+    def set(self, sid, value, ttl):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(b'%d\n' % (time.time() + ttl))
+                f.write(value)
+            os.replace(tmp, self._path(sid))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        if random.random() * self.prune_every < 1:
+            self.prune()
+
+    def delete(self, sid):
+        try:
+            os.unlink(self._path(sid))
+        except OSError:
+            pass
+
+    def prune(self):
+        '''Delete expired sessions; returns how many.'''
+        pruned = 0
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith('.'):
+                continue
+            try:
+                with open(entry.path, 'rb') as f:
+                    expired = float(f.readline()) < now
+            except (OSError, ValueError):
+                continue
+            if expired:
+                self.delete(entry.name)
+                pruned += 1
+        return pruned
+
+
+class RedisSessionStore(object):
+    '''Sessions in Redis, shared by every worker on every node. Needs the
+    optional redis package.'''
+
+    def __init__(self, url, prefix='fyyur:session:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('SESSION_TYPE redis needs the redis package: pip install redis')
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, sid):
+        return self.client.get(self.prefix + sid)
+
+    def set(self, sid, value, ttl):
+        self.client.setex(self.prefix + sid, ttl, value)
+
+    def delete(self, sid):
+        self.client.delete(self.prefix + sid)
+
+
+class ServerSession(SecureCookieSession):
+    def __init__(self, initial=None, sid=None):
+        super(ServerSession, self).__init__(initial)
+        self.sid = sid
+
+
+class ServerSideSessionInterface(SessionInterface):
+    '''Keeps session data in a store; the cookie only carries the session's
+    random id, signed with SECRET_KEY.
+
+    Stored sessions expire after PERMANENT_SESSION_LIFETIME. Like the
+    default cookie sessions, nothing is stored or sent for a request that
+    leaves its session empty.
+    '''
+
+    serializer = CompactSerializer()
+    salt = 'fyyur-session-id'
+
+    def __init__(self, store):
+        self.store = store
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt=self.salt)
+
+    def open_session(self, app, request):
+        if not app.secret_key:
+            return None
+        cookie = request.cookies.get(app.session_cookie_name)
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode('ascii')
+            except (BadSignature, UnicodeDecodeError):
+                sid = None
+            value = self.store.get(sid) if sid else None
+            if value is not None:
+                try:
+                    return ServerSession(self.serializer.loads(value), sid=sid)
+                except (ValueError, zlib.error):
+                    pass
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified:
+                if session.sid:
+                    self.store.delete(session.sid)
+                response.delete_cookie(app.session_cookie_name, domain=domain, path=path)
+            return
+
+        if session.accessed:
+            response.vary.add('Cookie')
+        if not self.should_set_cookie(app, session):
+            return
+
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+        ttl = int(app.permanent_session_lifetime.total_seconds())
+        self.store.set(session.sid, self.serializer.dumps(dict(session)), ttl)
+        response.set_cookie(
+            app.session_cookie_name,
+            self._signer(app).sign(session.sid).decode('ascii'),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def make_session_interface(config):
+    '''None for SESSION_TYPE cookie, Flask's default signed cookie sessions.'''
+    session_type = config.get('SESSION_TYPE', 'cookie')
+    if session_type == 'cookie':
+        return None
+    if session_type == 'filesystem':
+        store = FileSystemSessionStore(config['SESSION_FILE_DIR'])
+    elif session_type == 'redis':
+        store = RedisSessionStore(config['SESSION_REDIS_URL'])
+    else:
+        raise ValueError('Unknown SESSION_TYPE %r' % session_type)
+    return ServerSideSessionInterface(store)
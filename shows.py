@@ -0,0 +1,87 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+from flask import Blueprint, render_template, request, Response, flash, stream_with_context, current_app
+from sqlalchemy.exc import SQLAlchemyError
+from app import db, Show, async_db, cached_page, after_commit, stream_template
+from app import SHOW_LIST_PAGE_SIZE, show_data, show_listing, show_page, show_values
+from app import schedule_conflicts, missing_show_parties, flash_form_errors
+
+#----------------------------------------------------------------------------#
+# Controllers.
+#----------------------------------------------------------------------------#
+
+# Show pages; create_app() registers them.
+shows_bp = Blueprint('shows', __name__)
+
+#  Shows
+#  ----------------------------------------------------------------
+
+@shows_bp.route('/shows')
+@cached_page('shows')
+def shows():
+  # displays list of shows at /shows, ordered by (start_time, id).
+  # Pages are keyset paginated: ?after=<cursor> continues after the last show
+  # of the previous page. ?stream=1 streams every show from the cursor on.
+  after = request.args.get('after')
+  if request.args.get('stream', type=int):
+    data = (show_data(row) for row in show_listing(after).yield_per(1000))
+    return Response(stream_with_context(stream_template('pages/shows.html', shows=data)))
+
+  rows, next_cursor = show_page(after, SHOW_LIST_PAGE_SIZE)
+  data = [show_data(row) for row in rows]
+  return render_template('pages/shows.html', shows=data, next_cursor=next_cursor)
+
+@shows_bp.route('/shows/create')
+def create_shows():
+  # renders form. do not touch.
+  from forms import ShowForm
+  form = ShowForm()
+  return render_template('forms/new_show.html', form=form)
+
+@shows_bp.route('/shows/create', methods=['POST'])
+def create_show_submission():
+  # called to create new shows in the db, upon submitting new show listing form
+  from forms import ShowForm
+  form = ShowForm()
+  if not form.validate():
+    flash_form_errors(form)
+    return render_template('forms/new_show.html', form=form)
+
+  values = show_values(form)
+  conflicts = missing_show_parties(values) or schedule_conflicts([values]).get(0)
+  if conflicts:
+    for conflict in conflicts:
+      flash(conflict)
+    return render_template('forms/new_show.html', form=form)
+
+  show = Show(**values)
+  try:
+    db.session.add(show)
+    after_commit('invalidate_show', key='invalidate_show:%d:%d' % (show.venue_id, show.artist_id),
+      venue_id=show.venue_id, artist_id=show.artist_id)
+    db.session.commit()
+  except SQLAlchemyError:
+    db.session.rollback()
+    current_app.logger.exception('Could not create show')
+    flash('An error occurred. Show could not be listed.')
+    return render_template('pages/home.html')
+
+  # on successful db insert, flash success
+  flash('Show was successfully listed!')
+  return render_template('pages/home.html')
+
+#  Async views
+#  ----------------------------------------------------------------
+# Serves shows when ASYNC_VIEWS is set, see init_async_views().
+
+@cached_page('shows')
+async def shows_async():
+  if request.args.get('stream', type=int):
+    # Streaming reads rows as the response is sent, which needs the sync session.
+    return shows()
+  after = request.args.get('after')
+  rows, next_cursor = await async_db.run(lambda session: show_page(after, SHOW_LIST_PAGE_SIZE, session))
+  data = [show_data(row) for row in rows]
+  return render_template('pages/shows.html', shows=data, next_cursor=next_cursor)
@@ -2,3 +2,74 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// Delete buttons send a DELETE to their data-delete-url and follow the
+// redirect the server answers with.
+document.addEventListener('click', function (event) {
+  var button = event.target.closest ? event.target.closest('[data-delete-url]') : null;
+  if (!button || !window.confirm(button.getAttribute('data-confirm'))) {
+    return;
+  }
+  button.disabled = true;
+  fetch(button.getAttribute('data-delete-url'), {method: 'DELETE'})
+    .then(function (response) { return response.json(); })
+    .then(function (result) {
+      if (result.success) {
+        window.location = result.redirect;
+      } else {
+        button.disabled = false;
+        window.alert(result.error);
+      }
+    })
+    .catch(function () {
+      button.disabled = false;
+      window.alert('Could not delete.');
+    });
+});
+
+// Typeahead inputs list the matches for what has been typed in their
+// datalist and, once one is picked, copy its id into the field named by
+// data-typeahead-for. They are set up once the document is parsed, so this
+// works wherever the script is included.
+function setUpTypeaheads() {
+  Array.prototype.forEach.call(document.querySelectorAll('[data-typeahead]'), function (input) {
+    var target = document.getElementById(input.getAttribute('data-typeahead-for'));
+    var options = document.getElementById(input.getAttribute('list'));
+    var ids = {};
+    var timer = null;
+    input.addEventListener('input', function () {
+      if (ids[input.value]) {
+        target.value = ids[input.value];
+        return;
+      }
+      clearTimeout(timer);
+      timer = setTimeout(function () {
+        var query = input.value;
+        if (!query.trim()) {
+          return;
+        }
+        fetch(input.getAttribute('data-typeahead') + '?q=' + encodeURIComponent(query))
+          .then(function (response) { return response.json(); })
+          .then(function (result) {
+            if (input.value !== query) {
+              return;
+            }
+            ids = {};
+            options.innerHTML = '';
+            result.data.forEach(function (item) {
+              var option = document.createElement('option');
+              option.value = item.name + ' (' + item.city + ', ' + item.state + ') #' + item.id;
+              ids[option.value] = item.id;
+              options.appendChild(option);
+            });
+          });
+      }, 100);
+    });
+  });
+}
+
+if (document.readyState === 'loading') {
+  document.addEventListener('DOMContentLoaded', setUpTypeaheads);
+} else {
+  setUpTypeaheads();
+}
@@ -0,0 +1,80 @@
+'''The async variants of the detail pages and /shows, served with
+ASYNC_VIEWS through aiosqlite.'''
+
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+import config
+from app import create_app, db, Venue, Artist, Show
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # init_async_views() reads both when the app is built.
+    monkeypatch.setattr(config.TestingConfig, 'ASYNC_VIEWS', True)
+    monkeypatch.setattr(config.TestingConfig, 'SQLALCHEMY_DATABASE_URI',
+                        'sqlite:///%s' % (tmp_path / 'fyyur.db'))
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def rows(app):
+    venue = Venue(name='The Async Hall', city='San Francisco', state='CA')
+    artist = Artist(name='The Coroutines', city='San Francisco', state='CA')
+    db.session.add_all([venue, artist])
+    db.session.flush()
+    now = datetime.now()
+    db.session.add_all([
+        Show(venue_id=venue.id, artist_id=artist.id, start_time=now + timedelta(days=3)),
+        Show(venue_id=venue.id, artist_id=artist.id, start_time=now - timedelta(days=3)),
+    ])
+    db.session.commit()
+    return {'venue': venue.id, 'artist': artist.id}
+
+
+def test_async_views_replace_the_sync_ones(app):
+    assert app.extensions['async_db'].engine.url.drivername == 'sqlite+aiosqlite'
+    for endpoint in ('venues.show_venue', 'artists.show_artist', 'shows.shows'):
+        assert app.view_functions[endpoint].__name__.endswith('_async')
+
+
+def test_detail_pages(app, rows):
+    client = app.test_client()
+    venue_page = client.get('/venues/%d' % rows['venue'])
+    assert venue_page.status_code == 200
+    assert b'The Async Hall' in venue_page.data
+    assert b'The Coroutines' in venue_page.data
+    artist_page = client.get('/artists/%d' % rows['artist'])
+    assert artist_page.status_code == 200
+    assert b'The Async Hall' in artist_page.data
+    assert client.get('/venues/%d' % (rows['venue'] + 1)).status_code == 404
+
+
+def test_shows(app, rows):
+    page = app.test_client().get('/shows')
+    assert page.status_code == 200
+    assert page.data.count(b'The Coroutines') >= 2
+
+
+def test_concurrent_first_requests(app, rows):
+    # Each async view runs in an event loop of its own; the first requests
+    # to a new app must not trip over each other. Daemon threads, so a
+    # deadlock fails the test instead of hanging it.
+    statuses = []
+
+    def get():
+        statuses.append(app.test_client().get('/venues/%d' % rows['venue']).status_code)
+
+    threads = [threading.Thread(target=get, daemon=True) for i in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    assert statuses == [200] * 16
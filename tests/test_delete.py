@@ -0,0 +1,146 @@
+'''Deleting venues and artists: the set-based deletes, the shows removed by
+ON DELETE CASCADE, the counters of the other side and the pages that must
+stop listing the deleted rows.'''
+
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import create_app, db, Venue, Artist, Show, delete_entities, check_counters
+from app import search_indexes, typeahead_indexes
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app('testing')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///%s' % (tmp_path / 'fyyur.db')
+    # The name indexes live in the process; start each test with empty ones.
+    for indexes in (search_indexes, typeahead_indexes):
+        for model, index in indexes.items():
+            indexes[model] = type(index)()
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def rows(app):
+    '''Two venues and two artists; each venue has an upcoming and a past
+    show with each artist.'''
+    venues = [Venue(name='Hall %s' % name, city='San Francisco', state='CA') for name in 'AB']
+    artists = [Artist(name='Band %s' % name, city='San Francisco', state='CA') for name in 'AB']
+    db.session.add_all(venues + artists)
+    db.session.flush()
+    now = datetime.now()
+    hours = iter(range(1, 100))
+    for venue in venues:
+        for artist in artists:
+            for sign in (1, -1):
+                db.session.add(Show(venue_id=venue.id, artist_id=artist.id,
+                                    start_time=now + sign * timedelta(days=30, hours=next(hours))))
+    db.session.commit()
+    return {'venues': [venue.id for venue in venues], 'artists': [artist.id for artist in artists]}
+
+
+def counters(model, entity_id):
+    entity = db.session.get(model, entity_id)
+    return entity.upcoming_shows_count, entity.past_shows_count
+
+
+def test_rows_start_counted(rows):
+    assert check_counters() == 0
+    assert counters(Venue, rows['venues'][0]) == (2, 2)
+    assert counters(Artist, rows['artists'][0]) == (2, 2)
+
+
+def test_delete_venue_removes_its_shows(rows):
+    venue_id, other_id = rows['venues']
+    assert delete_entities(Venue, [venue_id]) == 1
+    assert db.session.get(Venue, venue_id) is None
+    assert Show.query.filter_by(venue_id=venue_id).count() == 0
+    assert Show.query.filter_by(venue_id=other_id).count() == 4
+
+
+def test_delete_venue_adjusts_artist_counters(rows):
+    delete_entities(Venue, rows['venues'][:1])
+    db.session.expire_all()
+    for artist_id in rows['artists']:
+        assert counters(Artist, artist_id) == (1, 1)
+    assert check_counters() == 0
+
+
+def test_delete_artist_adjusts_venue_counters(rows):
+    delete_entities(Artist, rows['artists'][:1])
+    db.session.expire_all()
+    assert Show.query.filter_by(artist_id=rows['artists'][0]).count() == 0
+    for venue_id in rows['venues']:
+        assert counters(Venue, venue_id) == (1, 1)
+    assert check_counters() == 0
+
+
+def test_delete_many_at_once(rows):
+    missing = max(rows['venues']) + 1
+    assert delete_entities(Venue, rows['venues'] + rows['venues'] + [missing]) == 2
+    assert Venue.query.count() == 0
+    assert Show.query.count() == 0
+    db.session.expire_all()
+    for artist_id in rows['artists']:
+        assert counters(Artist, artist_id) == (0, 0)
+    assert check_counters() == 0
+
+
+def test_delete_command(app, rows, tmp_path):
+    ids_file = tmp_path / 'ids'
+    ids_file.write_text('%d\n' % rows['artists'][1])
+    result = app.test_cli_runner().invoke(
+        args=['delete', 'artists', str(rows['artists'][0]), '--ids-file', str(ids_file)])
+    assert result.exit_code == 0, result.output
+    assert '2 artists deleted' in result.output
+    assert Artist.query.count() == 0
+    assert Show.query.count() == 0
+    assert check_counters() == 0
+
+
+@pytest.mark.parametrize('kind,model', [('venues', Venue), ('artists', Artist)])
+def test_delete_button(client, rows, kind, model):
+    entity_id = rows[kind][0]
+    response = client.delete('/%s/%d' % (kind, entity_id))
+    assert response.status_code == 200
+    assert json.loads(response.data)['success']
+    assert db.session.get(model, entity_id) is None
+    assert client.delete('/%s/%d' % (kind, entity_id)).status_code == 404
+
+
+@pytest.mark.parametrize('kind,model', [('venues', Venue), ('artists', Artist)])
+def test_pages_drop_deleted_rows(client, rows, kind, model):
+    deleted, kept = [db.session.get(model, entity_id).name for entity_id in rows[kind]]
+    # Part of the name, so that the search pages repeating the term do not
+    # count as listing the row.
+    term = deleted[1:]
+    search = lambda: client.post('/%s/search' % kind, data={'search_term': term})
+    # Searching first builds the name indexes, so the delete has to update them.
+    assert deleted.encode() in search().data
+    client.delete('/%s/%d' % (kind, rows[kind][0]))
+
+    pages = [
+        client.get('/%s' % kind),
+        client.get('/shows'),
+        search(),
+        client.get('/api/v1/%s' % kind),
+        client.get('/api/v1/%s/search?search_term=%s' % (kind, term)),
+        client.get('/api/v1/%s/typeahead?q=%s' % (kind, deleted[:4])),
+    ]
+    for page in pages:
+        assert page.status_code == 200
+        assert deleted.encode() not in page.data
+    assert kept.encode() in pages[0].data
+    assert client.get('/%s/%d' % (kind, rows[kind][0])).status_code == 404
+    assert client.get('/api/v1/%s/%d' % (kind, rows[kind][0])).status_code == 404
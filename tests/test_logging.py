@@ -0,0 +1,32 @@
+'''Where the app log goes outside debug mode.'''
+
+import logging
+
+import config
+from app import create_app
+
+
+def file_handlers(app):
+    return [handler for handler in app.logger.handlers if isinstance(handler, logging.FileHandler)]
+
+
+def test_testing_writes_no_log_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    app = create_app('testing')
+    assert file_handlers(app) == []
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_log_file_setting(tmp_path, monkeypatch):
+    log_file = tmp_path / 'fyyur.log'
+    monkeypatch.setattr(config.TestingConfig, 'LOG_FILE', str(log_file))
+    app = create_app('testing')
+    handlers = file_handlers(app)
+    try:
+        assert [handler.baseFilename for handler in handlers] == [str(log_file)]
+        assert 'errors' in log_file.read_text()
+    finally:
+        # Every app built logs through the same logger.
+        for handler in handlers:
+            app.logger.removeHandler(handler)
+            handler.close()
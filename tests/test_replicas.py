@@ -0,0 +1,93 @@
+'''Read replica routing, with two SQLite files standing in for the primary
+and its replica. They hold different venues, so each page shows which one
+it was read from.'''
+
+import pytest
+from flask import g
+from sqlalchemy import text
+
+import config
+from app import create_app, db, Venue
+from app import search_indexes, typeahead_indexes
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(config.TestingConfig, 'SQLALCHEMY_DATABASE_URI',
+                        'sqlite:///%s' % (tmp_path / 'primary.db'))
+    monkeypatch.setattr(config.TestingConfig, 'SQLALCHEMY_BINDS',
+                        {'replica1': 'sqlite:///%s' % (tmp_path / 'replica.db')})
+    monkeypatch.setattr(config.TestingConfig, 'DB_REPLICA_BINDS', ['replica1'])
+    # The name indexes live in the process; start each test with empty ones.
+    for indexes in (search_indexes, typeahead_indexes):
+        for model, index in indexes.items():
+            indexes[model] = type(index)()
+    app = create_app('testing')
+    with app.app_context():
+        for bind, name in ((None, 'Primary Hall'), ('replica1', 'Replica Hall')):
+            engine = db.get_engine(app, bind=bind)
+            db.Model.metadata.create_all(engine)
+            with engine.begin() as connection:
+                connection.execute(Venue.__table__.insert(),
+                                   {'name': name, 'city': 'San Francisco', 'state': 'CA'})
+        yield app
+        db.session.remove()
+
+
+def venue_names(app, bind=None):
+    with db.get_engine(app, bind=bind).connect() as connection:
+        return sorted(name for name, in connection.execute(text('SELECT name FROM "Venue"')))
+
+
+NEW_VENUE = {
+    'name': 'New Hall',
+    'city': 'San Francisco',
+    'state': 'CA',
+    'address': '1 Market Street',
+    'phone': '415-555-0100',
+    'genres': 'Jazz',
+    'facebook_link': 'https://www.facebook.com/newhall',
+}
+
+
+def test_gets_read_from_the_replica(app):
+    client = app.test_client()
+    for url in ('/venues', '/venues/1', '/api/v1/venues'):
+        page = client.get(url)
+        assert page.status_code == 200
+        assert b'Replica Hall' in page.data
+        assert b'Primary Hall' not in page.data
+
+
+def test_search_posts_read_from_the_replica(app):
+    page = app.test_client().post('/venues/search', data={'search_term': 'Hall'})
+    assert b'Replica Hall' in page.data
+    assert b'Primary Hall' not in page.data
+
+
+def test_writes_go_to_the_primary(app):
+    app.test_client().post('/venues/create', data=NEW_VENUE)
+    assert venue_names(app) == ['New Hall', 'Primary Hall']
+    assert venue_names(app, 'replica1') == ['Replica Hall']
+
+
+def test_flushes_during_a_read_go_to_the_primary(app):
+    with app.test_request_context('/venues'):
+        g.db_bind = 'replica1'
+        assert [venue.name for venue in Venue.query] == ['Replica Hall']
+        db.session.add(Venue(name='Flushed Hall', city='San Francisco', state='CA'))
+        db.session.commit()
+    assert venue_names(app) == ['Flushed Hall', 'Primary Hall']
+    assert venue_names(app, 'replica1') == ['Replica Hall']
+
+
+def test_writer_reads_from_the_primary_for_a_while(app):
+    writer, other = app.test_client(), app.test_client()
+    writer.post('/venues/create', data=NEW_VENUE)
+    page = writer.get('/venues').data
+    assert b'New Hall' in page and b'Primary Hall' in page
+    assert b'Replica Hall' in other.get('/venues').data
+
+    app.config['DB_REPLICA_STICKY_SECONDS'] = 0
+    writer.post('/venues/create', data=dict(NEW_VENUE, name='Newer Hall'))
+    assert b'Replica Hall' in writer.get('/venues').data
@@ -0,0 +1,67 @@
+'''Detail pages of venues and artists whose past shows are partly in
+ShowArchive: the pages list them all, in two queries.'''
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import create_app, db, Venue, Artist, Show, ShowArchive, SHOWS_PAGE_SIZE
+from app import archive_shows, load_with_shows
+from bench import StatementCounter
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app('testing')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///%s' % (tmp_path / 'fyyur.db')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def rows(app):
+    '''A venue and an artist with 3 upcoming and 30 past shows, a page and
+    a half; the 20 oldest are archived.'''
+    venue = Venue(name='The Old Hall', city='San Francisco', state='CA')
+    artist = Artist(name='The Veterans', city='San Francisco', state='CA')
+    db.session.add_all([venue, artist])
+    db.session.flush()
+    now = datetime.now()
+    db.session.add_all([Show(venue_id=venue.id, artist_id=artist.id, start_time=now + timedelta(days=day))
+                        for day in list(range(1, 4)) + list(range(-30, 0))])
+    db.session.commit()
+    assert archive_shows(now - timedelta(days=10, hours=12)) == 20
+    return {'venue': venue.id, 'artist': artist.id}
+
+
+@pytest.mark.parametrize('model,show_fk,related', [
+    (Venue, Show.venue_id, Show.artist),
+    (Artist, Show.artist_id, Show.venue),
+])
+def test_pages_read_both_tables_in_two_queries(app, rows, model, show_fk, related):
+    entity_id = rows[model.__tablename__.lower()]
+    pages = []
+    for past_page in (1, 2):
+        with app.test_request_context(), StatementCounter() as statements:
+            pages.append(load_with_shows(model, show_fk, related, entity_id, past_page))
+        assert statements.count == 2
+    first, second = pages
+    assert first['upcoming_shows_count'] == 3 and first['past_shows_count'] == 30
+    assert len(first['upcoming_shows']) == 3
+    assert len(first['past_shows']) == SHOWS_PAGE_SIZE and len(second['past_shows']) == 10
+    past = first['past_shows'] + second['past_shows']
+    assert [show.start_time for show in past] == sorted((show.start_time for show in past), reverse=True)
+    assert [isinstance(show, ShowArchive) for show in past] == [False] * 10 + [True] * 20
+    assert all(getattr(show, related.key).id for show in past)
+
+
+def test_detail_page_lists_archived_shows(app, rows):
+    client = app.test_client()
+    first = client.get('/venues/%d' % rows['venue'])
+    second = client.get('/venues/%d?past_page=2' % rows['venue'])
+    assert first.status_code == second.status_code == 200
+    assert first.data.count(b'The Veterans') == 3 + SHOWS_PAGE_SIZE
+    assert second.data.count(b'The Veterans') == 3 + 10
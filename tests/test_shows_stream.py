@@ -0,0 +1,49 @@
+'''The streamed /shows listing and the template fragment cache.'''
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import create_app, db, Venue, Artist, Show
+from cache import LRUCache, PageCache
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app('testing')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///%s' % (tmp_path / 'fyyur.db')
+    # Testing runs without caches; this test is about the fragment cache.
+    app.jinja_env.fragment_cache = PageCache(LRUCache(1000, 3600))
+    with app.app_context():
+        db.create_all()
+        venue = Venue(name='The Long Hall', city='San Francisco', state='CA')
+        artist = Artist(name='The Streamers', city='San Francisco', state='CA')
+        db.session.add_all([venue, artist])
+        db.session.flush()
+        start = datetime.now() + timedelta(days=1)
+        db.session.add_all([Show(venue_id=venue.id, artist_id=artist.id,
+                                 start_time=start + timedelta(hours=3 * i)) for i in range(30)])
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def test_stream_stores_no_fragments(app):
+    client = app.test_client()
+    page = client.get('/shows?stream=1')
+    assert page.status_code == 200
+    assert page.data.count(b'The Streamers') == 30
+    fragments = app.jinja_env.fragment_cache
+    hits = fragments.hits
+    client.get('/shows')
+    assert fragments.hits == hits
+
+
+def test_stream_uses_stored_fragments(app):
+    client = app.test_client()
+    client.get('/shows')
+    fragments = app.jinja_env.fragment_cache
+    hits = fragments.hits
+    assert client.get('/shows?stream=1').data.count(b'The Streamers') == 30
+    assert fragments.hits - hits == 30
@@ -0,0 +1,157 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import itertools
+from flask import Blueprint, render_template, request, flash, redirect, url_for, current_app
+from sqlalchemy.exc import SQLAlchemyError
+from app import db, Genre, Venue, Show, venue_genres, cached_page, after_commit, delete_submission
+from app import venue_data, venue_detail, venue_form_data, venue_values, with_genres, update_from_form
+from app import search_by_name, search_paging, flash_form_errors, load_with_shows_async
+
+#----------------------------------------------------------------------------#
+# Controllers.
+#----------------------------------------------------------------------------#
+
+# Venue pages; create_app() registers them.
+venues_bp = Blueprint('venues', __name__)
+
+#  Venues
+#  ----------------------------------------------------------------
+
+def venue_areas(genre=None, state=None):
+  # One query; upcoming show counts are read from the venue counters.
+  query = db.session.query(
+      Venue.city,
+      Venue.state,
+      Venue.id,
+      Venue.name,
+      Venue.upcoming_shows_count,
+      Venue.updated_at,
+    )
+  if genre:
+    query = query.join(venue_genres, venue_genres.c.venue_id == Venue.id) \
+      .join(Genre, Genre.id == venue_genres.c.genre_id) \
+      .filter(Genre.name == genre)
+  if state:
+    query = query.filter(Venue.state == state)
+  rows = query.order_by(Venue.state, Venue.city, Venue.name).yield_per(1000)
+
+  areas = []
+  for (area_city, area_state), group in itertools.groupby(rows, key=lambda row: (row.city, row.state)):
+    group = list(group)
+    areas.append({
+      "city": area_city,
+      "state": area_state,
+      "updated_at": max(row.updated_at for row in group),
+      "venues": [{
+        "id": row.id,
+        "name": row.name,
+        "num_upcoming_shows": row.upcoming_shows_count,
+      } for row in group]
+    })
+  return areas
+
+@venues_bp.route('/venues')
+@cached_page('venues')
+def venues():
+  return render_template('pages/venues.html', areas=venue_areas());
+
+@venues_bp.route('/venues/filter')
+def filter_venues():
+  # venues by genre and/or state, e.g. /venues/filter?genre=Jazz&state=CA
+  data = venue_areas(genre=request.args.get('genre'), state=request.args.get('state'))
+  return render_template('pages/venues.html', areas=data)
+
+@venues_bp.route('/venues/search', methods=['POST'])
+def search_venues():
+  # case-insensitive partial match on the venue name, ranked best match first.
+  # seach for Hop should return "The Musical Hop".
+  # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
+  search_term = request.form.get('search_term', '')
+  limit, offset = search_paging(request.form)
+  response = search_by_name(Venue, search_term, limit=limit, offset=offset)
+  return render_template('pages/search_venues.html', results=response, search_term=search_term)
+
+@venues_bp.route('/venues/<int:venue_id>')
+@cached_page('venue:{venue_id}')
+def show_venue(venue_id):
+  # shows the venue page with the given venue_id
+  data = venue_detail(venue_id, past_page=max(request.args.get('past_page', 1, type=int), 1))
+  return render_template('pages/show_venue.html', venue=data)
+
+#  Create Venue
+#  ----------------------------------------------------------------
+
+@venues_bp.route('/venues/create', methods=['GET'])
+def create_venue_form():
+  from forms import VenueForm
+  form = VenueForm()
+  return render_template('forms/new_venue.html', form=form)
+
+@venues_bp.route('/venues/create', methods=['POST'])
+def create_venue_submission():
+  from forms import VenueForm
+  form = VenueForm()
+  if not form.validate():
+    flash_form_errors(form)
+    return render_template('forms/new_venue.html', form=form)
+
+  venue = Venue(**with_genres(venue_values(form)))
+  try:
+    db.session.add(venue)
+    after_commit('invalidate_pages', key='invalidate_pages:venues', keys=['venues'])
+    db.session.commit()
+  except SQLAlchemyError:
+    db.session.rollback()
+    current_app.logger.exception('Could not create venue')
+    flash('An error occurred. Venue ' + form.name.data + ' could not be listed.')
+    return render_template('pages/home.html')
+
+  # on successful db insert, flash success
+  flash('Venue ' + venue.name + ' was successfully listed!')
+  return render_template('pages/home.html')
+
+@venues_bp.route('/venues/<int:venue_id>', methods=['DELETE'])
+def delete_venue(venue_id):
+  return delete_submission(Venue, venue_id)
+
+#  Update
+#  ----------------------------------------------------------------
+@venues_bp.route('/venues/<int:venue_id>/edit', methods=['GET'])
+def edit_venue(venue_id):
+  from forms import VenueForm
+  venue = Venue.query.get_or_404(venue_id)
+  form = VenueForm(data=venue_form_data(venue))
+  return render_template('forms/edit_venue.html', form=form, venue=venue)
+
+@venues_bp.route('/venues/<int:venue_id>/edit', methods=['POST'])
+def edit_venue_submission(venue_id):
+  from forms import VenueForm
+  venue = Venue.query.get_or_404(venue_id)
+  form = VenueForm()
+  if not form.validate():
+    flash_form_errors(form)
+    return render_template('forms/edit_venue.html', form=form, venue=venue)
+
+  update_from_form(venue, with_genres(venue_values(form)))
+  after_commit('invalidate_venue', key='invalidate_venue:%d' % venue_id, venue_id=venue_id)
+  try:
+    db.session.commit()
+  except SQLAlchemyError:
+    db.session.rollback()
+    current_app.logger.exception('Could not update venue %d', venue_id)
+    flash('An error occurred. Venue ' + form.name.data + ' could not be updated.')
+    return render_template('forms/edit_venue.html', form=form, venue=venue)
+
+  return redirect(url_for('venues.show_venue', venue_id=venue_id))
+
+#  Async views
+#  ----------------------------------------------------------------
+# Serves show_venue when ASYNC_VIEWS is set, see init_async_views().
+
+@cached_page('venue:{venue_id}')
+async def show_venue_async(venue_id):
+  past_page = max(request.args.get('past_page', 1, type=int), 1)
+  data = venue_data(await load_with_shows_async(Venue, Show.venue_id, Show.artist, venue_id, past_page))
+  return render_template('pages/show_venue.html', venue=data)